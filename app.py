@@ -14,13 +14,22 @@ from urllib.parse import urlparse
 
 # Import existing modules
 from github_client import GitHubClient
+import http_session
 from core import (
     deduplicate_accounts, sort_priority, ensure_ws_path_field,
-    build_final_accounts, load_template, test_all_accounts
+    build_final_accounts, load_template, iter_test_results, ResultStream, parse_deadline,
+    parse_top_k, parse_circuit, account_fingerprint, history_entries, probe_cache_entries
 )
 from extractor import extract_accounts_from_config
+from concurrency import AdaptiveLimiter
+from distributed import get_worker_addresses
+from real_geolocation_tester import kill_xray_processes
+from utils import geo_cache_stats
 from converter import parse_link, inject_outbounds_to_template
-from database import save_github_config, get_github_config, save_test_session, get_latest_test_session
+from database import (
+    save_github_config, get_github_config, save_test_session, get_latest_test_session,
+    get_account_history, update_account_history, save_probe_results, get_cached_probe_results
+)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
@@ -34,11 +43,17 @@ session_data = {
     'final_config': None,
     'github_path': None,
     'github_sha': None,
-    'custom_servers': None  # Store custom servers untuk config generation
+    'custom_servers': None,  # Store custom servers untuk config generation
+    'test_run': None  # Run yang sedang jalan: loop, task stream, event cancel (untuk stop_testing)
 }
 
-MAX_CONCURRENT_TESTS = 5
+# Adaptive concurrency (AIMD): mulai dari INITIAL, naik/turun di antara MIN dan MAX
+INITIAL_CONCURRENT_TESTS = 5
+MIN_CONCURRENT_TESTS = 2
+MAX_CONCURRENT_TESTS = 64
 TEMPLATE_FILE = "template.json"
+HISTORY_BATCH_SIZE = 100  # hasil per write ke tabel account_history / probe_cache
+PROBE_CACHE_TTL = 600  # detik, hasil probe lebih muda dari ini dipakai ulang tanpa probe
 
 def fetch_vpn_links_from_url(url, url_type='auto'):
     """
@@ -50,7 +65,7 @@ def fetch_vpn_links_from_url(url, url_type='auto'):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=30)
+        response = http_session.get(url, headers=headers, timeout=30)
         response.raise_for_status()
         
         vpn_links = []
@@ -341,20 +356,45 @@ def add_links_and_test():
     return jsonify(response)
 
 @socketio.on('start_testing')
-def handle_start_testing():
+def handle_start_testing(data=None):
     print(f"🔍 DEBUG: start_testing received, accounts count: {len(session_data['all_accounts'])}")
     
+    # Optional run deadline (detik) dari client, fallback ke env TEST_DEADLINE
+    deadline = parse_deadline((data or {}).get('deadline') or os.getenv('TEST_DEADLINE'))
+    if deadline:
+        print(f"⏱️ Run deadline: {deadline:.0f}s")
+    # use_cache=False dari client memaksa semua akun di-probe ulang
+    use_cache = (data or {}).get('use_cache', True)
+    # Mode top-K: berhenti begitu tiap negara prioritas punya N akun yang bekerja
+    top_k = parse_top_k((data or {}).get('top_k') or os.getenv('TOP_K_PER_COUNTRY'))
+    if top_k:
+        print(f"🎯 Top-K mode: {top_k} working accounts per priority country")
+    # Circuit breaker per endpoint: open setelah N akun gagal connect, trial setelah X detik
+    circuit = parse_circuit(
+        (data or {}).get('circuit_threshold') or os.getenv('CIRCUIT_THRESHOLD'),
+        (data or {}).get('circuit_half_open_after') or os.getenv('CIRCUIT_HALF_OPEN_AFTER'),
+    )
+    
     if not session_data['all_accounts']:
         print("❌ DEBUG: No accounts found in session_data")
         emit('testing_error', {'message': 'No accounts to test'})
         return
     
+    if session_data['test_run']:
+        emit('testing_error', {'message': 'Testing already in progress, stop it first'})
+        return
+    
     print("✅ DEBUG: Starting testing process in backend...")
+    test_run = {'loop': None, 'task': None, 'cancelled': threading.Event()}
+    session_data['test_run'] = test_run
+    stop_updates = threading.Event()
     
     def run_tests():
         # Create a new event loop for this thread
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        test_run['loop'] = loop
+        update_thread = None
         
         try:
             # Initialize test results with better structure
@@ -390,7 +430,38 @@ def handle_start_testing():
             socketio.emit('testing_update', initial_data)
             
             # Create semaphore and run tests
-            semaphore = asyncio.Semaphore(MAX_CONCURRENT_TESTS)
+            semaphore = AdaptiveLimiter(
+                initial=INITIAL_CONCURRENT_TESTS,
+                min_limit=MIN_CONCURRENT_TESTS,
+                max_limit=MAX_CONCURRENT_TESTS,
+            )
+            
+            # Hasil final di-stream ke consumer (completed counter, config builder)
+            # Coordinator mode kalau PROBE_WORKERS diisi (lihat distributed.py)
+            # History tes sebelumnya: akun yang dulu sukses (ID/SG duluan) dites lebih dulu
+            fingerprints = [account_fingerprint(acc) for acc in session_data['all_accounts']]
+            history = get_account_history(fingerprints)
+            # Hasil probe yang masih fresh dipakai ulang, hanya akun stale yang di-probe
+            cached = get_cached_probe_results(fingerprints, PROBE_CACHE_TTL) if use_cache else {}
+            cached_count = sum(1 for fp in fingerprints if fp in cached)
+            # Progress per stage pipeline (reachability → verification), di-update in place
+            stages = {}
+            # Akun yang sudah mulai dites / selesai, urut kejadian (dari event stream, bukan
+            # scan live_results); list supaya aman dibaca thread emitter
+            active = []
+            active_seen = set()
+            
+            def mark_active(index):
+                if index not in active_seen:
+                    active_seen.add(index)
+                    active.append(index)
+            
+            stream = ResultStream(iter_test_results(
+                session_data['all_accounts'], semaphore, live_results,
+                probe_workers=get_worker_addresses(), deadline=deadline, history=history,
+                cached=cached, circuit=circuit, top_k=top_k, progress=stages,
+                on_start=mark_active
+            ))
             
             # Create a background task to emit updates
             def emit_periodic_updates():
@@ -398,20 +469,24 @@ def handle_start_testing():
                 import threading
                 
                 def update_loop():
-                    while True:
-                        time.sleep(1)  # Update every second
+                    # Update every second, berhenti saat run selesai / dibatalkan
+                    while not stop_updates.wait(1):
                         
-                        # Better status detection - exclude only WAIT status
-                        completed = len([res for res in live_results if res["Status"] not in ["WAIT", "🔄", "🔁"]])
+                        # Jumlah hasil final dari stream, tidak perlu scan live_results
+                        completed = stream.completed
                         
                         try:
                             # USER REQUEST: Progressive display - only send accounts that are being tested or completed
-                            active_results = [dict(res) for res in live_results if res["Status"] != "WAIT"]
+                            active_results = [dict(live_results[i]) for i in active[:]]
                             
                             data_to_send = {
                                 'results': active_results,  # Only active/completed accounts
                                 'total': len(live_results),
-                                'completed': completed
+                                'completed': completed,
+                                'cached': cached_count,
+                                'stages': stages,
+                                'geo_cache': geo_cache_stats(),
+                                'concurrency': semaphore.snapshot()
                             }
                             print(f"Emitting periodic update: {completed}/{len(live_results)} completed, {len(active_results)} active accounts")
                             socketio.emit('testing_update', data_to_send)
@@ -433,17 +508,53 @@ def handle_start_testing():
             
             # Main async function to run tests
             async def run_all_tests():
-                await test_all_accounts(session_data['all_accounts'], semaphore, live_results)
-                
                 # Count successful accounts (USER REQUEST: exclude dead accounts from final config)
-                successful_accounts = [res for res in live_results if res["Status"] == "✅"]
-                dead_accounts = [res for res in live_results if res["Status"] == "Dead"]
+                successful_accounts = []
+                dead_accounts = []
+                finished_results = stream.subscribe(lambda res: res["Status"] in ("✅", "Dead"))
+                
+                async def collect_finished():
+                    async for res in finished_results:
+                        (successful_accounts if res["Status"] == "✅" else dead_accounts).append(res)
                 
+                # DB writer: simpan history + probe cache per batch supaya tidak buka koneksi tiap hasil
+                # (sekalian menandai akun aktif untuk emitter)
+                history_results = stream.subscribe()
+                
+                def flush(batch):
+                    update_account_history(history_entries(res for res in batch if not res.get("Cached")))
+                    save_probe_results(probe_cache_entries(batch))
+                
+                async def write_history():
+                    batch = []
+                    async for res in history_results:
+                        mark_active(res["index"])
+                        batch.append(res)
+                        if len(batch) >= HISTORY_BATCH_SIZE:
+                            flush(batch)
+                            batch = []
+                    flush(batch)
+                
+                # stop_testing meng-cancel task stream: probe yang jalan ikut di-cancel,
+                # subscriber tetap menerima hasil yang sudah final (partial results)
+                stream_task = asyncio.ensure_future(stream.run())
+                test_run['task'] = stream_task
+                if test_run['cancelled'].is_set():
+                    stream_task.cancel()
+                outcomes = await asyncio.gather(stream_task, collect_finished(), write_history(),
+                                                return_exceptions=True)
+                for outcome in outcomes:
+                    if isinstance(outcome, Exception):
+                        raise outcome
+                cancelled = stream_task.cancelled()
+                
+                if cancelled:
+                    print(f"🛑 Testing cancelled after {stream.completed}/{len(live_results)} accounts")
                 print(f"📊 Testing completed: {len(successful_accounts)} successful, {len(dead_accounts)} dead")
                 if dead_accounts:
                     print(f"💀 Dead accounts excluded from final config: {len(dead_accounts)} accounts")
                     for dead in dead_accounts:
-                        print(f"   - {dead.get('VpnType', 'N/A')} account {dead.get('index', 'unknown')} (dead after 3 timeouts)")
+                        print(f"   - {dead.get('VpnType', 'N/A')} account {dead.get('index', 'unknown')} (dead: {dead.get('Error', 'timeout')})")
                 
                 # Sort by priority
                 successful_accounts.sort(key=sort_priority)
@@ -478,6 +589,15 @@ def handle_start_testing():
                             'error': str(e)
                         })
                 
+                # Akun yang belum selesai saat run dibatalkan, termasuk grup yang sedang
+                # diverifikasi (stage 1 sudah menulis ✅ ke live_results tapi hasil final
+                # tidak pernah keluar, jadi tidak masuk successful / config)
+                if cancelled:
+                    for res in live_results:
+                        if res["index"] not in stream.finished:
+                            res["Status"] = "Cancelled"
+                            res["TestType"] = "Run cancelled"
+                
                 # Force final status update to ensure all accounts show final state
                 print(f"Final status update: forcing all pending accounts to complete")
                 for res in live_results:
@@ -492,7 +612,11 @@ def handle_start_testing():
                 final_data = {
                     'results': [dict(res) for res in live_results],
                     'total': len(live_results),
-                    'completed': final_completed
+                    'completed': final_completed,
+                    'cached': cached_count,
+                    'stages': stages,
+                    'geo_cache': geo_cache_stats(),
+                    'concurrency': semaphore.snapshot()
                 }
                 print(f"Emitting final testing update: {final_completed}/{len(live_results)} completed")
                 socketio.emit('testing_update', final_data)
@@ -502,7 +626,8 @@ def handle_start_testing():
                     'results': live_results,
                     'successful': len(successful_accounts),
                     'total': len(live_results),
-                    'session_id': session_id
+                    'session_id': session_id,
+                    'cancelled': cancelled
                 })
             
             # Run the async test function
@@ -511,6 +636,13 @@ def handle_start_testing():
         except Exception as e:
             socketio.emit('testing_error', {'message': f'Testing failed: {str(e)}'})
         finally:
+            stop_updates.set()
+            if update_thread is not None:
+                update_thread.join(timeout=5)
+            # Verifikasi stage 2 yang di-cancel masih jalan di thread executor; tunggu selesai
+            # supaya callback-nya tidak jatuh ke loop yang sudah ditutup
+            loop.run_until_complete(loop.shutdown_default_executor())
+            session_data['test_run'] = None
             loop.close()
     
     # Start testing in a separate thread
@@ -518,6 +650,26 @@ def handle_start_testing():
     testing_thread.daemon = True
     testing_thread.start()
 
+@socketio.on('stop_testing')
+def handle_stop_testing(data=None):
+    test_run = session_data['test_run']
+    if not test_run:
+        emit('testing_error', {'message': 'No testing in progress'})
+        return
+    
+    print("🛑 DEBUG: stop_testing received, cancelling test run...")
+    test_run['cancelled'].set()
+    # Real geolocation (stage 2) jalan di thread executor: kill xray supaya curl cepat selesai
+    killed = kill_xray_processes()
+    if killed:
+        print(f"🛑 Killed {killed} xray processes")
+    if test_run['task'] is not None:
+        try:
+            test_run['loop'].call_soon_threadsafe(test_run['task'].cancel)
+        except RuntimeError:
+            pass  # Loop sudah ditutup, run baru saja selesai
+    emit('testing_stopping', {'message': 'Stopping tests, partial results will be kept'})
+
 @app.route('/api/generate-config', methods=['POST'])
 def generate_config():
     if not session_data['test_results']:
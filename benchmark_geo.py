@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: geo lookup berurutan dengan requests.get per call vs shared http_session (keep-alive)
+
+Server lokal meniru ip-api /json/<ip> (HTTP/1.1 keep-alive). Tiap koneksi baru diberi delay
+`--connect-delay` untuk mensimulasikan TCP + TLS handshake ke host remote; request di atas
+koneksi yang sudah ada tidak kena delay itu. requests.get membuka koneksi (dan Session) baru
+tiap call, GeoClient lewat http_session memakai ulang koneksi dari pool.
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import http_session
+from geoip import GeoCache, GeoClient, OfflineGeo, RateBucket, GEO_FIELDS
+
+def make_server(connect_delay: float):
+    stats = {"connections": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Header dan body ditulis terpisah: tanpa NODELAY keep-alive kena delayed ACK ~40ms
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            stats["connections"] += 1
+            time.sleep(connect_delay)
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            ip = self.path.split("/json/")[-1].split("?")[0]
+            body = json.dumps({"status": "success", "countryCode": "SG",
+                               "org": "Benchmark Org", "query": ip}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+def run_fresh(base_url: str, ips: list):
+    for ip in ips:
+        response = requests.get(f"{base_url}/json/{ip}?fields={GEO_FIELDS}", timeout=5)
+        response.json()
+
+def run_pooled(base_url: str, ips: list):
+    # Cache tanpa persist dan IP unik: setiap lookup benar-benar request HTTP
+    client = GeoClient(cache=GeoCache(persist=False), offline=OfflineGeo(""), base_url=base_url)
+    client.json_bucket = RateBucket(10 ** 9)  # rate limit ip-api tidak relevan untuk server lokal
+    for ip in ips:
+        client.lookup(ip)
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--connect-delay", type=float, default=0.02,
+                        help="detik per koneksi baru (simulasi handshake)")
+    args = parser.parse_args()
+
+    server, stats = make_server(args.connect_delay)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.lookups)]
+
+    print(f"🚀 {args.lookups} sequential geo lookups, connect delay {args.connect_delay * 1000:.0f}ms")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    run_fresh(base_url, ips)
+    fresh_time = time.perf_counter() - start
+    fresh_connections = stats["connections"]
+    print(f"requests.get (fresh):   {fresh_time:.2f}s, "
+          f"{fresh_time / args.lookups * 1000:.2f}ms/lookup, {fresh_connections} connections")
+
+    start = time.perf_counter()
+    client = run_pooled(base_url, ips)
+    pooled_time = time.perf_counter() - start
+    print(f"http_session (pooled):  {pooled_time:.2f}s, "
+          f"{pooled_time / args.lookups * 1000:.2f}ms/lookup, "
+          f"{stats['connections'] - fresh_connections} connections, {client.stats()}")
+
+    print("=" * 50)
+    print(f"📊 Speedup: {fresh_time / pooled_time:.1f}x per lookup")
+
+    http_session.close()
+    server.shutdown()
+    server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: blocking utils.is_alive vs async probe.tcp_probe di bawah semaphore yang sama
+
+Listener lokal dibuat "stalled" (accept queue penuh, tidak pernah accept) supaya
+connect menggantung sampai timeout, sama seperti akun mati di subscription besar.
+Dengan is_alive event loop freeze, jadi wall time ~ N x timeout.
+Dengan tcp_probe wall time turun kira-kira sebesar faktor concurrency.
+"""
+
+import argparse
+import asyncio
+import socket
+import time
+
+from utils import is_alive
+from probe import tcp_probe
+
+def make_stalled_listener():
+    """Listener dengan backlog penuh: SYN berikutnya di-drop oleh kernel."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+    fillers = []
+    # Isi accept queue sampai connect berikutnya tidak langsung berhasil
+    for _ in range(8):
+        filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        try:
+            filler.connect(("127.0.0.1", port))
+        except BlockingIOError:
+            pass
+        fillers.append(filler)
+    time.sleep(0.1)
+    return server, port, fillers
+
+async def run_blocking(targets, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(port):
+        async with semaphore:
+            return is_alive("127.0.0.1", port, timeout=timeout)
+
+    return await asyncio.gather(*(one(p) for p in targets))
+
+async def run_async(targets, concurrency, timeout):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(port):
+        async with semaphore:
+            return await tcp_probe("127.0.0.1", port, timeout=timeout)
+
+    return await asyncio.gather(*(one(p) for p in targets))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--listeners", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    args = parser.parse_args()
+
+    listeners = [make_stalled_listener() for _ in range(args.listeners)]
+    targets = [listeners[i % len(listeners)][1] for i in range(args.probes)]
+
+    print(f"🚀 {args.probes} probes, {args.listeners} stalled listeners, "
+          f"concurrency={args.concurrency}, timeout={args.timeout}s")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    blocking_results = asyncio.run(run_blocking(targets, args.concurrency, args.timeout))
+    blocking_time = time.perf_counter() - start
+    print(f"is_alive (blocking): {blocking_time:.2f}s, "
+          f"{sum(1 for ok, _ in blocking_results if ok)} reachable")
+
+    start = time.perf_counter()
+    async_results = asyncio.run(run_async(targets, args.concurrency, args.timeout))
+    async_time = time.perf_counter() - start
+    print(f"tcp_probe (async):   {async_time:.2f}s, "
+          f"{sum(1 for ok, _ in async_results if ok)} reachable")
+
+    print("=" * 50)
+    print(f"📊 Speedup: {blocking_time / async_time:.1f}x (target ~{args.concurrency}x)")
+
+    for server, _, fillers in listeners:
+        for filler in fillers:
+            filler.close()
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark: test_all_accounts single-process vs sharded (multi-process) untuk list akun besar
+
+Akun diarahkan ke port lokal yang tertutup di 127.x.y.z (tiap akun endpoint sendiri), jadi
+probe langsung refused dan yang diukur adalah overhead per akun di event loop (grouping,
+retry ladder, result dict, live_results). Di mode single-process semua itu mentok di satu
+core; sharded membagi akun ke `--workers` proses.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from core import test_all_accounts
+from utils import free_local_port
+
+def make_accounts(count: int, port: int) -> list:
+    return [{"type": "vless", "tag": f"bench-{i}", "uuid": "x",
+             "server": f"127.{i // 65025 % 255}.{i // 255 % 255}.{i % 255 + 1}", "server_port": port}
+            for i in range(count)]
+
+def run(accounts: list, workers: int, concurrency: int):
+    live_results = [{"index": i, "Status": "WAIT"} for i in range(len(accounts))]
+    start = time.perf_counter()
+    results = asyncio.run(test_all_accounts(accounts, asyncio.Semaphore(concurrency), live_results,
+                                            workers=workers, verify=False))
+    return time.perf_counter() - start, results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    accounts = make_accounts(args.accounts, free_local_port())
+    print(f"🚀 {args.accounts} accounts (refused ports), concurrency={args.concurrency}, "
+          f"workers={args.workers}")
+    print("=" * 50)
+
+    single_time, single_results = run(accounts, 1, args.concurrency)
+    print(f"single-process: {single_time:.2f}s, {len(single_results) / single_time:.0f} accounts/s")
+
+    sharded_time, sharded_results = run(accounts, args.workers, args.concurrency)
+    print(f"sharded x{args.workers}:    {sharded_time:.2f}s, "
+          f"{len(sharded_results) / sharded_time:.0f} accounts/s")
+
+    print("=" * 50)
+    print(f"📊 Speedup: {single_time / sharded_time:.1f}x (target ~{args.workers}x, minus spawn overhead)")
+
+if __name__ == "__main__":
+    main()
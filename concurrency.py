@@ -0,0 +1,254 @@
+"""
+Adaptive concurrency limiter (AIMD) untuk test_all_accounts
+Pengganti asyncio.Semaphore(MAX_CONCURRENT_TESTS) yang fixed:
+- Additive increase selama timeout ratio dan event-loop lag rendah
+- Multiplicative decrease kalau banyak probe timeout atau loop mulai lag
+"""
+
+import asyncio
+import time
+from collections import deque
+
+class AdaptiveLimiter:
+    """
+    Semaphore dengan limit yang berubah-ubah. Bisa dipakai seperti semaphore biasa:
+
+        async with limiter:
+            ...
+
+    Hasil probe dilaporkan lewat record(timed_out) supaya limit bisa menyesuaikan.
+    """
+
+    def __init__(self, initial: int = 5, min_limit: int = 2, max_limit: int = 64,
+                 window: int = 20, increase_step: int = 1, decrease_factor: float = 0.5,
+                 low_timeout_ratio: float = 0.1, high_timeout_ratio: float = 0.4,
+                 max_loop_lag: float = 0.2, lag_interval: float = 0.1,
+                 decrease_cooldown: float = 1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(initial, max_limit))
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.low_timeout_ratio = low_timeout_ratio
+        self.high_timeout_ratio = high_timeout_ratio
+        self.max_loop_lag = max_loop_lag
+        self.lag_interval = lag_interval
+        self.decrease_cooldown = decrease_cooldown
+
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self._samples = deque(maxlen=window)
+        self._since_adjust = 0
+        self._last_decrease = 0.0
+        self._saturated = False
+        self._condition = None
+        self._monitor_task = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Condition dibuat lazily supaya terikat ke event loop yang sedang jalan
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+    @property
+    def timeout_ratio(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(self._samples) / len(self._samples)
+
+    def record(self, timed_out: bool):
+        """Laporkan hasil satu probe (True kalau timeout)"""
+        self._samples.append(1 if timed_out else 0)
+        self._since_adjust += 1
+        if self._since_adjust >= max(1, self.limit // 2):
+            self._since_adjust = 0
+            self._adjust()
+
+    def _adjust(self):
+        old_limit = self.limit
+        if self.timeout_ratio > self.high_timeout_ratio or self.loop_lag > self.max_loop_lag:
+            # Cooldown supaya satu gelombang timeout tidak memotong limit berkali-kali
+            if time.monotonic() - self._last_decrease >= self.decrease_cooldown:
+                self._last_decrease = time.monotonic()
+                self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        elif (self.timeout_ratio <= self.low_timeout_ratio
+              and self.loop_lag <= self.max_loop_lag / 2
+              and self._saturated):
+            # Hanya naik kalau limit sempat terpakai penuh sejak adjust terakhir
+            self.limit = min(self.max_limit, self.limit + self.increase_step)
+        self._saturated = False
+
+        if self.limit != old_limit:
+            print(f"⚙️ Concurrency limit {old_limit} → {self.limit} "
+                  f"(timeout ratio {self.timeout_ratio:.2f}, loop lag {self.loop_lag * 1000:.0f}ms)")
+            if self.limit > old_limit and self._condition is not None:
+                asyncio.get_running_loop().create_task(self._wake(self.limit - old_limit))
+
+    async def _wake(self, count: int):
+        condition = self._get_condition()
+        async with condition:
+            condition.notify(count)
+
+    async def _monitor_loop_lag(self):
+        while True:
+            expected = time.perf_counter() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            # Exponential moving average supaya spike sesaat tidak langsung memotong limit
+            self.loop_lag = self.loop_lag * 0.7 + lag * 0.3
+            if self.loop_lag > self.max_loop_lag:
+                self._adjust()
+
+    def start(self):
+        """Mulai monitor event-loop lag (panggil dari dalam event loop)"""
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.get_running_loop().create_task(self._monitor_loop_lag())
+
+    async def stop(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+
+    def snapshot(self) -> dict:
+        """Status limiter untuk progress payload"""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "timeout_ratio": round(self.timeout_ratio, 2),
+            "loop_lag_ms": round(self.loop_lag * 1000),
+        }
+
+class RetryBudget:
+    """
+    Batas total retry per run (dibagi semua akun). Subscription yang sebagian besar
+    mati tidak boleh memakan waktu N x MAX_RETRIES x backoff: setelah budget habis,
+    akun yang gagal langsung ditandai Dead tanpa retry.
+    """
+
+    def __init__(self, total: int):
+        self.total = max(0, int(total))
+        self.spent = 0
+        self.denied = 0
+
+    @classmethod
+    def for_run(cls, probe_count: int, ratio: float = 0.5, minimum: int = 10):
+        """Budget proporsional dengan jumlah probe (endpoint unik) di run ini"""
+        return cls(max(minimum, int(probe_count * ratio)))
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.spent)
+
+    def try_spend(self) -> bool:
+        """Ambil satu retry dari budget, False kalau budget sudah habis"""
+        if self.spent >= self.total:
+            self.denied += 1
+            return False
+        self.spent += 1
+        return True
+
+    def snapshot(self) -> dict:
+        return {"total": self.total, "spent": self.spent, "denied": self.denied}
+
+# Default circuit breaker (env CIRCUIT_THRESHOLD / CIRCUIT_HALF_OPEN_AFTER di app.py / main.py)
+CIRCUIT_THRESHOLD = 3  # akun berbeda yang gagal connect sebelum circuit open
+CIRCUIT_HALF_OPEN_AFTER = 5.0  # detik sebelum satu trial probe boleh lewat
+
+class CircuitBreaker:
+    """
+    Circuit breaker per endpoint (key: ("ip", "ip:port") / ("host", "hostname:port")), dibagi semua
+    akun di satu run. Setelah `threshold` akun berbeda kena hard failure (koneksi TCP gagal)
+    key dibuka: akun lain ke endpoint itu langsung gagal "circuit-open" tanpa retry ladder.
+    Retry satu akun dihitung sekali, jadi akun yang gagal sendiri tidak membuka circuit grupnya.
+    Setelah `half_open_after` detik satu probe boleh lewat (half-open) untuk konfirmasi:
+    sukses menutup circuit lagi, gagal membuat circuit tetap open sampai run selesai.
+    """
+
+    def __init__(self, threshold: int = CIRCUIT_THRESHOLD,
+                 half_open_after: float = CIRCUIT_HALF_OPEN_AFTER):
+        self.threshold = max(1, int(threshold))
+        self.half_open_after = half_open_after
+        self.rejected = 0
+        self._failures = {}  # key -> set akun yang gagal
+        self._opened_at = {}
+        self._trial = {}  # key -> "running" / "used" (half-open hanya sekali)
+
+    def is_open(self, keys) -> bool:
+        return any(key in self._opened_at for key in keys)
+
+    def would_allow(self, keys) -> bool:
+        """Seperti allow() tapi tanpa mengambil izin trial (untuk cek sebelum antri slot)"""
+        now = time.monotonic()
+        return all(self._trial.get(key) is None and now - self._opened_at[key] >= self.half_open_after
+                   for key in keys if key in self._opened_at)
+
+    def allow(self, keys) -> bool:
+        """
+        True kalau probe boleh jalan. Key yang open dan sudah melewati half_open_after
+        memberi satu izin trial; selama trial berjalan request lain tetap ditolak.
+        """
+        opened = [key for key in keys if key in self._opened_at]
+        if not opened:
+            return True
+        if self.would_allow(opened):
+            for key in opened:
+                self._trial[key] = "running"
+                print(f"⚡ Circuit half-open for {key[0]} {key[1]}, sending one trial probe")
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self, keys):
+        for key in keys:
+            self._failures.pop(key, None)
+            if self._opened_at.pop(key, None) is not None:
+                print(f"⚡ Circuit closed for {key[0]} {key[1]}")
+            self._trial.pop(key, None)
+
+    def record_failure(self, keys, account=None):
+        """account: id akun yang gagal (mis. index); None = tiap panggilan dihitung terpisah"""
+        if account is None:
+            account = object()
+        for key in keys:
+            if self._trial.get(key) == "running":
+                # Trial half-open gagal: endpoint memang mati, tidak ada trial kedua
+                self._trial[key] = "used"
+                self._opened_at[key] = time.monotonic()
+                continue
+            failed = self._failures.setdefault(key, set())
+            failed.add(account)
+            if len(failed) >= self.threshold and key not in self._opened_at:
+                self._opened_at[key] = time.monotonic()
+                print(f"⚡ Circuit open for {key[0]} {key[1]} after {len(failed)} failing accounts")
+
+    def config(self) -> dict:
+        """Konfigurasi untuk breaker baru di proses lain (shard / probe worker)"""
+        return {"threshold": self.threshold, "half_open_after": self.half_open_after}
+
+    def snapshot(self) -> dict:
+        return {"open": len(self._opened_at), "rejected": self.rejected}
@@ -1,8 +1,18 @@
 import re
 import json
 import asyncio
+import hashlib
+import time
+from collections import Counter
 from converter import extract_ip_port_from_path
-from tester import test_account
+from tester import (
+    test_account, verify_account, verify_slots, get_target_candidates,
+    get_tls_server_name, get_ws_params, mark_budget_timeout, VERIFY_CONCURRENCY
+)
+from concurrency import AdaptiveLimiter, RetryBudget, CircuitBreaker
+from dns_resolver import is_ip, resolve_host
+from utils import geo_cache_stats, known_geo
+from geoip import GEO_ERROR_KEY
 
 def clean_account_dict(account: dict) -> dict:
     return {k: v for k, v in account.items() if not k.startswith("_")}
@@ -11,19 +21,72 @@ def deduplicate_accounts(accounts: list) -> list:
     # Simple: no deduplication. Add logic if needed.
     return accounts
 
+def _latency_rank(res):
+    """Latency untuk ranking: p50 multi-sample kalau ada, akun tanpa angka valid paling akhir"""
+    latency = res.get("Latency P50", res.get("Latency"))
+    if isinstance(latency, (int, float)) and latency >= 0:
+        return latency
+    return float("inf")
+
+# Negara prioritas untuk urutan config (dan mode top-K per negara), urut dari yang utama
+PRIORITY_COUNTRIES = ("🇮🇩", "🇸🇬", "🇯🇵", "🇰🇷", "🇺🇸")
+# expected_country: negaranya diketahui tapi bukan prioritas (None = belum diketahui)
+NON_PRIORITY = ""
+
+def priority_country(country):
+    """Flag negara prioritas yang cocok dengan field Country, None kalau bukan prioritas"""
+    for flag in PRIORITY_COUNTRIES:
+        if flag in (country or ""):
+            return flag
+    return None
+
 def sort_priority(res):
     country = res.get("Country", "")
-    if "🇮🇩" in country:
-        return (0,)
-    if "🇸🇬" in country:
-        return (1,)
-    if "🇯🇵" in country:
-        return (2,)
-    if "🇰🇷" in country:
-        return (3,)
-    if "🇺🇸" in country:
-        return (4,)
-    return (5, country)
+    latency = _latency_rank(res)
+    flag = priority_country(country)
+    if flag:
+        return (PRIORITY_COUNTRIES.index(flag), latency)
+    return (len(PRIORITY_COUNTRIES), country, latency)
+
+def account_fingerprint(account: dict) -> str:
+    """
+    Fingerprint kanonik akun: type, server, port, credentials, transport path/Host, SNI.
+    Tag dan field internal (_ws_path dll) tidak ikut, jadi akun yang sama dari
+    subscription berbeda tetap punya fingerprint yang sama.
+    """
+    transport = account.get("transport") if isinstance(account.get("transport"), dict) else {}
+    headers = transport.get("headers") or {}
+    canonical = {
+        "type": account.get("type"),
+        "server": str(account.get("server") or "").lower(),
+        "port": str(account.get("server_port", 443)),
+        "credentials": [account.get(key) for key in ("uuid", "password", "method", "flow", "alter_id", "security")],
+        "transport": transport.get("type"),
+        "path": transport.get("path"),
+        "host": str(headers.get("Host") or "").lower(),
+        "service_name": transport.get("serviceName"),
+        "sni": str(get_tls_server_name(account) or "").lower(),
+        "plugin_opts": account.get("plugin_opts"),
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()
+
+def history_entries(results):
+    """
+    (fingerprint, status, latency, country) untuk database.update_account_history.
+    Hasil yang tidak final (Timeout-Budget, worker crash) dan hasil yang geo lookup-nya
+    gagal (negara "❓" karena rate limit, bukan lokasi asli) tidak dihitung.
+    """
+    for res in results:
+        if res.get("Status") not in ("✅", "Dead", "❌") or res.get("Error") in ("worker crashed", "no probe workers", "reassign limit"):
+            continue
+        if GEO_ERROR_KEY in res:
+            continue
+        account = res.get("OriginalAccount")
+        if not account:
+            continue
+        latency = res.get("Latency P50", res.get("Latency"))
+        country = res.get("Country") if res.get("Status") == "✅" else None
+        yield account_fingerprint(account), res["Status"], latency, country
 
 def clean_provider_name(provider):
     provider = re.sub(r"\(.*?\)", "", provider)
@@ -48,26 +111,762 @@ def ensure_ws_path_field(accounts: list) -> list:
                 acc["_ws_path"] = transport.get("path", "")
     return accounts
 
-async def test_all_accounts(accounts: list, semaphore, live_results):
-    print(f"🔍 DEBUG: test_all_accounts called with {len(accounts)} accounts")
+# Maksimal DNS lookup kandidat target yang jalan bersamaan saat grouping
+RESOLVE_CONCURRENCY = 50
+# Porsi maksimal deadline run untuk resolve DNS saat grouping; sisanya untuk probe
+GROUPING_BUDGET = 0.2
+# Target grup yang di-resolve / di-race oleh test_account sendiri
+NO_TARGET = (None, None, None)
+
+# Field hasil probe yang di-copy ke semua akun dengan endpoint (ip, port) yang sama
+SHARED_RESULT_FIELDS = (
+    "Status", "Latency", "Jitter", "ICMP", "Country", "Provider", "Tested IP",
+    "TestType", "Retry", "TimeoutCount", "Resolution Method", "Real Location",
+    "TCP Latency", "TLS Handshake", "Cert Valid", "WS Upgrade", "WS Status",
+    "Latency P50", "Latency P95", "Loss", "Proxy Latency", "Error", GEO_ERROR_KEY,
+)
+
+async def group_accounts_by_target(accounts: list, timeout=None) -> list:
+    """
+    Resolve DNS kandidat target semua akun (async + cached, tanpa connect) lalu kelompokkan
+    per endpoint (ip, port, SNI, ws path/Host) — yang menentukan hasil probe.
+    Return list of (target, [index, ...], resolved); akun tanpa target jadi grup sendiri.
+    resolved: True = target (ip, port, label) sudah pasti; None = race kandidat (beberapa
+    IP berbeda, atau DNS belum selesai dalam `timeout` detik) dilakukan test_account di dalam
+    slot semaphore; False = DNS gagal untuk semua kandidat.
+    """
+    candidates = [get_target_candidates(acc) for acc in accounts]
+    hosts = list(dict.fromkeys(
+        host for cands in candidates for _, host, _ in cands if not is_ip(host)
+    ))
+    resolve_limit = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+    async def resolve(host):
+        async with resolve_limit:
+            return await resolve_host(host)
+
+    tasks = {host: asyncio.ensure_future(resolve(host)) for host in hosts}
+    try:
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+    finally:
+        pending = [task for task in tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    ips = {host: task.result() for host, task in tasks.items()
+           if not task.cancelled() and task.exception() is None}
+
+    groups = {}
+    for i, cands in enumerate(candidates):
+        endpoint = (get_tls_server_name(accounts[i]), get_ws_params(accounts[i]))
+        if any(not is_ip(host) and host not in ips for _, host, _ in cands):
+            # DNS belum selesai dalam budget grouping: resolve + race di dalam slot probe
+            key, target, resolved = ("pending", tuple(cands)) + endpoint, NO_TARGET, None
+        else:
+            # Kandidat yang resolve ke ip:port yang sama cukup dites sekali (label pertama)
+            unique = {}
+            for label, host, port in cands:
+                ip = host if is_ip(host) else ips[host]
+                if ip:
+                    unique.setdefault((ip, int(port)), label)
+            if not unique:
+                key, target, resolved = ("unresolved", i), NO_TARGET, False
+            elif len(unique) == 1:
+                (ip, port), label = next(iter(unique.items()))
+                # SNI dan ws path/Host ikut jadi key: TLS/ws probe ke ip:port yang sama bisa beda hasil
+                key, target, resolved = (ip, port) + endpoint, (ip, port, label), True
+            else:
+                key, target, resolved = ("race", tuple(unique)) + endpoint, NO_TARGET, None
+        if key not in groups:
+            groups[key] = (target, [], resolved)
+        groups[key][1].append(i)
+    return list(groups.values())
+
+def success_likelihood(history_entry) -> float:
+    """
+    Perkiraan peluang sukses (0..1) dari history akun.
+    Success rate pakai Laplace smoothing, status terakhir diberi bobot setengah.
+    """
+    if history_entry:
+        rate = (history_entry["successes"] + 1) / (history_entry["tests"] + 2)
+        last = 1.0 if history_entry["last_status"] == "✅" else 0.0
+        return (rate + last) / 2
+    return 0.5
+
+def _best_history_entry(indices, accounts=None, history=None):
+    """Entry history dengan peluang sukses tertinggi di antara akun grup, None kalau tidak ada"""
+    if not history or accounts is None:
+        return None
+    entries = [history.get(account_fingerprint(accounts[i])) for i in indices]
+    entries = [entry for entry in entries if entry]
+    if not entries:
+        return None
+    return max(entries, key=success_likelihood)
+
+def expected_country(indices, accounts=None, history=None, target=None):
+    """
+    Negara prioritas yang diharapkan untuk grup (top-K): dari history sukses grup, kalau
+    tidak ada dari geo IP target yang sudah diketahui (dataset offline / geo cache).
+    NON_PRIORITY kalau negaranya diketahui tapi bukan prioritas, None kalau belum diketahui.
+    """
+    best = _best_history_entry(indices, accounts, history)
+    if best and best["last_status"] == "✅":
+        return priority_country(best["last_country"]) or NON_PRIORITY
+    geo = known_geo(target[0]) if target and target[0] else None
+    if geo and "❓" not in geo.get("Country", "❓"):
+        return priority_country(geo["Country"]) or NON_PRIORITY
+    return None
+
+def group_likelihood(group, accounts=None, history=None) -> tuple:
+    """
+    Sort key: grup yang paling mungkin sukses dites duluan (penting kalau run punya
+    deadline dan supaya akun bagus muncul di UI/config dalam detik pertama).
+    Urutan: peluang sukses dari history per bucket 0.1, lalu ranking negara
+    sort_priority dari history, latency terakhir, dan grup dengan banyak akun duluan.
+    Grup yang DNS-nya gagal untuk semua kandidat paling akhir.
+    """
+    _, indices, resolved = group
+    if resolved is False:
+        return (1, 0, 5, float("inf"), -len(indices))
+
+    best = _best_history_entry(indices, accounts, history)
+    likelihood = success_likelihood(best)
+    if best and best["last_country"]:
+        priority = sort_priority({"Country": best["last_country"], "Latency": best["last_latency"]})
+        tier, latency = priority[0], priority[-1]
+    else:
+        tier, latency = 5, float("inf")
+    return (0, -round(likelihood, 1), tier, latency, -len(indices))
+
+def parse_deadline(value):
+    """Deadline run dari input user / env (detik); None kalau kosong atau tidak valid"""
+    try:
+        deadline = float(value)
+    except (TypeError, ValueError):
+        return None
+    return deadline if deadline > 0 else None
+
+def parse_top_k(value):
+    """Jumlah akun sehat per negara prioritas dari input user / env; None = tes semua"""
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        return None
+    return top_k if top_k > 0 else None
+
+def parse_circuit(threshold=None, half_open_after=None) -> CircuitBreaker:
+    """Circuit breaker dari input user / env; nilai kosong atau tidak valid pakai default"""
+    config = {}
+    try:
+        if int(threshold) > 0:
+            config["threshold"] = int(threshold)
+    except (TypeError, ValueError):
+        pass
+    try:
+        if float(half_open_after) >= 0:
+            config["half_open_after"] = float(half_open_after)
+    except (TypeError, ValueError):
+        pass
+    return CircuitBreaker(**config)
+
+# Status akun yang tidak dites karena kuota top-K negaranya sudah penuh
+TOPK_STATUS = "Skipped-TopK"
+
+class TopKTracker:
+    """
+    Hitung akun sehat (✅) per negara prioritas untuk mode top-K: run cukup sampai
+    tiap negara di PRIORITY_COUNTRIES punya `k` akun yang bekerja.
+    """
+
+    def __init__(self, k: int, countries=PRIORITY_COUNTRIES):
+        self.k = k
+        self.counts = {flag: 0 for flag in countries}
+
+    def add(self, result: dict) -> bool:
+        """Catat satu hasil, True kalau hasil ini membuat kuota sebuah negara penuh"""
+        if result.get("Status") != "✅":
+            return False
+        flag = priority_country(result.get("Country"))
+        if flag not in self.counts or self.counts[flag] >= self.k:
+            return False
+        self.counts[flag] += 1
+        if self.counts[flag] == self.k:
+            print(f"🎯 Top-K: {flag} reached {self.k} working accounts")
+            return True
+        return False
+
+    def is_full(self, flag) -> bool:
+        return flag in self.counts and self.counts[flag] >= self.k
+
+    @property
+    def done(self) -> bool:
+        return all(count >= self.k for count in self.counts.values())
+
+    def short(self) -> list:
+        """Negara prioritas yang kuotanya belum penuh"""
+        return [flag for flag, count in self.counts.items() if count < self.k]
+
+    def can_stop(self, open_countries) -> bool:
+        """
+        True kalau semua negara penuh, atau tidak ada grup tersisa (open_countries = negara
+        yang diharapkan dari grup yang belum selesai, None = bisa negara mana pun) yang
+        masih bisa mengisi negara yang kuotanya belum penuh.
+        """
+        open_countries = set(open_countries)
+        if None in open_countries and not self.done:
+            return False
+        return not open_countries.intersection(self.short())
+
+    def snapshot(self) -> dict:
+        return dict(self.counts)
+
+def merge_progress(progress: dict, parts) -> dict:
+    """
+    Jumlahkan progress per stage dari beberapa shard / batch worker remote
+    ({"reachability": {done, total, alive}, "verification": {done, total}}) ke `progress` in place.
+    """
+    merged = {"reachability": {"done": 0, "total": 0, "alive": 0},
+              "verification": {"done": 0, "total": 0}}
+    for part in parts:
+        for stage, counters in part.items():
+            stage_total = merged.setdefault(stage, {})
+            for key, value in counters.items():
+                stage_total[key] = stage_total.get(key, 0) + value
+    progress.update(merged)
+    return progress
+
+def progress_snapshot(progress: dict) -> dict:
+    """Copy progress yang aman dikirim ke proses lain / lewat JSON"""
+    return {stage: dict(counters) for stage, counters in progress.items()}
+
+def topk_skipped_result(account: dict, index: int) -> dict:
+    """Hasil untuk akun yang dilewati karena kuota top-K sudah terpenuhi"""
+    return {
+        "index": index,
+        "VpnType": account.get("type", "N/A"),
+        "OriginalTag": account.get("tag", "proxy"),
+        "OriginalAccount": account,
+        "Status": TOPK_STATUS,
+        "TestType": "Top-K per country reached",
+        "Jitter": -1,
+        "ICMP": "N/A",
+    }
+
+def budget_timeout_result(account: dict, index: int) -> dict:
+    """Hasil untuk akun yang belum sempat selesai saat deadline run habis"""
+    return mark_budget_timeout({
+        "index": index,
+        "VpnType": account.get("type", "N/A"),
+        "OriginalTag": account.get("tag", "proxy"),
+        "OriginalAccount": account,
+        "Jitter": -1,
+        "ICMP": "N/A",
+    })
+
+def fan_out_result(result: dict, account: dict, index: int) -> dict:
+    """Copy hasil probe representative ke akun lain di endpoint yang sama"""
+    shared = {field: result[field] for field in SHARED_RESULT_FIELDS if field in result}
+    return {
+        "index": index,
+        "VpnType": account.get("type", "N/A"),
+        "OriginalTag": account.get("tag", "proxy"),
+        "OriginalAccount": account,
+        **shared,
+        "Shared Probe": result["index"],
+    }
+
+# Maksimal grup yang task-nya hidup bersamaan di iter_test_results, supaya memory
+# tidak tumbuh dengan jumlah akun (minimal 2x limit concurrency)
+STREAM_WINDOW = 256
+# Ukuran antrian per subscriber ResultStream; subscriber yang lambat menahan producer
+SUBSCRIBER_QUEUE_SIZE = 256
+
+async def _iter_callback_runner(run):
+    """Ubah runner berbasis on_result callback (sharding/distributed) jadi async iterator"""
+    queue = asyncio.Queue()
+    finished = object()
+    task = asyncio.ensure_future(run(queue.put_nowait))
+    task.add_done_callback(lambda _: queue.put_nowait(finished))
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            yield item
+        task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+def probe_cache_entries(results):
+    """
+    (fingerprint, result) untuk database.save_probe_results; hanya hasil probe final yang baru.
+    Hasil dengan geo lookup gagal tidak di-cache supaya "❓" tidak dipakai ulang selama TTL.
+    """
+    for res in results:
+        if res.get("Cached") or res.get("Status") not in ("✅", "Dead") or GEO_ERROR_KEY in res:
+            continue
+        account = res.get("OriginalAccount")
+        if not account:
+            continue
+        cached = {field: res[field] for field in SHARED_RESULT_FIELDS if field in res}
+        yield account_fingerprint(account), cached
+
+def cached_result(account: dict, index: int, cache_entry) -> dict:
+    """Bangun hasil dari entry probe_cache (result, tested_at) tanpa probe ulang"""
+    cached, tested_at = cache_entry
+    return {
+        "index": index,
+        "VpnType": account.get("type", "N/A"),
+        "OriginalTag": account.get("tag", "proxy"),
+        "OriginalAccount": account,
+        **{field: cached[field] for field in SHARED_RESULT_FIELDS if field in cached},
+        "Cached": True,
+        "Cached Age": int(time.time() - tested_at),
+    }
+
+class _IndexView:
+    """
+    live_results[todo[i]] sebagai list sendiri (subset akun yang tidak ada di cache).
+    update() lewat view tetap menulis index asli, supaya UI tidak salah baris.
+    """
+
+    class _Entry:
+        def __init__(self, entry, index):
+            self.entry = entry
+            self.index = index
+
+        def update(self, values):
+            self.entry.update(values)
+            self.entry["index"] = self.index
+
+    def __init__(self, base, indices):
+        self.base = base
+        self.indices = indices
+
+    def __getitem__(self, i):
+        index = self.indices[i]
+        return self._Entry(self.base[index], index)
+
+    def __len__(self):
+        return len(self.indices)
+
+async def iter_test_results(accounts: list, semaphore, live_results=None, retry_budget=None,
+                            workers=None, probe_workers=None, window: int = STREAM_WINDOW,
+                            deadline=None, history=None, cached=None, circuit=None,
+                            top_k=None, verify=True, verify_concurrency=VERIFY_CONCURRENCY,
+                            progress=None, on_start=None):
+    """
+    Async generator: test semua akun dan yield tiap hasil final begitu selesai.
+    Paling banyak `window` grup endpoint yang task-nya aktif sekaligus dan hasil tidak
+    dikumpulkan di sini, jadi memory tetap terbatas untuk list akun yang besar.
+    live_results opsional; kalau diisi tetap di-update in place seperti biasa.
+    deadline (detik): batas waktu run; grup yang paling mungkin sukses dites duluan,
+    akun yang belum selesai saat deadline mendapat status Timeout-Budget.
+    history ({fingerprint: entry} dari database.get_account_history) menentukan urutan:
+    akun yang dulu sukses, terutama negara prioritas sort_priority, dites duluan.
+    cached ({fingerprint: (result, tested_at)} dari database.get_cached_probe_results,
+    sudah difilter TTL): akun dengan entry fresh langsung di-yield (Cached=True),
+    hanya sisanya yang di-probe.
+    circuit (CircuitBreaker) dibagi semua grup; default satu breaker baru per run
+    (per proses untuk sharded/distributed, dengan threshold yang sama dengan `circuit`).
+    top_k (int atau TopKTracker): cukup sampai tiap negara PRIORITY_COUNTRIES punya top_k
+    akun ✅. Grup yang menurut history (atau geo IP target yang sudah diketahui) milik
+    negara yang sudah penuh tidak dites (yang sedang jalan di-cancel), hasil stage 1 dari
+    negara yang sudah penuh tidak diverifikasi, dan run berhenti begitu tidak ada grup
+    tersisa yang bisa mengisi negara yang belum penuh; akun yang dilewati mendapat
+    status Skipped-TopK.
+    Pipeline dua stage: stage 1 (reachability TCP/TLS/ws + latency + geoip) untuk semua
+    grup di bawah `semaphore`; stage 2 (real geolocation: xray proxy test, curl, DNS)
+    hanya untuk grup yang ✅, dengan limit sendiri `verify_concurrency`. verify=False
+    melewati stage 2. progress (dict, opsional) di-update in place dengan progress
+    per stage: {"reachability": {done, total, alive}, "verification": {done, total}}.
+    on_start (opsional) dipanggil dengan index akun pertama grup saat probe grup dimulai
+    (hanya mode single-process; sharded/distributed hanya punya event hasil final).
+    """
+    tracker = top_k if isinstance(top_k, TopKTracker) else (TopKTracker(top_k) if top_k else None)
+
+    def skipped_results(indices):
+        for i in indices:
+            result = topk_skipped_result(accounts[i], i)
+            if live_results is not None:
+                live_results[i].update(result)
+            yield result
+
+    if cached:
+        fresh = []
+        todo = []
+        for i, account in enumerate(accounts):
+            entry = cached.get(account_fingerprint(account))
+            (fresh if entry else todo).append((i, entry))
+        print(f"💾 {len(fresh)} accounts from probe cache, {len(todo)} to probe")
+        for i, entry in fresh:
+            result = cached_result(accounts[i], i, entry)
+            if live_results is not None:
+                live_results[i].update(result)
+            if tracker is not None:
+                tracker.add(result)
+            yield result
+        if not todo:
+            return
+        todo = [i for i, _ in todo]
+        if tracker is not None and tracker.done:
+            for result in skipped_results(todo):
+                yield result
+            return
+        sub_results = _IndexView(live_results, todo) if live_results is not None else None
+        async for result in iter_test_results(
+                [accounts[i] for i in todo], semaphore, sub_results, retry_budget,
+                workers=workers, probe_workers=probe_workers, window=window,
+                deadline=deadline, history=history, circuit=circuit, top_k=tracker,
+                verify=verify, verify_concurrency=verify_concurrency, progress=progress,
+                on_start=(lambda i: on_start(todo[i])) if on_start is not None else None):
+            # Index hasil subset → index di list akun asli
+            result["index"] = todo[result["index"]]
+            if "Shared Probe" in result:
+                result["Shared Probe"] = todo[result["Shared Probe"]]
+            if live_results is not None:
+                live_results[result["index"]].update(result)
+            yield result
+        return
+
+    if workers is None and not probe_workers:
+        from sharding import default_worker_count
+        workers = default_worker_count(len(accounts))
+    if probe_workers or workers > 1:
+        # Runner multi-process / remote memakai callback; live_results wajib ada di sana
+        runner_results = live_results if live_results is not None else [{} for _ in accounts]
+        if probe_workers:
+            from distributed import test_all_accounts_distributed
+            run = lambda callback: test_all_accounts_distributed(
+                accounts, runner_results, probe_workers, on_result=callback, deadline=deadline,
+                verify=verify, progress=progress, history=history, circuit=circuit)
+        else:
+            from sharding import test_all_accounts_sharded
+            run = lambda callback: test_all_accounts_sharded(
+                accounts, semaphore, runner_results, workers, on_result=callback,
+                deadline=deadline, history=history, verify=verify, progress=progress,
+                circuit=circuit)
+        # Top-K di mode multi-process/remote hanya menghentikan run saat semua negara penuh
+        seen = set()
+        runner = _iter_callback_runner(run)
+        try:
+            async for result in runner:
+                seen.add(result["index"])
+                yield result
+                if tracker is not None and tracker.add(result) and tracker.done:
+                    print("🎯 Top-K reached for all priority countries, stopping run")
+                    break
+        finally:
+            await runner.aclose()
+        if tracker is not None and tracker.done:
+            for result in skipped_results(i for i in range(len(accounts)) if i not in seen):
+                yield result
+        return
+
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline if deadline else None
+
+    def remaining():
+        return None if deadline_at is None else max(0.0, deadline_at - loop.time())
+
+    def budget_results(indices):
+        for i in indices:
+            result = budget_timeout_result(accounts[i], i)
+            if live_results is not None:
+                live_results[i].update(result)
+            yield result
+
+    if isinstance(semaphore, AdaptiveLimiter):
+        semaphore.start()
+        window = max(window, semaphore.max_limit * 2)
     
-    tasks = [
-        test_account(acc, semaphore, i, live_results)
-        for i, acc in enumerate(accounts)
-    ]
-    print(f"🔍 DEBUG: Created {len(tasks)} test tasks")
+    # Grouping hanya resolve DNS (tanpa connect) dan paling banyak memakai GROUPING_BUDGET
+    # dari deadline: sisa budget untuk probe, urut dari yang paling mungkin sukses
+    grouping_timeout = remaining() * GROUPING_BUDGET if deadline_at is not None else None
+    try:
+        groups = await group_accounts_by_target(accounts, timeout=grouping_timeout)
+    except asyncio.CancelledError:
+        # Run dibatalkan (stop_testing / Ctrl-C) saat resolve target
+        if isinstance(semaphore, AdaptiveLimiter):
+            await semaphore.stop()
+        raise
+    groups.sort(key=lambda group: group_likelihood(group, accounts, history))
+    print(f"🔍 DEBUG: {len(accounts)} accounts → {len(groups)} unique endpoints")
+    # (target, indices, negara yang diharapkan dari history) untuk skip top-K
+    if tracker is not None:
+        # Lookup geo cache bisa kena sqlite: jangan block event loop
+        groups = await loop.run_in_executor(None, lambda: [
+            (target, indices, expected_country(indices, accounts, history, target))
+            for target, indices, _ in groups])
+    else:
+        groups = [(target, indices, None) for target, indices, _ in groups]
+    if retry_budget is None:
+        retry_budget = RetryBudget.for_run(len(groups))
+    if circuit is None:
+        circuit = CircuitBreaker()
+    
+    async def test_group(target, indices):
+        first = indices[0]
+        return await test_account(accounts[first], semaphore, first, live_results,
+                                  target=target if target[0] else None,
+                                  retry_budget=retry_budget, deadline=deadline_at,
+                                  circuit=circuit, verify=False)
+
+    def expand(result, indices):
+        return [result] + [fan_out_result(result, accounts[i], i) for i in indices[1:]]
+
+    stages = progress if progress is not None else {}
+    stages["reachability"] = {"done": 0, "total": len(accounts), "alive": 0}
+    stages["verification"] = {"done": 0, "total": 0}
+    slots = verify_slots(verify_concurrency) if verify else None
+    
+    remaining_groups = iter(groups)
+    unstarted = Counter(country for _, _, country in groups)  # top-K: negara grup yang belum mulai
+    pending = {}  # task stage 1 -> indices
+    pending_country = {}  # task -> negara yang diharapkan (top-K)
+    verifying = {}  # task stage 2 -> (indices, hasil stage 1)
+    skipped = []  # index akun yang dilewati top-K, di-yield oleh loop utama
+
+    def fill_window():
+        if deadline_at is not None and loop.time() >= deadline_at:
+            return
+        for target, indices, country in remaining_groups:
+            unstarted[country] -= 1
+            if tracker is not None and tracker.is_full(country):
+                skipped.extend(indices)
+                continue
+            task = asyncio.ensure_future(test_group(target, indices))
+            pending[task] = indices
+            pending_country[task] = country
+            if on_start is not None:
+                on_start(indices[0])
+            if len(pending) >= window:
+                return
+
+    async def cancel_tasks(tasks):
+        """Cancel grup yang belum selesai, return index akunnya; task yang sudah selesai
+        tetap di pending supaya hasilnya di-yield seperti biasa"""
+        tasks = [task for task in tasks if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        unfinished = []
+        for task in tasks:
+            unfinished += pending.pop(task)
+            pending_country.pop(task, None)
+        return unfinished
+
+    async def cancel_verification():
+        """Stage 2 yang belum selesai dibatalkan; hasil stage 1 (✅) tetap dipakai"""
+        tasks = [task for task in verifying if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        unverified = []
+        for task in tasks:
+            indices, result = verifying.pop(task)
+            unverified += expand(result, indices)
+        if live_results is not None:
+            for result in unverified:
+                live_results[result["index"]].update(result)
+        return unverified
+
+    def open_countries():
+        """Negara yang masih mungkin dihasilkan grup yang belum selesai (top-K)"""
+        countries = {country for country, count in unstarted.items() if count > 0}
+        countries.update(pending_country.values())
+        if verifying:
+            # Negara akhir ditentukan real geolocation, bisa beda dari stage 1
+            countries.add(None)
+        return countries
+
+    completed = 0
+    try:
+        fill_window()
+        while pending or verifying or skipped:
+            for result in skipped_results(skipped):
+                yield result
+            skipped.clear()
+            if not pending and not verifying:
+                fill_window()
+                continue
+            done, _ = await asyncio.wait([*pending, *verifying], timeout=remaining(),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Deadline habis: semua yang belum selesai (atau belum mulai) → Timeout-Budget,
+                # akun yang masih diverifikasi tetap memakai hasil stage 1
+                print(f"⏱️ Run deadline reached, {len(pending)} groups still running")
+                for result in await cancel_verification():
+                    yield result
+                unfinished = await cancel_tasks(list(pending))
+                unfinished += [i for _, indices, _ in remaining_groups for i in indices]
+                for result in budget_results(unfinished):
+                    yield result
+                break
+            filled = False
+            for task in done:
+                if task in verifying:
+                    indices, _ = verifying.pop(task)
+                    group_results = expand(task.result(), indices)
+                    stages["verification"]["done"] += len(indices)
+                else:
+                    indices = pending.pop(task)
+                    pending_country.pop(task, None)
+                    result = task.result()
+                    stages["reachability"]["done"] += len(indices)
+                    if result.get("Status") == "✅":
+                        stages["reachability"]["alive"] += len(indices)
+                    if (verify and result.get("Status") == "✅" and tracker is not None
+                            and tracker.is_full(priority_country(result.get("Country")))):
+                        # Negara hasil stage 1 sudah penuh: real geolocation tidak diperlukan
+                        skipped.extend(indices)
+                        continue
+                    if verify and result.get("Status") == "✅":
+                        # Lolos stage 1: slot semaphore sudah dilepas, lanjut ke stage 2
+                        stages["verification"]["total"] += len(indices)
+                        verifying[asyncio.ensure_future(
+                            verify_account(accounts[indices[0]], result, slots, deadline_at)
+                        )] = (indices, result)
+                        continue
+                    group_results = expand(result, indices)
+                completed += 1
+                print(f"🔍 DEBUG: Group {completed}/{len(groups)} completed with status: "
+                      f"{group_results[0].get('Status', 'unknown')} ({len(group_results)} accounts)")
+                for result in group_results:
+                    if live_results is not None:
+                        live_results[result["index"]].update(result)
+                    if tracker is not None and tracker.add(result):
+                        filled = True
+                    yield result
+            open_now = open_countries() if tracker is not None else None
+            if open_now and tracker.can_stop(open_now):
+                if tracker.done:
+                    print("🎯 Top-K reached for all priority countries, stopping run")
+                else:
+                    print(f"🎯 Top-K: no remaining group can fill {tracker.short()}, stopping run")
+                skipped.extend(i for _, indices, _ in remaining_groups for i in indices)
+                unstarted.clear()
+                skipped.extend(await cancel_tasks(list(pending)))
+                for result in await cancel_verification():
+                    yield result
+            elif filled:
+                # Probe yang sedang jalan untuk negara yang kuotanya baru penuh tidak diperlukan lagi
+                full = [task for task in pending if tracker.is_full(pending_country[task])]
+                skipped.extend(await cancel_tasks(full))
+            fill_window()
+        # Deadline habis tepat saat grup terakhir selesai: sisa grup belum pernah dimulai
+        for result in budget_results([i for _, indices, _ in remaining_groups for i in indices]):
+            yield result
+        if tracker is not None:
+            print(f"🎯 Top-K counts: {tracker.snapshot()}")
+    finally:
+        # Consumer berhenti lebih awal (break/cancel): jangan tinggalkan probe yatim
+        for task in [*pending, *verifying]:
+            task.cancel()
+        await asyncio.gather(*pending, *verifying, return_exceptions=True)
+        if isinstance(semaphore, AdaptiveLimiter):
+            await semaphore.stop()
+        print(f"🔍 DEBUG: retries used {retry_budget.spent}/{retry_budget.total}, "
+              f"circuit {circuit.snapshot()}, geo cache {geo_cache_stats()}")
+
+async def test_all_accounts(accounts: list, semaphore, live_results, retry_budget=None,
+                            workers=None, on_result=None, probe_workers=None, deadline=None,
+                            history=None, cached=None, circuit=None, top_k=None,
+                            verify=True, progress=None):
+    """
+    Test semua akun secara concurrent, return list semua hasil (lihat iter_test_results
+    untuk versi streaming).
+    semaphore boleh asyncio.Semaphore biasa atau AdaptiveLimiter (AIMD, limit menyesuaikan
+    timeout ratio dan event-loop lag).
+    Akun dengan endpoint (ip, port) yang sama hanya di-probe sekali, hasilnya di-copy.
+    retry_budget (RetryBudget) dibagi semua probe; default proporsional jumlah endpoint.
+    workers > 1 membagi akun ke beberapa proses (lihat sharding.py); None = otomatis
+    berdasarkan jumlah akun dan core. on_result dipanggil untuk tiap hasil final.
+    probe_workers = list alamat worker remote (distributed.py); kalau diisi, akun
+    dites oleh worker tersebut dan proses ini hanya menjadi coordinator.
+    deadline (detik) membatasi waktu run, history mengatur urutan, cached berisi hasil
+    probe yang masih fresh, circuit (CircuitBreaker) per IP/hostname, top_k menghentikan
+    run begitu tiap negara prioritas punya top_k akun ✅. Real geolocation jalan sebagai
+    stage 2 hanya untuk akun yang lolos (verify=False untuk melewatinya), progress per
+    stage di-update ke dict `progress`; lihat iter_test_results.
+    """
+    print(f"🔍 DEBUG: test_all_accounts called with {len(accounts)} accounts")
     
     results = []
-    for i, future in enumerate(asyncio.as_completed(tasks)):
-        print(f"🔍 DEBUG: Processing task {i+1}/{len(tasks)}")
-        result = await future
-        print(f"🔍 DEBUG: Task {i+1} completed with status: {result.get('Status', 'unknown')}")
-        live_results[result["index"]].update(result)
+    async for result in iter_test_results(accounts, semaphore, live_results, retry_budget,
+                                          workers=workers, probe_workers=probe_workers,
+                                          deadline=deadline, history=history,
+                                          cached=cached, circuit=circuit, top_k=top_k,
+                                          verify=verify, progress=progress):
         results.append(result)
+        if on_result is not None:
+            on_result(result)
     
     print(f"🔍 DEBUG: test_all_accounts completed, {len(results)} results")
     return results
 
+class ResultStream:
+    """
+    Fan-out hasil iter_test_results ke beberapa consumer (socket emitter, DB writer,
+    config builder) tanpa perlu scan live_results:
+
+        stream = ResultStream(iter_test_results(...))
+        successful = stream.subscribe()
+        ...
+        await asyncio.gather(stream.run(), consume(successful))
+
+    Tiap subscriber punya antrian terbatas; subscriber yang lambat menahan producer
+    (backpressure), bukan menumpuk hasil di memory. Saat source selesai / di-cancel,
+    subscriber menghabiskan sisa antriannya lalu berhenti.
+    """
+
+    _END = object()
+
+    def __init__(self, source, queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.source = source
+        self.queue_size = queue_size
+        self.completed = 0
+        self.finished = set()  # index akun yang hasil finalnya sudah keluar dari source
+        self._queues = []
+        self._closed = False
+
+    def subscribe(self, predicate=None):
+        """Daftar sebelum run(); return async iterator hasil (opsional difilter predicate)"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues.append((queue, predicate))
+        return self._consume(queue)
+
+    async def _consume(self, queue):
+        while True:
+            # Sentinel tidak muat di antrian yang penuh: berhenti begitu antrian habis
+            if self._closed and queue.empty():
+                return
+            item = await queue.get()
+            if item is self._END:
+                return
+            yield item
+
+    async def run(self):
+        try:
+            async for result in self.source:
+                self.completed += 1
+                self.finished.add(result["index"])
+                for queue, predicate in self._queues:
+                    if predicate is None or predicate(result):
+                        await queue.put(result)
+        finally:
+            # Jangan await di sini: subscriber yang sudah pergi bisa meninggalkan antrian
+            # penuh dan put() akan menunggu selamanya
+            self._closed = True
+            for queue, _ in self._queues:
+                try:
+                    queue.put_nowait(self._END)
+                except asyncio.QueueFull:
+                    pass
+
 def build_final_accounts(successful_results, custom_servers=None):
     """
     Build final accounts untuk config dengan optional server replacement
@@ -1,9 +1,11 @@
 import sqlite3
 import json
 import os
+import time
 from pathlib import Path
 
-DB_FILE = "vortexvpn.db"
+# Bisa diarahkan ke file lain (mis. database sementara untuk test suite)
+DB_FILE = os.getenv("VORTEXVPN_DB", "vortexvpn.db")
 
 def init_db():
     """Initialize the local database."""
@@ -29,6 +31,38 @@ def init_db():
         )
     ''')
     
+    # Create account_history table: ringkasan hasil tes per akun (key = account fingerprint)
+    # dipakai scheduler untuk mengetes akun yang kemungkinan besar hidup lebih dulu
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS account_history (
+            fingerprint TEXT PRIMARY KEY,
+            tests INTEGER NOT NULL DEFAULT 0,
+            successes INTEGER NOT NULL DEFAULT 0,
+            last_status TEXT,
+            last_latency INTEGER,
+            last_country TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create probe_cache table: hasil probe terakhir per account fingerprint (TTL dicek saat baca)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS probe_cache (
+            fingerprint TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            tested_at REAL NOT NULL
+        )
+    ''')
+    
+    # Create geo_cache table: hasil geoip_lookup per IP (lihat geoip.GeoCache)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geo_cache (
+            ip TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
 
@@ -116,5 +150,159 @@ def get_latest_test_session():
             return None
     return None
 
+def update_account_history(entries):
+    """
+    Update history per akun setelah dites.
+    entries: iterable of (fingerprint, status, latency, country)
+    """
+    rows = [
+        (fingerprint, 1 if status == "✅" else 0, status,
+         latency if isinstance(latency, (int, float)) and latency >= 0 else None, country)
+        for fingerprint, status, latency, country in entries
+    ]
+    if not rows:
+        return
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.executemany('''
+        INSERT INTO account_history (fingerprint, tests, successes, last_status, last_latency, last_country)
+        VALUES (?, 1, ?, ?, ?, ?)
+        ON CONFLICT(fingerprint) DO UPDATE SET
+            tests = tests + 1,
+            successes = successes + excluded.successes,
+            last_status = excluded.last_status,
+            last_latency = COALESCE(excluded.last_latency, last_latency),
+            last_country = COALESCE(excluded.last_country, last_country),
+            updated_at = CURRENT_TIMESTAMP
+    ''', rows)
+    
+    conn.commit()
+    conn.close()
+
+def get_account_history(fingerprints):
+    """Return {fingerprint: {tests, successes, last_status, last_latency, last_country}}"""
+    fingerprints = list(set(fingerprints))
+    history = {}
+    if not fingerprints:
+        return history
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    # Batas jumlah parameter SQLite: query per chunk
+    for start in range(0, len(fingerprints), 500):
+        chunk = fingerprints[start:start + 500]
+        cursor.execute(f'''
+            SELECT fingerprint, tests, successes, last_status, last_latency, last_country
+            FROM account_history WHERE fingerprint IN ({",".join("?" * len(chunk))})
+        ''', chunk)
+        for fingerprint, tests, successes, last_status, last_latency, last_country in cursor.fetchall():
+            history[fingerprint] = {
+                "tests": tests,
+                "successes": successes,
+                "last_status": last_status,
+                "last_latency": last_latency,
+                "last_country": last_country,
+            }
+    
+    conn.close()
+    return history
+
+def save_probe_results(entries):
+    """
+    Simpan hasil probe ke cache.
+    entries: iterable of (fingerprint, result dict tanpa OriginalAccount)
+    """
+    now = time.time()
+    rows = [(fingerprint, json.dumps(result, ensure_ascii=False, default=str), now)
+            for fingerprint, result in entries]
+    if not rows:
+        return
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.executemany('''
+        INSERT OR REPLACE INTO probe_cache (fingerprint, result, tested_at)
+        VALUES (?, ?, ?)
+    ''', rows)
+    
+    conn.commit()
+    conn.close()
+
+def get_cached_probe_results(fingerprints, max_age):
+    """Return {fingerprint: (result, tested_at)} untuk entry yang umurnya <= max_age detik"""
+    fingerprints = list(set(fingerprints))
+    cached = {}
+    if not fingerprints or not max_age:
+        return cached
+    min_tested_at = time.time() - max_age
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    for start in range(0, len(fingerprints), 500):
+        chunk = fingerprints[start:start + 500]
+        cursor.execute(f'''
+            SELECT fingerprint, result, tested_at FROM probe_cache
+            WHERE tested_at >= ? AND fingerprint IN ({",".join("?" * len(chunk))})
+        ''', [min_tested_at] + chunk)
+        for fingerprint, result, tested_at in cursor.fetchall():
+            try:
+                cached[fingerprint] = (json.loads(result), tested_at)
+            except ValueError:
+                continue
+    
+    conn.close()
+    return cached
+
+def purge_probe_cache(max_age):
+    """Hapus entry cache yang sudah lebih tua dari max_age detik"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.execute('DELETE FROM probe_cache WHERE tested_at < ?', (time.time() - max_age,))
+    
+    conn.commit()
+    conn.close()
+
+def get_cached_geo(ip):
+    """Return (result, expires_at) dari geo_cache kalau belum expired, selain itu None"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT result, expires_at FROM geo_cache WHERE ip = ? AND expires_at >= ?',
+                   (ip, time.time()))
+    row = cursor.fetchone()
+    
+    conn.close()
+    if not row:
+        return None
+    try:
+        return json.loads(row[0]), row[1]
+    except ValueError:
+        return None
+
+def save_geo_result(ip, result, expires_at):
+    """Simpan hasil geoip_lookup satu IP ke geo_cache"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO geo_cache (ip, result, expires_at)
+        VALUES (?, ?, ?)
+    ''', (ip, json.dumps(result, ensure_ascii=False), expires_at))
+    
+    conn.commit()
+    conn.close()
+
+def purge_geo_cache():
+    """Hapus entry geo_cache yang sudah expired"""
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+    
+    cursor.execute('DELETE FROM geo_cache WHERE expires_at < ?', (time.time(),))
+    
+    conn.commit()
+    conn.close()
+
 # Initialize database on import
 init_db()
\ No newline at end of file
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Distributed probe workers: test akun dari beberapa vantage point / mesin sekaligus
+
+Worker (di tiap mesin):
+    python distributed.py --listen 0.0.0.0:7301 --name sg-1
+    python distributed.py --listen unix:/tmp/vortex-worker.sock
+
+Coordinator (app.py / main.py): set PROBE_WORKERS=host:port,unix:/path lalu
+test_all_accounts membagi akun per batch ke worker dan mengumpulkan hasilnya.
+
+Protocol: tiap message = 4 byte panjang (big endian) + JSON.
+  coordinator -> worker: {"type": "batch", "batch_id", "indices", "accounts", "deadline", "verify",
+                          "history", "circuit"}  (history: entry akun batch tsb, untuk urutan
+                          probe; circuit: konfigurasi CircuitBreaker)
+                         {"type": "cancel", "batch_id"}  (run di coordinator dibatalkan)
+  worker -> coordinator: {"type": "hello", "worker"}            (saat connect)
+                         {"type": "result", "batch_id", "result"}
+                         {"type": "progress", "batch_id", "progress"}  (progress per stage)
+                         {"type": "ping"}                        (heartbeat)
+                         {"type": "batch_done", "batch_id"}
+Worker yang putus / tidak heartbeat, sisa batch-nya dikembalikan ke antrian. Sebaliknya
+worker membatalkan batch yang sedang jalan begitu coordinator putus (EOF) atau kirim cancel.
+Akun diurutkan menurut history sebelum dibagi per batch, jadi akun yang paling mungkin
+sukses dikirim duluan.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+from collections import deque
+
+from concurrency import AdaptiveLimiter, CircuitBreaker
+
+BATCH_SIZE = 50
+HEARTBEAT_INTERVAL = 5.0  # detik
+HEARTBEAT_TIMEOUT = HEARTBEAT_INTERVAL * 3
+PROGRESS_INTERVAL = 1.0  # detik
+CONNECT_TIMEOUT = 5.0
+MAX_REASSIGN = 2  # batch yang membuat worker mati berkali-kali tidak diulang terus
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+def parse_address(address: str):
+    """'host:port' -> ('tcp', host, port), 'unix:/path' -> ('unix', path, None)"""
+    address = address.strip()
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):], None
+    host, _, port = address.rpartition(":")
+    return "tcp", host or "127.0.0.1", int(port)
+
+def get_worker_addresses() -> list:
+    """Daftar worker dari env PROBE_WORKERS (comma separated), kosong = mode lokal"""
+    return [addr.strip() for addr in os.getenv("PROBE_WORKERS", "").split(",") if addr.strip()]
+
+def encode_message(message: dict) -> bytes:
+    data = json.dumps(message, ensure_ascii=False, default=str).encode()
+    return struct.pack("!I", len(data)) + data
+
+async def send_message(writer, message: dict):
+    writer.write(encode_message(message))
+    await writer.drain()
+
+async def read_message(reader) -> dict:
+    """Raise asyncio.IncompleteReadError kalau koneksi putus"""
+    length = struct.unpack("!I", await reader.readexactly(4))[0]
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"message too large ({length} bytes)")
+    return json.loads(await reader.readexactly(length))
+
+async def open_address(address: str):
+    kind, host, port = parse_address(address)
+    if kind == "unix":
+        connect = asyncio.open_unix_connection(host)
+    else:
+        connect = asyncio.open_connection(host, port)
+    return await asyncio.wait_for(connect, timeout=CONNECT_TIMEOUT)
+
+# === Worker ===
+
+class ProbeWorker:
+    """Server yang menjalankan test_all_accounts untuk batch dari coordinator"""
+
+    def __init__(self, name: str = None, initial: int = 5, min_limit: int = 2, max_limit: int = 64):
+        self.name = name or socket.gethostname()
+        self.limiter_config = {"initial": initial, "min_limit": min_limit, "max_limit": max_limit}
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername") or "unix"
+        print(f"🔌 Coordinator connected: {peer}")
+        send_lock = asyncio.Lock()
+
+        async def send(message):
+            async with send_lock:
+                await send_message(writer, message)
+
+        heartbeat = asyncio.ensure_future(self._heartbeat(send))
+        # Batch jalan sebagai task supaya socket tetap dibaca (EOF / cancel) selama probe
+        batches = {}  # batch_id -> task
+        try:
+            await send({"type": "hello", "worker": self.name})
+            while True:
+                message = await read_message(reader)
+                if message.get("type") == "batch":
+                    batch_id = message["batch_id"]
+                    task = asyncio.ensure_future(self.run_batch(message, send))
+                    batches[batch_id] = task
+                    task.add_done_callback(lambda _, batch_id=batch_id: batches.pop(batch_id, None))
+                elif message.get("type") == "cancel":
+                    task = batches.get(message.get("batch_id"))
+                    if task is not None:
+                        print(f"🛑 Batch {message.get('batch_id')} cancelled by coordinator")
+                        task.cancel()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"🔌 Coordinator disconnected: {peer}")
+        finally:
+            heartbeat.cancel()
+            # Coordinator sudah tidak menunggu hasilnya: jangan biarkan probe / xray jalan terus
+            tasks = list(batches.values())
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                print(f"🛑 Cancelling {len(tasks)} running batch(es)")
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _heartbeat(self, send):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await send({"type": "ping"})
+            except (ConnectionError, RuntimeError):
+                return
+
+    async def run_batch(self, message: dict, send):
+        from core import test_all_accounts, progress_snapshot
+
+        batch_id = message["batch_id"]
+        indices = message["indices"]
+        accounts = message["accounts"]
+        print(f"📦 Batch {batch_id}: testing {len(accounts)} accounts")
+        live_results = [
+            {"index": i, "OriginalAccount": account, "VpnType": account.get("type", "N/A"),
+             "OriginalTag": account.get("tag", "proxy"), "Status": "WAIT"}
+            for i, account in enumerate(accounts)
+        ]
+        pending_sends = []
+
+        def forward(result):
+            payload = {k: v for k, v in result.items() if k != "OriginalAccount"}
+            payload["index"] = indices[result["index"]]
+            if "Shared Probe" in payload:
+                payload["Shared Probe"] = indices[payload["Shared Probe"]]
+            payload["Worker"] = self.name
+            pending_sends.append(asyncio.ensure_future(
+                send({"type": "result", "batch_id": batch_id, "result": payload})
+            ))
+
+        progress = {}
+
+        async def report_progress():
+            last = None
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                snapshot = progress_snapshot(progress)
+                if snapshot != last:
+                    await send({"type": "progress", "batch_id": batch_id, "progress": snapshot})
+                    last = snapshot
+
+        reporter = asyncio.ensure_future(report_progress())
+        try:
+            await test_all_accounts(accounts, AdaptiveLimiter(**self.limiter_config), live_results,
+                                    workers=1, on_result=forward, deadline=message.get("deadline"),
+                                    history=message.get("history"),
+                                    circuit=CircuitBreaker(**(message.get("circuit") or {})),
+                                    verify=message.get("verify", True), progress=progress)
+        finally:
+            reporter.cancel()
+        await asyncio.gather(*pending_sends)
+        await send({"type": "progress", "batch_id": batch_id, "progress": progress_snapshot(progress)})
+        await send({"type": "batch_done", "batch_id": batch_id})
+
+    async def serve(self, address: str):
+        kind, host, port = parse_address(address)
+        if kind == "unix":
+            if os.path.exists(host):
+                os.unlink(host)
+            server = await asyncio.start_unix_server(self.handle_connection, host)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"🛰️ Probe worker '{self.name}' listening on {address}")
+        async with server:
+            await server.serve_forever()
+
+# === Coordinator ===
+
+class Coordinator:
+    """Bagi akun ke worker per batch, kumpulkan hasil, reassign batch dari worker yang mati"""
+
+    def __init__(self, addresses: list, batch_size: int = BATCH_SIZE):
+        self.addresses = list(addresses)
+        self.batch_size = batch_size
+        self.worker_status = {address: "pending" for address in self.addresses}
+
+    async def run(self, accounts: list, live_results: list, on_result=None, deadline=None,
+                  verify=True, progress=None, history=None, circuit=None) -> list:
+        from core import account_fingerprint, budget_timeout_result, group_likelihood, merge_progress
+
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline if deadline else None
+        fingerprints = [account_fingerprint(account) for account in accounts] if history else None
+        # Akun yang paling mungkin sukses (history) masuk batch pertama
+        order = sorted(range(len(accounts)),
+                       key=lambda i: group_likelihood((None, [i], True), accounts, history))
+        queue = deque(
+            (order[start:start + self.batch_size], 0)
+            for start in range(0, len(order), self.batch_size)
+        )
+
+        def batch_history(indices):
+            if not history:
+                return None
+            entries = {fingerprints[i]: history[fingerprints[i]]
+                       for i in indices if fingerprints[i] in history}
+            return entries or None
+        state = {"in_flight": 0, "batch_id": 0}
+        results = []
+        done = set()
+        batch_progress = {}  # batch_id -> progress per stage dari worker
+
+        def merge(result):
+            index = result["index"]
+            if index in done:
+                return  # hasil duplikat dari batch yang sempat di-reassign
+            done.add(index)
+            result["OriginalAccount"] = accounts[index]
+            live_results[index].update(result)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+
+        async def drive(address):
+            try:
+                reader, writer = await open_address(address)
+                hello = await asyncio.wait_for(read_message(reader), timeout=CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                print(f"⚠️ Probe worker {address} unavailable: {e}")
+                self.worker_status[address] = "unavailable"
+                return
+            name = hello.get("worker", address)
+            self.worker_status[address] = "connected"
+            print(f"🛰️ Connected to probe worker '{name}' ({address})")
+
+            try:
+                while queue or state["in_flight"]:
+                    if not queue:
+                        # Tunggu: batch worker lain bisa saja dikembalikan ke antrian
+                        await asyncio.sleep(0.1)
+                        continue
+                    indices, attempts = queue.popleft()
+                    if deadline_at is not None and loop.time() >= deadline_at:
+                        for index in indices:
+                            merge(budget_timeout_result(accounts[index], index))
+                        continue
+                    if attempts > MAX_REASSIGN:
+                        # Batch yang berkali-kali membuat worker mati tidak dikirim lagi
+                        for index in indices:
+                            merge({"index": index, "Status": "❌", "Error": "reassign limit"})
+                        continue
+                    outstanding = set(indices)
+                    state["in_flight"] += 1
+                    state["batch_id"] += 1
+                    batch_id = state["batch_id"]
+                    try:
+                        await send_message(writer, {
+                            "type": "batch", "batch_id": batch_id, "indices": indices,
+                            "accounts": [accounts[i] for i in indices],
+                            # Sisa waktu run; worker menandai sisanya Timeout-Budget sendiri
+                            "deadline": deadline_at - loop.time() if deadline_at is not None else None,
+                            "verify": verify,
+                            "history": batch_history(indices),
+                            "circuit": circuit.config() if circuit is not None else None,
+                        })
+                        while True:
+                            # Worker yang melewati deadline (+ grace) dianggap hilang
+                            timeout = HEARTBEAT_TIMEOUT
+                            if deadline_at is not None:
+                                timeout = min(timeout, max(1.0, deadline_at - loop.time() + HEARTBEAT_INTERVAL))
+                            message = await asyncio.wait_for(read_message(reader), timeout=timeout)
+                            if message.get("type") == "result":
+                                outstanding.discard(message["result"]["index"])
+                                merge(message["result"])
+                            elif message.get("type") == "progress" and message.get("batch_id") == batch_id:
+                                batch_progress[batch_id] = message["progress"]
+                                if progress is not None:
+                                    merge_progress(progress, batch_progress.values())
+                            elif message.get("type") == "batch_done" and message.get("batch_id") == batch_id:
+                                break
+                    except asyncio.CancelledError:
+                        # Run dibatalkan: minta worker berhenti (best effort, close tetap flush)
+                        writer.write(encode_message({"type": "cancel", "batch_id": batch_id}))
+                        raise
+                    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                        remaining = [index for index in indices if index in outstanding and index not in done]
+                        print(f"💥 Probe worker '{name}' lost ({e.__class__.__name__}), "
+                              f"reassigning {len(remaining)} accounts")
+                        if remaining:
+                            queue.appendleft((remaining, attempts + 1))
+                        # Batch yang di-reassign dihitung ulang oleh worker berikutnya
+                        batch_progress.pop(batch_id, None)
+                        self.worker_status[address] = "dead"
+                        return
+                    finally:
+                        state["in_flight"] -= 1
+                    # Batch dengan akun yang tidak dilaporkan (seharusnya tidak terjadi)
+                    for index in sorted(outstanding - done):
+                        merge({"index": index, "Status": "❌", "Error": "missing result",
+                               "Worker": name})
+            finally:
+                writer.close()
+                if self.worker_status[address] == "connected":
+                    self.worker_status[address] = "finished"
+
+        await asyncio.gather(*(drive(address) for address in self.addresses))
+
+        # Semua worker mati / tidak tersedia: sisa akun tetap perlu status final
+        for indices, _ in queue:
+            for index in indices:
+                merge({"index": index, "Status": "❌", "Error": "no probe workers"})
+        print(f"🛰️ Distributed run finished: {len(results)} results, workers {self.worker_status}")
+        return results
+
+async def test_all_accounts_distributed(accounts: list, live_results: list, addresses: list,
+                                        batch_size: int = BATCH_SIZE, on_result=None,
+                                        deadline=None, verify=True, progress=None,
+                                        history=None, circuit=None) -> list:
+    return await Coordinator(addresses, batch_size).run(accounts, live_results, on_result, deadline,
+                                                        verify=verify, progress=progress,
+                                                        history=history, circuit=circuit)
+
+def main():
+    parser = argparse.ArgumentParser(description="VortexVPN probe worker")
+    parser.add_argument("--listen", default="127.0.0.1:7301",
+                        help="host:port atau unix:/path/socket")
+    parser.add_argument("--name", default=None, help="nama worker / vantage point di hasil")
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    args = parser.parse_args()
+    worker = ProbeWorker(name=args.name, max_limit=args.max_concurrency)
+    try:
+        asyncio.run(worker.serve(args.listen))
+    except KeyboardInterrupt:
+        print("👋 Probe worker stopped")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Async DNS resolver dengan TTL-aware LRU cache dan in-flight request coalescing
+Dipakai bersama oleh tester.get_test_target, SmartLocationResolver dan RealGeolocationTester
+supaya domain CDN yang sama tidak di-resolve berulang kali (dan tanpa fork dig/nslookup)
+"""
+
+import asyncio
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+DEFAULT_DNS_SERVERS = ['8.8.8.8', '1.1.1.1']
+DEFAULT_TTL = 300      # detik, untuk hasil system resolver (tidak ada TTL)
+NEGATIVE_TTL = 30      # detik, untuk NXDOMAIN / gagal resolve
+MAX_TTL = 3600
+CACHE_SIZE = 2048
+QUERY_TIMEOUT = 2.0
+# Setelah system resolver menjawab, DNS publik hanya ditunggu selama ini (tambahan IP CDN)
+SYSTEM_GRACE = 0.25
+
+_TYPE_A = 1
+_CLASS_IN = 1
+_RCODE_NXDOMAIN = 3
+
+def is_ip(address) -> bool:
+    """Check if address is IPv4 literal"""
+    try:
+        socket.inet_aton(address)
+        return True
+    except (OSError, TypeError):
+        return False
+
+def build_query(name: str, query_id: int) -> bytes:
+    """Build DNS query packet untuk A record"""
+    header = struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0)  # RD=1
+    qname = b"".join(
+        bytes([len(label)]) + label
+        for label in (part.encode("idna") for part in name.rstrip(".").split("."))
+        if label
+    ) + b"\x00"
+    return header + qname + struct.pack("!HH", _TYPE_A, _CLASS_IN)
+
+def _skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:  # compression pointer
+            return offset + 2
+        if length == 0:
+            return offset + 1
+        offset += length + 1
+
+def parse_response(data: bytes, query_id: int) -> Tuple[List[str], int]:
+    """
+    Parse DNS response, return (list IPv4, ttl).
+    TTL adalah TTL terkecil dari A record; list kosong (jawaban negatif) dengan NEGATIVE_TTL
+    kalau tidak ada jawaban. Packet yang terpotong / rusak → ValueError.
+    """
+    try:
+        return _parse_response(data, query_id)
+    except (IndexError, struct.error, OSError) as e:
+        raise ValueError(f"Malformed DNS response: {e}") from e
+
+def _parse_response(data: bytes, query_id: int) -> Tuple[List[str], int]:
+    if len(data) < 12:
+        raise ValueError("DNS response too short")
+    resp_id, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    if resp_id != query_id:
+        raise ValueError("DNS response id mismatch")
+    rcode = flags & 0x000F
+    if rcode == _RCODE_NXDOMAIN:
+        return [], NEGATIVE_TTL
+
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_name(data, offset) + 4
+
+    ips = []
+    ttl = None
+    for _ in range(ancount):
+        offset = _skip_name(data, offset)
+        rtype, rclass, rttl, rdlength = struct.unpack("!HHIH", data[offset:offset + 10])
+        offset += 10
+        if rtype == _TYPE_A and rclass == _CLASS_IN and rdlength == 4:
+            ips.append(socket.inet_ntoa(data[offset:offset + 4]))
+            ttl = rttl if ttl is None else min(ttl, rttl)
+        offset += rdlength
+
+    if not ips:
+        return [], NEGATIVE_TTL
+    return ips, ttl
+
+class DNSCache:
+    """LRU cache dengan expiry per entry (sesuai TTL record). Thread-safe."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, ips = entry
+            if expires_at < time.monotonic():
+                del self._entries[name]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return list(ips)
+
+    def put(self, name: str, ips: List[str], ttl: int):
+        ttl = max(1, min(int(ttl), MAX_TTL))
+        with self._lock:
+            self._entries[name] = (time.monotonic() + ttl, list(ips))
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id: int, future: asyncio.Future):
+        self.query_id = query_id
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        if self.future.done():
+            return
+        try:
+            self.future.set_result(parse_response(data, self.query_id))
+        except ValueError:
+            pass  # bukan jawaban untuk query ini, tunggu berikutnya
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+class AsyncResolver:
+    """Resolve domain ke semua IPv4 dari beberapa DNS server + system resolver sekaligus"""
+
+    def __init__(self, dns_servers=None, timeout: float = QUERY_TIMEOUT,
+                 cache: Optional[DNSCache] = None, use_system: bool = True):
+        self.dns_servers = list(dns_servers) if dns_servers is not None else list(DEFAULT_DNS_SERVERS)
+        self.timeout = timeout
+        self.cache = cache if cache is not None else DNSCache()
+        self.use_system = use_system
+        self._inflight = {}
+
+    async def _query_server(self, name: str, server: str) -> Tuple[List[str], int]:
+        loop = asyncio.get_running_loop()
+        query_id = random.randint(0, 0xFFFF)
+        future = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DNSProtocol(query_id, future), remote_addr=(server, 53)
+        )
+        try:
+            transport.sendto(build_query(name, query_id))
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            transport.close()
+
+    async def _query_system(self, name: str) -> Tuple[List[str], int]:
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.wait_for(
+            loop.getaddrinfo(name, None, family=socket.AF_INET, type=socket.SOCK_STREAM),
+            timeout=self.timeout * 2,
+        )
+        return [info[4][0] for info in infos], DEFAULT_TTL
+
+    async def _lookup(self, name: str) -> List[str]:
+        loop = asyncio.get_running_loop()
+        tasks = [loop.create_task(self._query_server(name, server)) for server in self.dns_servers]
+        system = loop.create_task(self._query_system(name)) if self.use_system else None
+        if system is not None:
+            tasks.insert(0, system)
+
+        # Jangan tunggu DNS publik yang tidak menjawab: begitu system resolver dapat IP,
+        # sisa server hanya diberi SYSTEM_GRACE lalu di-cancel
+        pending = set(tasks)
+        grace_until = None
+        try:
+            while pending:
+                timeout = None if grace_until is None else max(0.0, grace_until - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                if (system in done and grace_until is None and not system.cancelled()
+                        and system.exception() is None and system.result()[0]):
+                    grace_until = loop.time() + SYSTEM_GRACE
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        all_ips = []
+        ttls = []
+        for task in tasks:
+            if task.cancelled() or task.exception() is not None:
+                continue
+            ips, ttl = task.result()
+            if not ips:
+                continue  # jawaban negatif, TTL-nya tidak berlaku untuk IP yang ada
+            ttls.append(ttl)
+            for ip in ips:
+                if ip not in all_ips:
+                    all_ips.append(ip)
+
+        ttl = min(ttls) if all_ips else NEGATIVE_TTL
+        self.cache.put(name, all_ips, ttl)
+        return all_ips
+
+    async def resolve_all(self, name: str) -> List[str]:
+        """Return semua IPv4 untuk domain (cached, concurrent lookup yang sama digabung)"""
+        if not name:
+            return []
+        if is_ip(name):
+            return [name]
+        name = name.rstrip(".").lower()
+
+        cached = self.cache.get(name)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        pending = self._inflight.get(name)
+        if pending is not None and not pending.done() and pending.get_loop() is loop:
+            return list(await asyncio.shield(pending))
+
+        task = loop.create_task(self._lookup(name))
+        self._inflight[name] = task
+        task.add_done_callback(lambda done, key=name: self._forget_inflight(key, done))
+        return list(await asyncio.shield(task))
+
+    def _forget_inflight(self, name: str, task):
+        if self._inflight.get(name) is task:
+            del self._inflight[name]
+
+    async def resolve(self, name: str) -> Optional[str]:
+        """Return IPv4 pertama untuk domain, None kalau gagal"""
+        ips = await self.resolve_all(name)
+        return ips[0] if ips else None
+
+    def resolve_all_sync(self, name: str) -> List[str]:
+        """
+        Versi blocking untuk kode sync (location_resolver, real_geolocation_tester).
+        Berbagi cache yang sama dengan versi async.
+        """
+        if not name:
+            return []
+        if is_ip(name):
+            return [name]
+        name = name.rstrip(".").lower()
+
+        cached = self.cache.get(name)
+        if cached is not None:
+            return cached
+
+        all_ips = []
+        ttls = []
+        if self.use_system:
+            try:
+                for info in socket.getaddrinfo(name, None, socket.AF_INET, socket.SOCK_STREAM):
+                    if info[4][0] not in all_ips:
+                        all_ips.append(info[4][0])
+                ttls.append(DEFAULT_TTL)
+            except OSError:
+                pass
+
+        # Sama seperti versi async: kalau system resolver sudah dapat IP, DNS publik
+        # hanya ditunggu SYSTEM_GRACE (total), bukan timeout penuh per server
+        grace_until = time.monotonic() + SYSTEM_GRACE if all_ips else None
+        for server in self.dns_servers:
+            timeout = self.timeout
+            if grace_until is not None:
+                timeout = grace_until - time.monotonic()
+                if timeout <= 0:
+                    break
+            try:
+                ips, ttl = self._query_server_sync(name, server, timeout)
+            except (OSError, ValueError):
+                continue
+            if ips:
+                ttls.append(ttl)
+            for ip in ips:
+                if ip not in all_ips:
+                    all_ips.append(ip)
+
+        ttl = min(ttls) if all_ips and ttls else NEGATIVE_TTL
+        self.cache.put(name, all_ips, ttl)
+        return all_ips
+
+    def _query_server_sync(self, name: str, server: str,
+                           timeout: Optional[float] = None) -> Tuple[List[str], int]:
+        timeout = self.timeout if timeout is None else timeout
+        query_id = random.randint(0, 0xFFFF)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.sendto(build_query(name, query_id), (server, 53))
+            deadline = time.monotonic() + timeout
+            while True:
+                data, _ = sock.recvfrom(4096)
+                try:
+                    return parse_response(data, query_id)
+                except ValueError:
+                    if time.monotonic() > deadline:
+                        raise
+
+# Shared resolver untuk seluruh aplikasi
+default_resolver = AsyncResolver()
+
+async def resolve_host(name: str) -> Optional[str]:
+    return await default_resolver.resolve(name)
+
+async def resolve_all(name: str) -> List[str]:
+    return await default_resolver.resolve_all(name)
+
+def resolve_all_sync(name: str) -> List[str]:
+    return default_resolver.resolve_all_sync(name)
@@ -0,0 +1,850 @@
+"""
+Geo lookup ke ip-api.com untuk geoip_lookup:
+- GeoCache: LRU in-memory dengan TTL, di-backup tabel geo_cache (vortexvpn.db), dipakai bersama
+  oleh test_account, SmartLocationResolver dan real geolocation supaya IP yang sama tidak
+  di-lookup ulang di run yang sama maupun run berikutnya
+- GeoBatcher: kumpulkan lookup dari test_account yang jalan concurrent selama window singkat
+  lalu kirim sebagai satu POST /batch (maks 100 IP), bukan satu GET per IP
+- OfflineGeo: dataset lokal IP range -> country/ASN/org (CSV/TSV atau MMDB, env GEOIP_DB);
+  kalau tersedia dijawab duluan, ip-api hanya fallback untuk IP yang tidak ada di dataset
+- GeoClient: satu-satunya jalur HTTP ke ip-api. Lookup IP yang sama yang jalan bersamaan
+  digabung jadi satu request (singleflight), request dijatah token bucket per endpoint
+  yang disinkronkan dengan header X-Rl / X-Ttl dari ip-api. lookup_raw memberi jawaban
+  mentah (isp, org, countryCode, ...) untuk scoring IP di real geolocation
+"""
+
+import asyncio
+import bisect
+import concurrent.futures
+import csv
+import ipaddress
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+try:
+    import requests
+    import http_session
+except ImportError:
+    requests = None
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+GEO_TTL = 7 * 24 * 3600  # detik; negara/provider sebuah IP jarang berubah
+NEGATIVE_TTL = 3600      # detik, untuk IP yang memang tidak dikenal API (private/reserved)
+CACHE_SIZE = 4096
+
+# Base URL ip-api; bisa diarahkan ke server lokal untuk test/benchmark
+GEO_API_URL = os.getenv("GEO_API_URL", "http://ip-api.com").rstrip("/")
+GEO_FIELDS = "status,country,countryCode,isp,org,query"
+GEO_TIMEOUT = 5
+BATCH_SIZE = 100     # batas ip-api untuk satu request /batch
+BATCH_WINDOW = 0.1   # detik, lama mengumpulkan lookup sebelum batch dikirim
+# Batch sekecil ini dikirim sebagai GET /json per IP: kuota /json (45/menit) jauh lebih
+# longgar dari /batch (15/menit), jadi jangan habiskan satu request /batch untuk 1-2 IP
+SMALL_BATCH = 2
+
+# Limit ip-api gratis per menit: /json 45 request, /batch 15 request
+JSON_RATE_LIMIT = 45
+BATCH_RATE_LIMIT = 15
+RATE_LIMIT_MAX_WAIT = 15.0  # detik; lebih lama dari ini lookup dianggap gagal (rate-limited)
+
+# Key tambahan di result kalau lookup GAGAL (bukan negara yang memang tidak diketahui)
+GEO_ERROR_KEY = "Geo Error"
+
+# Dataset offline, comma separated (mis. "ip2asn-combined.tsv" atau "GeoLite2-Country.mmdb,GeoLite2-ASN.mmdb")
+GEOIP_DB = os.getenv("GEOIP_DB", "")
+
+def default_result() -> dict:
+    return {"Country": "❓", "Provider": "-"}
+
+def failure_result(reason: str) -> dict:
+    """
+    Lookup gagal (timeout, rate limit, HTTP error): Country tetap "❓" supaya tampilan sama,
+    tapi ditandai GEO_ERROR_KEY sehingga bisa dibedakan dari IP yang memang tidak dikenal.
+    Tidak pernah di-cache.
+    """
+    return {**default_result(), GEO_ERROR_KEY: reason}
+
+def parse_answer(data: dict):
+    """
+    Ubah satu jawaban ip-api ke (result, ttl) untuk di-cache, atau None kalau
+    jawabannya tidak bisa dipakai (jangan di-cache).
+    """
+    from utils import get_flag_emoji
+
+    if not isinstance(data, dict):
+        return None
+    if data.get("status") == "success":
+        return {
+            "Country": get_flag_emoji(data.get('countryCode', '')),
+            "Provider": data.get('org') or data.get('isp') or "-"
+        }, GEO_TTL
+    if data.get("status") == "fail":
+        # IP private/reserved: memang tidak dikenal, cukup dicoba lagi nanti
+        return default_result(), NEGATIVE_TTL
+    return None
+
+def offline_result(country_code: str, asn=None, org: str = None):
+    """Bentuk result yang sama dengan jawaban ip-api, None kalau negara tidak diketahui"""
+    from utils import get_flag_emoji
+
+    flag = get_flag_emoji(country_code or "")
+    if flag == "❓":
+        return None
+    provider = org or (f"AS{asn}" if asn else "-")
+    return {"Country": flag, "Provider": provider}
+
+_ASN_PATTERN = re.compile(r"^(?:AS)?(\d+)$", re.IGNORECASE)
+
+def _ip_to_int(text: str):
+    """(int, version) untuk alamat IP, None kalau bukan IP. inet_pton jauh lebih cepat dari ipaddress"""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big"), 4
+    except OSError:
+        pass
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big"), 6
+    except (OSError, ValueError):
+        return None
+
+_IPV4_MAPPED = 0xFFFF00000000  # ::ffff:0.0.0.0, IPv4 di dataset IPv6 IP2Location
+
+def _int_to_ip(text: str):
+    """
+    Kolom IP dalam bentuk angka (IP2Location, GeoLite legacy): (int, version), None kalau
+    bukan angka. IPv4-mapped IPv6 dikembalikan sebagai IPv4 supaya cocok dengan lookup.
+    """
+    if not text.isdigit():
+        return None
+    value = int(text)
+    if value <= 0xFFFFFFFF:
+        return value, 4
+    if _IPV4_MAPPED <= value <= _IPV4_MAPPED + 0xFFFFFFFF:
+        return value - _IPV4_MAPPED, 4
+    if value < 1 << 128:
+        return value, 6
+    return None
+
+def _parse_range(fields: list):
+    """
+    Kolom range di awal baris CSV: "start,end,..." (alamat IP atau angka) atau "cidr,...".
+    Return (start_int, end_int, version, sisa kolom) atau None (header / baris rusak).
+    """
+    if "/" in fields[0]:
+        try:
+            network = ipaddress.ip_network(fields[0].strip(), strict=False)
+        except ValueError:
+            return None
+        return (int(network.network_address), int(network.broadcast_address),
+                network.version, fields[1:])
+    if len(fields) < 2:
+        return None
+    start = _ip_to_int(fields[0].strip()) or _int_to_ip(fields[0].strip())
+    end = _ip_to_int(fields[1].strip()) or _int_to_ip(fields[1].strip())
+    if start is None or end is None or start[1] != end[1]:
+        return None
+    return start[0], end[0], start[1], fields[2:]
+
+def _parse_labels(fields: list, country_name: bool = False):
+    """
+    Sisa kolom setelah range, urutan bebas: kode negara 2 huruf, ASN ("13335" / "AS13335"),
+    sisanya nama org. Cocok untuk ip2asn (asn, country, description),
+    DB-IP lite / CSV sederhana (country[, asn, org]) dan IP2Location LITE
+    (country_code, country_name / cidr, asn, as). Kolom cidr dan "-" dilewati;
+    country_name=True: kolom setelah kode negara adalah nama negara, bukan org.
+    """
+    country = asn = None
+    org = []
+    skip_name = False
+    for value in (field.strip() for field in fields):
+        if not value or value == "-" or ("/" in value and _ip_to_int(value.split("/")[0])):
+            continue
+        if country is None and len(value) == 2 and value.isalpha():
+            country = value.upper()
+            skip_name = country_name
+            continue
+        if skip_name:
+            skip_name = False
+            continue
+        match = _ASN_PATTERN.match(value)
+        if asn is None and match:
+            asn = int(match.group(1))
+            continue
+        org.append(value)
+    if org and org[0] in ("Not routed", "None"):
+        org = []
+    return country, asn or None, ", ".join(org) or None
+
+class RangeIndex:
+    """
+    Index IP range -> (country, asn, org) untuk dataset CSV/TSV. IPv4 disimpan di
+    array('I') terurut (start, end, label id); label unik di-intern di satu list.
+    Lookup = bisect di array start, O(log n) tanpa alokasi.
+    Range diasumsikan tidak overlap (seperti ip2asn / DB-IP).
+    """
+
+    def __init__(self):
+        self._starts = {4: array("I"), 6: []}
+        self._ends = {4: array("I"), 6: []}
+        self._label_ids = {4: array("I"), 6: array("I")}
+        self._labels = []
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    @classmethod
+    def from_csv(cls, path: str) -> "RangeIndex":
+        delimiter = "\t" if path.endswith((".tsv", ".tsv.txt")) else ","
+        rows = {4: [], 6: []}
+        label_index = {}
+        index = cls()
+        with open(path, newline="", encoding="utf-8", errors="replace") as f:
+            for fields in csv.reader(f, delimiter=delimiter):
+                parsed = _parse_range(fields) if fields else None
+                if parsed is None:
+                    continue
+                start, end, version, rest = parsed
+                # Range berupa angka = layout IP2Location (country_code, country_name, ...)
+                label = _parse_labels(rest, country_name=fields[0].strip().isdigit())
+                if label[0] is None and label[2] is None:
+                    continue
+                label_id = label_index.get(label)
+                if label_id is None:
+                    label_id = label_index[label] = len(index._labels)
+                    index._labels.append(label)
+                rows[version].append((start, end, label_id))
+
+        for version, version_rows in rows.items():
+            version_rows.sort()
+            for start, end, label_id in version_rows:
+                index._starts[version].append(start)
+                index._ends[version].append(end)
+                index._label_ids[version].append(label_id)
+        return index
+
+    def get(self, ip: str):
+        """(country, asn, org) untuk IP, None kalau tidak ada di dataset"""
+        parsed = _ip_to_int(ip)
+        if parsed is None:
+            return None
+        value, version = parsed
+        position = bisect.bisect_right(self._starts[version], value) - 1
+        if position < 0 or value > self._ends[version][position]:
+            return None
+        return self._labels[self._label_ids[version][position]]
+
+class MMDBIndex:
+    """Adapter MaxMind DB (GeoLite2 Country/City/ASN, DB-IP mmdb); butuh paket maxminddb"""
+
+    def __init__(self, path: str):
+        self._reader = maxminddb.open_database(path)
+
+    def __len__(self):
+        return self._reader.metadata().node_count
+
+    def get(self, ip: str):
+        try:
+            record = self._reader.get(ip)
+        except ValueError:
+            return None
+        if not record:
+            return None
+        country = (record.get("country") or record.get("registered_country") or {}).get("iso_code")
+        return (country, record.get("autonomous_system_number"),
+                record.get("autonomous_system_organization"))
+
+class OfflineGeo:
+    """
+    Gabungan satu atau lebih dataset offline (mis. Country + ASN mmdb).
+    Negara diambil dari dataset pertama yang punya negara, org dari yang pertama punya org.
+    Dataset di-load lazily saat lookup pertama.
+    """
+
+    def __init__(self, paths: str = GEOIP_DB):
+        self.paths = [path.strip() for path in (paths or "").split(",") if path.strip()]
+        self.hits = 0
+        self._indexes = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.paths)
+
+    @property
+    def loaded(self) -> bool:
+        return self._indexes is not None
+
+    def _load(self) -> list:
+        with self._lock:
+            if self._indexes is not None:
+                return self._indexes
+            indexes = []
+            for path in self.paths:
+                started = time.perf_counter()
+                if not os.path.exists(path):
+                    print(f"⚠️ Offline GeoIP dataset {path} not found")
+                    continue
+                try:
+                    if path.endswith(".mmdb"):
+                        if maxminddb is None:
+                            print(f"⚠️ {path}: pip install maxminddb untuk dataset MMDB")
+                            continue
+                        index = MMDBIndex(path)
+                    else:
+                        index = RangeIndex.from_csv(path)
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ Offline GeoIP dataset {path} not loaded: {e}")
+                    continue
+                print(f"🗺️ Offline GeoIP dataset {path} loaded ({len(index)} entries, "
+                      f"{(time.perf_counter() - started) * 1000:.0f}ms)")
+                indexes.append(index)
+            self._indexes = indexes
+            return indexes
+
+    def lookup(self, ip: str):
+        """Result {"Country", "Provider"} atau None (fallback ke ip-api)"""
+        if not self.paths:
+            return None
+        country = asn = org = None
+        for index in self._indexes if self._indexes is not None else self._load():
+            entry = index.get(ip)
+            if entry is None:
+                continue
+            country = country or entry[0]
+            asn = asn or entry[1]
+            org = org or entry[2]
+            if country and org:
+                break
+        result = offline_result(country, asn, org)
+        if result is not None:
+            self.hits += 1
+        return result
+
+# Shared dataset offline untuk seluruh aplikasi (kosong kalau GEOIP_DB tidak di-set)
+default_offline_geo = OfflineGeo()
+
+class GeoCache:
+    """
+    LRU cache {ip: {"Country", "Provider"}} dengan expiry per entry. Thread-safe.
+    Miss di memory dicek ke tabel geo_cache dulu sebelum dianggap miss (persist=True).
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, persist: bool = True):
+        self.maxsize = maxsize
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, ip: str, result: dict, expires_at: float):
+        """Simpan ke memory; expires_at dalam waktu wall-clock (sama dengan tabel)"""
+        with self._lock:
+            self._entries[ip] = (expires_at, dict(result))
+            self._entries.move_to_end(ip)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def peek(self, ip: str):
+        """Cek memory saja (tanpa sqlite, aman dipanggil dari event loop); miss tidak dihitung"""
+        with self._lock:
+            entry = self._entries.get(ip)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at >= time.time():
+                    self._entries.move_to_end(ip)
+                    self.hits += 1
+                    return dict(result)
+                del self._entries[ip]
+        return None
+
+    def get(self, ip: str):
+        cached = self.peek(ip)
+        if cached is not None:
+            return cached
+
+        if self.persist:
+            try:
+                from database import get_cached_geo
+                stored = get_cached_geo(ip)
+            except sqlite3.Error:
+                stored = None
+            if stored is not None:
+                result, expires_at = stored
+                self._remember(ip, result, expires_at)
+                with self._lock:
+                    self.hits += 1
+                    self.db_hits += 1
+                return dict(result)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, ip: str, result: dict, ttl: float = GEO_TTL):
+        expires_at = time.time() + ttl
+        self._remember(ip, result, expires_at)
+        if self.persist:
+            try:
+                from database import save_geo_result
+                save_geo_result(ip, result, expires_at)
+            except sqlite3.Error as e:
+                print(f"⚠️ Geo cache not persisted: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Counter hit/miss untuk log dan progress payload"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 2) if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+# Shared cache untuk seluruh aplikasi
+default_geo_cache = GeoCache()
+
+class RateBucket:
+    """
+    Token bucket untuk satu endpoint ip-api (`per_minute` request per menit).
+    Token terisi ulang perlahan, dan setiap response menyinkronkan bucket dengan
+    header ip-api: X-Rl = sisa request di window sekarang, X-Ttl = detik sampai window reset.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = max(1, int(per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.blocked_until = 0.0
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now < self.blocked_until:
+            self._updated = now
+            return
+        if self.blocked_until:
+            # Window ip-api sudah reset: kuota penuh lagi
+            self.blocked_until = 0.0
+            self.tokens = float(self.capacity)
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _wait_locked(self, now: float, count: int) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now + max(0.0, count - self.capacity) / self.rate
+        return max(0.0, (count - self.tokens) / self.rate)
+
+    def try_acquire(self, count: int = 1) -> bool:
+        """Ambil `count` token kalau semuanya tersedia sekarang, tanpa menunggu"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= count:
+                self.tokens -= count
+                return True
+            return False
+
+    def wait_time(self, count: int = 1) -> float:
+        """Detik sampai `count` token tersedia (0 kalau sudah tersedia)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return self._wait_locked(now, count)
+
+    def acquire(self, max_wait: float = RATE_LIMIT_MAX_WAIT) -> bool:
+        """Ambil satu token, tunggu kalau perlu. False kalau harus menunggu lebih dari max_wait."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = self._wait_locked(now, 1)
+            if now + wait > deadline:
+                return False
+            self.waited += wait
+            time.sleep(wait)
+
+    def update(self, headers):
+        """Sinkronkan dengan X-Rl / X-Ttl dari response (header tidak ada = abaikan)"""
+        try:
+            remaining = int(headers.get("X-Rl"))
+            ttl = int(headers.get("X-Ttl"))
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._updated = now
+            # Server yang menentukan: token lokal tidak boleh lebih banyak dari sisa kuota server
+            self.tokens = min(self.tokens, float(max(0, remaining)))
+            if remaining <= 0:
+                self.blocked_until = now + max(1, ttl)
+
+    def block(self, seconds: float):
+        """Dapat HTTP 429: berhenti kirim sampai window reset"""
+        with self._lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"tokens": round(self.tokens, 1), "waited": round(self.waited, 1),
+                    "blocked": time.monotonic() < self.blocked_until}
+
+class GeoClient:
+    """
+    Client ip-api yang dipakai bersama semua caller (thread maupun executor):
+    offline dataset -> cache -> satu request HTTP per IP walaupun banyak caller
+    menanyakan IP yang sama bersamaan. Request /json dan /batch dijatah RateBucket
+    masing-masing. Kegagalan dikembalikan sebagai failure_result(...) dan tidak di-cache.
+    """
+
+    def __init__(self, cache: GeoCache = None, offline: OfflineGeo = None,
+                 base_url: str = None, timeout: float = GEO_TIMEOUT,
+                 max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.cache = cache if cache is not None else default_geo_cache
+        self.offline = offline if offline is not None else default_offline_geo
+        self.base_url = (base_url or GEO_API_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.json_bucket = RateBucket(JSON_RATE_LIMIT)
+        self.batch_bucket = RateBucket(BATCH_RATE_LIMIT)
+        self.http_requests = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self._inflight = {}  # ip / ("raw", ip) -> concurrent.futures.Future
+        self._raw = OrderedDict()  # ip -> (expires_at, jawaban mentah ip-api)
+        self._lock = threading.Lock()
+
+    def lookup(self, ip: str) -> dict:
+        if not ip or not isinstance(ip, str):
+            return default_result()
+        offline = self.offline.lookup(ip)
+        if offline is not None:
+            return offline
+        cached = self.cache.get(ip)
+        if cached is not None:
+            return cached
+        return self.fetch(ip)
+
+    def fetch(self, ip: str, acquired: bool = False) -> dict:
+        """
+        Request /json untuk satu IP (tanpa cek cache), digabung dengan request IP yang sama
+        yang sedang jalan. acquired=True: token json_bucket sudah diambil caller.
+        """
+        return dict(self._coalesce(ip, self._fetch, ip, acquired))
+
+    def lookup_raw(self, ip: str):
+        """
+        Jawaban mentah ip-api (status, country, countryCode, isp, org, query) untuk caller
+        yang butuh field lengkap, mis. scoring ISP di real geolocation. Dijatah json_bucket
+        yang sama dengan lookup; jawaban sukses ikut mengisi cache. None kalau gagal.
+        """
+        if not ip or not isinstance(ip, str):
+            return None
+        with self._lock:
+            entry = self._raw.get(ip)
+            if entry is not None and entry[0] >= time.time():
+                self._raw.move_to_end(ip)
+                return dict(entry[1])
+        data = self._coalesce(("raw", ip), self._fetch_raw, ip)
+        # Leader kena exception: _coalesce memberi failure_result, bukan jawaban ip-api
+        return dict(data) if data and "status" in data else None
+
+    def _coalesce(self, key, fetch, *args):
+        """Singleflight: caller dengan key yang sama menunggu hasil request leader"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        result = failure_result("aborted")
+        try:
+            result = fetch(*args)
+        except Exception as e:
+            result = failure_result(str(e) or e.__class__.__name__)
+        finally:
+            # Follower tidak boleh menunggu selamanya walaupun leader kena exception
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(result)
+        return result
+
+    def record_failure(self, reason: str) -> dict:
+        with self._lock:
+            self.failures += 1
+            if reason == "rate-limited":
+                self.rate_limited += 1
+        return failure_result(reason)
+
+    def _request(self, bucket: RateBucket, method: str, url: str, acquired: bool = False,
+                 **kwargs):
+        """
+        Request HTTP yang dijatah bucket (acquired=True: token sudah diambil caller).
+        Return (response, None) atau (None, alasan gagal).
+        """
+        if not requests:
+            return None, "requests not installed"
+        if not acquired and not bucket.acquire(self.max_wait):
+            return None, "rate-limited"
+        with self._lock:
+            self.http_requests += 1
+        try:
+            response = http_session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.Timeout:
+            return None, "timeout"
+        except requests.RequestException as e:
+            return None, e.__class__.__name__
+        bucket.update(response.headers)
+        if response.status_code == 429:
+            try:
+                bucket.block(int(response.headers.get("X-Ttl", 60)))
+            except ValueError:
+                bucket.block(60)
+            return None, "rate-limited"
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
+        return response, None
+
+    def _fetch(self, ip: str, acquired: bool = False) -> dict:
+        response, error = self._request(self.json_bucket, "GET",
+                                        f"{self.base_url}/json/{ip}?fields={GEO_FIELDS}",
+                                        acquired=acquired)
+        if error:
+            return self.record_failure(error)
+        try:
+            parsed = parse_answer(response.json())
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            return self.record_failure("invalid response")
+        self.cache.put(ip, *parsed)
+        return parsed[0]
+
+    def _fetch_raw(self, ip: str):
+        response, error = self._request(self.json_bucket, "GET",
+                                        f"{self.base_url}/json/{ip}?fields={GEO_FIELDS}")
+        if error:
+            self.record_failure(error)
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        parsed = parse_answer(data)
+        if parsed is None:
+            self.record_failure("invalid response")
+            return None
+        self.cache.put(ip, *parsed)
+        with self._lock:
+            self._raw[ip] = (time.time() + parsed[1], dict(data))
+            self._raw.move_to_end(ip)
+            while len(self._raw) > CACHE_SIZE:
+                self._raw.popitem(last=False)
+        return data
+
+    def fetch_batch(self, ips: list, acquired: bool = False) -> dict:
+        """
+        Satu POST /batch untuk sampai 100 IP (tanpa cek cache, itu tugas caller).
+        Return {ip: result}; IP yang gagal berisi failure_result(...).
+        """
+        response, error = self._request(self.batch_bucket, "POST",
+                                        f"{self.base_url}/batch?fields={GEO_FIELDS}",
+                                        acquired=acquired, json=ips)
+        answers = None
+        if not error:
+            try:
+                answers = response.json()
+            except ValueError:
+                answers = None
+            if not isinstance(answers, list):
+                error = "invalid response"
+        if error:
+            print(f"⚠️ Geo batch of {len(ips)} IPs failed: {error}")
+            failure = self.record_failure(error)
+            return {ip: dict(failure) for ip in ips}
+
+        by_ip = {}
+        for ip, data in zip(ips, answers):
+            # ip-api menjaga urutan, tapi pakai "query" kalau ada
+            if isinstance(data, dict):
+                by_ip[data.get("query") or ip] = data
+        results = {}
+        for ip in ips:
+            parsed = parse_answer(by_ip.get(ip))
+            if parsed is None:
+                results[ip] = self.record_failure("invalid response")
+                continue
+            self.cache.put(ip, *parsed)
+            results[ip] = parsed[0]
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"http_requests": self.http_requests, "coalesced": self.coalesced,
+                    "failures": self.failures, "rate_limited": self.rate_limited}
+
+# Shared client untuk seluruh aplikasi
+default_geo_client = GeoClient()
+
+class GeoBatcher:
+    """
+    Gabungkan geo lookup dari banyak coroutine ke POST /batch ke ip-api (maks 100 IP per
+    request). Lookup pertama membuka window `window` detik, lalu:
+    - 1-2 IP dikirim sebagai GET /json per IP (kuota /json lebih longgar dari /batch)
+    - lebih dari itu dikirim sebagai batch, dipecah per 100 IP
+    - kalau bucket yang dibutuhkan belum punya token, IP tetap dikumpulkan dan dikirim
+      sekaligus begitu token tersedia (bukan satu request per IP yang masing-masing menunggu)
+    IP yang sedang di-request (in flight) tidak dikirim ulang, caller-nya ikut menunggu
+    request yang sama. HTTP, load dataset offline dan cek cache sqlite jalan di executor
+    supaya event loop tidak ter-block.
+    """
+
+    def __init__(self, client: GeoClient = None, window: float = BATCH_WINDOW,
+                 max_batch: int = BATCH_SIZE):
+        self.client = client if client is not None else default_geo_client
+        self.window = window
+        self.max_batch = max(1, min(int(max_batch), BATCH_SIZE))
+        self.batches = 0
+        self.failed_batches = 0
+        self.singles = 0
+        self.sent = 0
+        self._loop = None
+        self._pending = {}  # ip -> future, belum dikirim
+        self._inflight = {}  # ip -> future, request-nya sedang jalan
+        self._timer = None
+        self._tasks = set()
+
+    def _bind(self, loop):
+        # Batcher dipakai ulang di run berikutnya (asyncio.run baru): buang state loop lama
+        if self._loop is not loop:
+            self._loop = loop
+            self._pending = {}
+            self._inflight = {}
+            self._timer = None
+            self._tasks = set()
+
+    async def lookup(self, ip: str) -> dict:
+        if not ip or not isinstance(ip, str):
+            return default_result()
+        loop = asyncio.get_running_loop()
+        offline = self.client.offline
+        if offline.enabled and not offline.loaded:
+            # Parse dataset CSV bisa makan detik: jangan di event loop
+            await loop.run_in_executor(None, offline._load)
+        result = offline.lookup(ip)
+        if result is not None:
+            return result
+
+        self._bind(loop)
+        future = self._pending.get(ip) or self._inflight.get(ip)
+        if future is None:
+            cached = self.client.cache.peek(ip)
+            if cached is None and self.client.cache.persist:
+                cached = await loop.run_in_executor(None, self.client.cache.get, ip)
+            if cached is not None:
+                return cached
+            # Lookup lain untuk IP yang sama bisa sudah masuk selama cek sqlite
+            future = self._pending.get(ip) or self._inflight.get(ip)
+        if future is None:
+            future = loop.create_future()
+            self._pending[ip] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        # shield: caller yang di-cancel tidak boleh membatalkan jawaban caller lain
+        return dict(await asyncio.shield(future))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            count = len(self._pending)
+            if count <= SMALL_BATCH and self.client.json_bucket.try_acquire(count):
+                for ip in list(self._pending):
+                    self._dispatch([ip], single=True)
+                return
+            if self.client.batch_bucket.try_acquire():
+                self._dispatch(list(self._pending)[:self.max_batch], single=False)
+                continue
+
+            # Belum ada token: tetap kumpulkan, coba lagi begitu token tersedia
+            wait = self.client.batch_bucket.wait_time()
+            if count <= SMALL_BATCH:
+                wait = min(wait, self.client.json_bucket.wait_time(count))
+            if wait > self.client.max_wait:
+                print(f"⚠️ Geo lookups rate-limited for {wait:.0f}s, "
+                      f"{count} IPs reported as failed")
+                failure = self.client.record_failure("rate-limited")
+                pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    if not future.done():
+                        future.set_result(dict(failure))
+                return
+            self._timer = self._loop.call_later(max(wait, 0.01), self._flush)
+            return
+
+    def _dispatch(self, ips: list, single: bool):
+        futures = {}
+        for ip in ips:
+            futures[ip] = self._inflight[ip] = self._pending.pop(ip)
+        self.sent += len(ips)
+        if single:
+            self.singles += 1
+        else:
+            self.batches += 1
+        task = self._loop.create_task(self._send(futures, single))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, futures: dict, single: bool):
+        ips = list(futures)
+        try:
+            if single:
+                result = await self._loop.run_in_executor(None, self.client.fetch, ips[0], True)
+                results = {ips[0]: result}
+            else:
+                results = await self._loop.run_in_executor(None, self.client.fetch_batch, ips, True)
+        except Exception as e:
+            results = {ip: failure_result(str(e) or e.__class__.__name__) for ip in ips}
+        if not single and any(GEO_ERROR_KEY in result for result in results.values()):
+            self.failed_batches += 1
+        for ip, future in futures.items():
+            if self._inflight.get(ip) is future:
+                del self._inflight[ip]
+            if not future.done():
+                future.set_result(results.get(ip) or failure_result("missing answer"))
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "failed_batches": self.failed_batches,
+                "singles": self.singles, "sent": self.sent}
+
+# Shared batcher untuk test_account
+default_geo_batcher = GeoBatcher()
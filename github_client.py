@@ -2,6 +2,8 @@ import requests
 import base64
 import json
 
+import http_session
+
 class GitHubClient:
     def __init__(self, token: str, owner: str, repo: str):
         self.token = token
@@ -16,7 +18,7 @@ class GitHubClient:
     def list_files_in_repo(self, path: str = "") -> list:
         url = f"{self.api_url}/{path}"
         try:
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = http_session.get(url, headers=self.headers, timeout=30)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -26,7 +28,7 @@ class GitHubClient:
     def get_file(self, file_path: str) -> tuple[str, str] | None:
         url = f"{self.api_url}/{file_path}"
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = http_session.get(url, headers=self.headers, timeout=10)
             response.raise_for_status()
             data = response.json()
             content = base64.b64decode(data['content']).decode('utf-8')
@@ -42,7 +44,7 @@ class GitHubClient:
         if sha:
             payload['sha'] = sha
         try:
-            response = requests.put(url, headers=self.headers, data=json.dumps(payload), timeout=15)
+            response = http_session.put(url, headers=self.headers, data=json.dumps(payload), timeout=15)
             response.raise_for_status()
             print(f"✔️ Berhasil menyimpan file '{file_path}' ke GitHub.")
             return response.json()
@@ -0,0 +1,65 @@
+"""
+Shared HTTP session layer: satu requests.Session dengan connection pool per host dan keep-alive
+Dipakai geo client (ip-api), GitHubClient dan fetch link subscription supaya request berurutan
+ke host yang sama memakai ulang koneksi TCP/TLS, bukan connect + handshake baru tiap request
+seperti module-level requests.get/put.
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Jumlah host yang pool-nya disimpan, dan koneksi keep-alive per host.
+# Koneksi di atas POOL_MAXSIZE tetap dibuat (pool_block=False) tapi tidak disimpan.
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "16"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_connections: int = HTTP_POOL_CONNECTIONS,
+                   pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session() -> requests.Session:
+    """Session bersama (dibuat saat pertama dipakai, satu per proses)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def configure(pool_connections: int = HTTP_POOL_CONNECTIONS,
+              pool_maxsize: int = HTTP_POOL_MAXSIZE):
+    """Ganti ukuran pool; koneksi di session lama ditutup"""
+    global _session
+    with _session_lock:
+        old, _session = _session, create_session(pool_connections, pool_maxsize)
+    if old is not None:
+        old.close()
+
+def close():
+    global _session
+    with _session_lock:
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    return get_session().request(method, url, **kwargs)
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+def put(url: str, **kwargs) -> requests.Response:
+    return request("PUT", url, **kwargs)
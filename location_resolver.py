@@ -5,9 +5,7 @@ Resolves ke real server location, bukan CDN/Cloudflare
 """
 
 import socket
-import re
-import asyncio
-from typing import Dict, List, Optional, Tuple
+from typing import List, Optional
 
 try:
     import requests
@@ -15,6 +13,7 @@ except ImportError:
     requests = None
 
 from utils import geoip_lookup
+from dns_resolver import resolve_all_sync
 
 class SmartLocationResolver:
     """Resolve real VPN server location meskipun menggunakan domain/SNI"""
@@ -53,43 +52,9 @@ class SmartLocationResolver:
         return any(cdn in provider_lower for cdn in self.cdn_providers)
     
     def _resolve_domain_multiple_dns(self, domain: str) -> List[str]:
-        """Resolve domain menggunakan multiple methods untuk dapat semua IPs"""
-        all_ips = set()
-        
-        # Method 1: System resolver
-        try:
-            ip = socket.gethostbyname(domain)
-            all_ips.add(ip)
-        except:
-            pass
-        
-        # Method 2: Manual dig command (if available)
-        try:
-            import subprocess
-            result = subprocess.run(['dig', '+short', domain], 
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                for line in result.stdout.strip().split('\n'):
-                    line = line.strip()
-                    if line and self._is_ip(line):
-                        all_ips.add(line)
-        except (ImportError, FileNotFoundError, subprocess.TimeoutExpired):
-            pass
-        
-        # Method 3: Use different DNS servers with nslookup
-        for dns_server in self.dns_servers[:2]:  # Limit to 2 DNS servers
-            try:
-                import subprocess
-                result = subprocess.run(['nslookup', domain, dns_server], 
-                                      capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    # Extract IPs from nslookup output
-                    ips = re.findall(r'Address: (\d+\.\d+\.\d+\.\d+)', result.stdout)
-                    all_ips.update(ips)
-            except (ImportError, FileNotFoundError, subprocess.TimeoutExpired):
-                continue
-        
-        return list(all_ips)
+        """Resolve domain menggunakan system resolver + beberapa DNS server untuk dapat semua IPs"""
+        # Shared async resolver (cached per TTL), tidak fork dig/nslookup per domain
+        return resolve_all_sync(domain)
     
     def _get_best_ip_for_location(self, ips: List[str]) -> Optional[str]:
         """Pilih IP terbaik untuk location lookup (hindari CDN)"""
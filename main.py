@@ -1,6 +1,7 @@
 import os
 import json
 import re
+import signal
 import asyncio
 import requests
 from datetime import datetime
@@ -11,15 +12,28 @@ from dotenv import load_dotenv
 from urllib.parse import urlparse
 
 from github_client import GitHubClient
+import http_session
 from core import (
     deduplicate_accounts, sort_priority, ensure_ws_path_field,
-    build_final_accounts, load_template, test_all_accounts
+    build_final_accounts, load_template, test_all_accounts, parse_deadline,
+    parse_top_k, parse_circuit, account_fingerprint, history_entries, probe_cache_entries
+)
+from database import (
+    get_account_history, update_account_history, save_probe_results, get_cached_probe_results,
+    purge_geo_cache
 )
 from extractor import extract_accounts_from_config
+from concurrency import AdaptiveLimiter
+from distributed import get_worker_addresses
+from real_geolocation_tester import kill_xray_processes
 from converter import parse_link, inject_outbounds_to_template
 
-MAX_CONCURRENT_TESTS = 5
+# Adaptive concurrency (AIMD): mulai dari INITIAL, naik/turun di antara MIN dan MAX
+INITIAL_CONCURRENT_TESTS = 5
+MIN_CONCURRENT_TESTS = 2
+MAX_CONCURRENT_TESTS = 64
 TEMPLATE_FILE = "template.json"
+PROBE_CACHE_TTL = 600  # detik, hasil probe lebih muda dari ini dipakai ulang tanpa probe
 SPINNERS = ["◐", "◓", "◑", "◒"]
 DOTS = ["⠁", "⠂", "⠄", "⠂"]
 
@@ -38,7 +52,7 @@ def fetch_vpn_links_from_raw_url(raw_url):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(raw_url, headers=headers, timeout=30)
+        response = http_session.get(raw_url, headers=headers, timeout=30)
         response.raise_for_status()
         
         # Extract VPN links from raw text
@@ -95,7 +109,7 @@ def fetch_vpn_links_from_api(api_url):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(api_url, headers=headers, timeout=30)
+        response = http_session.get(api_url, headers=headers, timeout=30)
         response.raise_for_status()
         
         # Try to parse response
@@ -439,7 +453,11 @@ async def main():
     console.print(
         f"\n[bold]Memulai pengetesan untuk {len(all_accounts)} akun unik...[/bold]"
     )
-    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TESTS)
+    semaphore = AdaptiveLimiter(
+        initial=INITIAL_CONCURRENT_TESTS,
+        min_limit=MIN_CONCURRENT_TESTS,
+        max_limit=MAX_CONCURRENT_TESTS,
+    )
 
     live_results = [
         {
@@ -458,15 +476,60 @@ async def main():
         for i, acc in enumerate(all_accounts)
     ]
 
+    fingerprints = [account_fingerprint(acc) for acc in all_accounts]
+    cached = get_cached_probe_results(fingerprints, PROBE_CACHE_TTL)
+    if cached:
+        console.print(f"💾 {sum(1 for fp in fingerprints if fp in cached)} akun memakai hasil cache")
+
+    # Hasil dikumpulkan lewat on_result supaya tetap ada kalau run dibatalkan (Ctrl-C)
+    results = []
+    cancelled = False
+    loop = asyncio.get_running_loop()
     with Live(
         generate_table(live_results, 0), refresh_per_second=6, screen=True
     ) as live:
         frame = 0
-        results = await test_all_accounts(all_accounts, semaphore, live_results)
+        # Coordinator mode kalau PROBE_WORKERS diisi (lihat distributed.py)
+        run_task = asyncio.ensure_future(test_all_accounts(
+            all_accounts, semaphore, live_results,
+            probe_workers=get_worker_addresses(),
+            deadline=parse_deadline(os.getenv("TEST_DEADLINE")),
+            history=get_account_history(fingerprints),
+            cached=cached, on_result=results.append,
+            top_k=parse_top_k(os.getenv("TOP_K_PER_COUNTRY")),
+            # Circuit breaker per endpoint: open setelah N akun gagal connect, trial setelah X detik
+            circuit=parse_circuit(os.getenv("CIRCUIT_THRESHOLD"), os.getenv("CIRCUIT_HALF_OPEN_AFTER")),
+        ))
+
+        def handle_interrupt(signum, frame):
+            # Real geolocation (stage 2) jalan di thread executor: kill xray dulu, baru cancel task
+            kill_xray_processes()
+            loop.call_soon_threadsafe(run_task.cancel)
+
+        previous_handler = signal.signal(signal.SIGINT, handle_interrupt)
+        try:
+            await run_task
+        except asyncio.CancelledError:
+            cancelled = True
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
         for res in results:
             frame += 1
             live.update(generate_table(live_results, frame))
 
+    if cancelled:
+        # Termasuk akun yang sedang diverifikasi (stage 1 sudah menulis ✅ ke live_results)
+        finished = {res["index"] for res in results}
+        for res in live_results:
+            if res["index"] not in finished:
+                res["Status"] = "Cancelled"
+        console.print(f"\n🛑 Pengetesan dibatalkan, {len(results)}/{len(all_accounts)} akun sudah selesai dites.",
+                      style="bold yellow")
+
+    update_account_history(history_entries(res for res in results if not res.get("Cached")))
+    save_probe_results(probe_cache_entries(results))
+    purge_geo_cache()
+
     successful_accounts = [res for res in live_results if res["Status"] == "●"]
 
     if not successful_accounts:
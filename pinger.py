@@ -0,0 +1,201 @@
+"""
+In-process ICMP pinger (unprivileged datagram socket) pengganti subprocess `ping`
+Satu socket ICMP per event loop dipakai bersama oleh semua probe yang jalan concurrent,
+reply dicocokkan lewat sequence number. Kalau ICMP tidak diizinkan
+(net.ipv4.ping_group_range), otomatis fallback ke TCP connect RTT.
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import struct
+import threading
+import time
+import weakref
+
+from probe import tcp_probe
+from dns_resolver import is_ip, resolve_host
+
+PING_COUNT = 4
+PING_INTERVAL = 0.2  # detik, sama seperti `ping -i 0.2`
+PING_TIMEOUT = 2.0
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def build_echo_request(seq: int, payload: bytes = b"vortexvpn-ping") -> bytes:
+    """ICMP echo request; identifier diisi ulang oleh kernel untuk datagram socket"""
+    header = struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack("!BBHHH", _ICMP_ECHO_REQUEST, 0, checksum, 0, seq) + payload
+
+def summarize_rtts(rtts: list, count: int) -> dict:
+    """
+    Ubah list RTT (None = hilang) ke format yang sama dengan utils.get_network_stats:
+    {"Latency": ms, "Jitter": ms, "ICMP": "✔" / "received/count" / "Failed"}
+    """
+    result = {"Latency": -1, "Jitter": -1, "ICMP": "Failed"}
+    latencies = [rtt for rtt in rtts if rtt is not None]
+    if not latencies:
+        return result
+    result["Latency"] = round(statistics.mean(latencies))
+    if len(latencies) > 1:
+        jitters = [abs(latencies[i] - latencies[i-1]) for i in range(1, len(latencies))]
+        result["Jitter"] = round(statistics.mean(jitters))
+    else:
+        result["Jitter"] = 0
+    result["ICMP"] = "✔" if len(latencies) == count else f"{len(latencies)}/{count}"
+    return result
+
+class ICMPPinger:
+    """
+    Pinger async dengan satu ICMP datagram socket, terikat ke satu event loop
+    (pakai get_pinger() supaya tiap loop / thread punya pinger sendiri).
+    """
+
+    # Izin ICMP socket berlaku per proses: False di-share semua pinger supaya tidak dicoba ulang
+    icmp_available = None
+
+    def __init__(self, timeout: float = PING_TIMEOUT):
+        self.timeout = timeout
+        self._sock = None
+        self._loop = None  # weakref ke loop pemilik socket
+        self._waiters = {}  # seq -> (future, sent_at)
+        self._seq = os.getpid() & 0xFFFF
+
+    def _ensure_socket(self) -> bool:
+        if self._sock is not None:
+            return True
+        if self.icmp_available is False:
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except OSError as e:
+            print(f"⚠️ ICMP socket not permitted ({e}), using TCP RTT fallback")
+            ICMPPinger.icmp_available = False
+            return False
+        sock.setblocking(False)
+        loop.add_reader(sock.fileno(), self._on_readable)
+        self._sock = sock
+        self._loop = weakref.ref(loop)
+        self.icmp_available = True
+        return True
+
+    def close(self):
+        """Tutup socket; panggil dari thread loop pemiliknya"""
+        if self._sock is None:
+            return
+        loop = self._loop() if self._loop is not None else None
+        if loop is not None and not loop.is_closed():
+            loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        self._loop = None
+        self._waiters.clear()
+
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                data, _ = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            received_at = time.perf_counter()
+            # Datagram ICMP socket di Linux mengembalikan ICMP header tanpa IP header
+            if len(data) < 8 or data[0] != _ICMP_ECHO_REPLY:
+                continue
+            seq = struct.unpack("!H", data[6:8])[0]
+            waiter = self._waiters.pop(seq, None)
+            if waiter and not waiter[0].done():
+                waiter[0].set_result((received_at - waiter[1]) * 1000)
+
+    def _next_seq(self) -> int:
+        while True:
+            self._seq = (self._seq + 1) & 0xFFFF
+            if self._seq not in self._waiters:
+                return self._seq
+
+    async def _echo(self, ip: str, delay: float, timeout: float):
+        if delay:
+            await asyncio.sleep(delay)
+        seq = self._next_seq()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[seq] = (future, time.perf_counter())
+        try:
+            self._sock.sendto(build_echo_request(seq), (ip, 0))
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._waiters.pop(seq, None)
+
+    async def _tcp_echo(self, ip: str, port: int, delay: float, timeout: float):
+        if delay:
+            await asyncio.sleep(delay)
+        start_time = time.perf_counter()
+        is_conn, _ = await tcp_probe(ip, port, timeout=timeout)
+        return (time.perf_counter() - start_time) * 1000 if is_conn else None
+
+    async def ping(self, host: str, count: int = PING_COUNT,
+                   interval: float = PING_INTERVAL, port: int = 443,
+                   tcp_fallback: bool = True, timeout: float = None) -> dict:
+        """
+        Ping satu host, return dict Latency/Jitter/ICMP.
+        tcp_fallback=False: return None kalau ICMP tidak diizinkan (caller sudah punya TCP RTT).
+        timeout: batas tunggu reply per echo (default self.timeout).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        ip = host if is_ip(host) else await resolve_host(host)
+        if not ip:
+            return summarize_rtts([], count)
+
+        if self._ensure_socket():
+            echoes = [self._echo(ip, i * interval, timeout) for i in range(count)]
+        elif not tcp_fallback:
+            return None
+        else:
+            echoes = [self._tcp_echo(ip, port, i * interval, timeout) for i in range(count)]
+        rtts = await asyncio.gather(*echoes)
+        return summarize_rtts(list(rtts), count)
+
+    async def ping_many(self, hosts, count: int = PING_COUNT,
+                        interval: float = PING_INTERVAL, port: int = 443) -> dict:
+        """Ping banyak host sekaligus lewat socket yang sama, return {host: stats}"""
+        hosts = list(dict.fromkeys(hosts))
+        results = await asyncio.gather(
+            *(self.ping(host, count, interval, port) for host in hosts)
+        )
+        return dict(zip(hosts, results))
+
+# Satu pinger per event loop: socket + reader terikat ke loop yang membuatnya, jadi loop lain
+# (run_sync / get_network_stats di thread lain) tidak menutup socket milik loop utama
+_pingers = weakref.WeakKeyDictionary()
+_pingers_lock = threading.Lock()
+
+def get_pinger() -> ICMPPinger:
+    """Pinger milik event loop yang sedang jalan"""
+    loop = asyncio.get_running_loop()
+    with _pingers_lock:
+        pinger = _pingers.get(loop)
+        if pinger is None:
+            pinger = _pingers[loop] = ICMPPinger()
+    return pinger
+
+async def ping_host(host: str, count: int = PING_COUNT, port: int = 443,
+                    tcp_fallback: bool = True, timeout: float = None) -> dict:
+    return await get_pinger().ping(host, count=count, port=port, tcp_fallback=tcp_fallback,
+                                   timeout=timeout)
+
+async def ping_many(hosts, count: int = PING_COUNT, port: int = 443) -> dict:
+    return await get_pinger().ping_many(hosts, count=count, port=port)
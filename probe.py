@@ -0,0 +1,282 @@
+"""
+Async probe engine untuk testing akun VPN
+Semua probe non-blocking supaya semaphore di test_all_accounts benar-benar paralel
+"""
+
+import asyncio
+import base64
+import errno
+import hashlib
+import os
+import socket
+import ssl
+import time
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Jenis error probe (error_kind), dipakai retry policy di tester.test_account
+ERROR_TIMEOUT = "timeout"
+ERROR_REFUSED = "refused"
+ERROR_UNREACHABLE = "unreachable"
+ERROR_DNS = "dns"
+ERROR_RESET = "reset"
+ERROR_TLS = "tls"
+ERROR_HTTP = "http"
+ERROR_OTHER = "other"
+
+_UNREACHABLE_ERRNOS = {errno.ENETUNREACH, errno.EHOSTUNREACH, errno.EHOSTDOWN, errno.ENETDOWN}
+
+def classify_error(exc: BaseException) -> str:
+    """Map exception dari connect/handshake ke error_kind"""
+    if isinstance(exc, (asyncio.TimeoutError, socket.timeout)):
+        return ERROR_TIMEOUT
+    if isinstance(exc, socket.gaierror):
+        return ERROR_DNS
+    if isinstance(exc, ConnectionRefusedError):
+        return ERROR_REFUSED
+    if isinstance(exc, (ConnectionResetError, ConnectionAbortedError, BrokenPipeError)):
+        return ERROR_RESET
+    if isinstance(exc, ssl.SSLError):
+        return ERROR_TLS
+    if isinstance(exc, OSError) and exc.errno in _UNREACHABLE_ERRNOS:
+        return ERROR_UNREACHABLE
+    if isinstance(exc, OSError) and exc.errno == errno.ECONNREFUSED:
+        return ERROR_REFUSED
+    return ERROR_OTHER
+
+async def tcp_probe(host, port=443, timeout=5) -> tuple[bool, int]:
+    """
+    Versi async dari utils.is_alive: buka koneksi TCP dan ukur connect latency (ms).
+    Return (True, latency) kalau connect berhasil, (False, -1) kalau gagal.
+    """
+    result = await tcp_probe_detailed(host, port, timeout)
+    return result["ok"], result["tcp_ms"]
+
+async def tcp_probe_detailed(host, port=443, timeout=5) -> dict:
+    """Seperti tcp_probe tapi return dict ok/tcp_ms/error/error_kind"""
+    result = {"ok": False, "tcp_ms": -1, "error": None, "error_kind": None}
+    conn = await _connect(result, host, port, timeout)
+    if conn is None:
+        return result
+    result["ok"] = True
+    await _close(conn[1])
+    return result
+
+async def _close(writer):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (OSError, ssl.SSLError):
+        pass
+
+async def _connect(result: dict, host, port, timeout):
+    """TCP connect, isi result['tcp_ms'] / result['error']. Return (reader, writer) atau None."""
+    start_time = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, int(port)), timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        result["error"] = "tcp timeout"
+        result["error_kind"] = ERROR_TIMEOUT
+        return None
+    except (OSError, TypeError, ValueError) as e:
+        result["error"] = str(e) or e.__class__.__name__
+        result["error_kind"] = classify_error(e)
+        return None
+    result["tcp_ms"] = int((time.perf_counter() - start_time) * 1000)
+    return reader, writer
+
+async def _handshake(result: dict, writer, server_name, timeout, verify=True) -> bool:
+    """TLS handshake di atas koneksi yang sudah ada, isi result['tls_ms'] / ['cert_valid']."""
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    tls_start = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            writer.start_tls(context, server_hostname=server_name), timeout=timeout
+        )
+    except ssl.SSLCertVerificationError as e:
+        # Server menjawab handshake, tapi cert tidak valid untuk SNI ini
+        result["cert_valid"] = False
+        result["error"] = e.verify_message or "cert verify failed"
+        result["error_kind"] = ERROR_TLS
+        result["tls_ms"] = int((time.perf_counter() - tls_start) * 1000)
+        return False
+    except asyncio.TimeoutError:
+        result["error"] = "tls timeout"
+        result["error_kind"] = ERROR_TIMEOUT
+        return False
+    except (ssl.SSLError, OSError) as e:
+        result["error"] = str(e) or e.__class__.__name__
+        result["error_kind"] = classify_error(e)
+        return False
+    result["tls_ms"] = int((time.perf_counter() - tls_start) * 1000)
+    if verify:
+        result["cert_valid"] = True
+    return True
+
+async def tls_probe(host, port=443, server_name=None, timeout=5) -> dict:
+    """
+    TCP connect + TLS handshake dengan SNI akun, timing tiap tahap dipisah.
+    Return dict:
+      ok          -> True kalau server menyelesaikan handshake (termasuk cert tidak valid)
+      tcp_ms      -> TCP connect time
+      tls_ms      -> TLS handshake time
+      cert_valid  -> True/False (None kalau handshake tidak sampai tahap cert)
+      error       -> pesan error singkat atau None
+      error_kind  -> klasifikasi error (ERROR_TIMEOUT, ERROR_REFUSED, ...) atau None
+    """
+    result = {"ok": False, "tcp_ms": -1, "tls_ms": -1, "cert_valid": None,
+              "error": None, "error_kind": None}
+
+    conn = await _connect(result, host, port, timeout)
+    if conn is None:
+        return result
+    _, writer = conn
+
+    await _handshake(result, writer, server_name or host, timeout)
+    result["ok"] = result["cert_valid"] is not None
+    if result["ok"]:
+        result["error_kind"] = None
+
+    await _close(writer)
+    return result
+
+def _build_upgrade_request(path: str, host_header: str, key: str) -> bytes:
+    if not path.startswith("/"):
+        path = "/" + path
+    return (
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host_header}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "User-Agent: Mozilla/5.0\r\n"
+        "\r\n"
+    ).encode()
+
+async def ws_probe(host, port=443, path="/", host_header=None, server_name=None, timeout=5) -> dict:
+    """
+    WebSocket upgrade probe tanpa xray: TCP connect, TLS (kalau server_name diisi),
+    lalu HTTP/1.1 Upgrade ke path + Host akun dan cek `101 Switching Protocols`.
+    Return dict seperti tls_probe ditambah:
+      upgrade_ms  -> waktu dari kirim request sampai status line diterima
+      status_code -> HTTP status dari server (101 = backend WS hidup)
+    """
+    result = {
+        "ok": False, "tcp_ms": -1, "tls_ms": -1, "upgrade_ms": -1,
+        "cert_valid": None, "status_code": None, "error": None, "error_kind": None,
+    }
+
+    conn = await _connect(result, host, port, timeout)
+    if conn is None:
+        return result
+    reader, writer = conn
+
+    if server_name:
+        if not await _handshake(result, writer, server_name, timeout):
+            await _close(writer)
+            if result["cert_valid"] is not False:
+                return result
+            # Cert tidak valid (umum untuk SNI bug/CDN): ulangi tanpa verifikasi supaya
+            # upgrade tetap bisa dites, cert_valid tetap tercatat False
+            conn = await _connect(result, host, port, timeout)
+            if conn is None:
+                return result
+            reader, writer = conn
+            if not await _handshake(result, writer, server_name, timeout, verify=False):
+                await _close(writer)
+                return result
+            result["error_kind"] = None
+
+    key = base64.b64encode(os.urandom(16)).decode()
+    upgrade_start = time.perf_counter()
+    try:
+        writer.write(_build_upgrade_request(path or "/", host_header or server_name or host, key))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+        result["upgrade_ms"] = int((time.perf_counter() - upgrade_start) * 1000)
+        parts = status_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0].startswith("HTTP/") and parts[1].isdigit():
+            result["status_code"] = int(parts[1])
+        elif not status_line:
+            result["error"] = "connection closed before response"
+            result["error_kind"] = ERROR_RESET
+        else:
+            result["error"] = "invalid HTTP response"
+            result["error_kind"] = ERROR_HTTP
+
+        if result["status_code"] == 101:
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=timeout)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            expected = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+            result["ok"] = headers.get("sec-websocket-accept") == expected
+            if not result["ok"]:
+                result["error"] = "invalid Sec-WebSocket-Accept"
+                result["error_kind"] = ERROR_HTTP
+        elif result["status_code"] is not None:
+            result["error"] = f"HTTP {result['status_code']}"
+            result["error_kind"] = ERROR_HTTP
+    except asyncio.TimeoutError:
+        result["error"] = "upgrade timeout"
+        result["error_kind"] = ERROR_TIMEOUT
+    except (OSError, ssl.SSLError) as e:
+        result["error"] = str(e) or e.__class__.__name__
+        result["error_kind"] = classify_error(e)
+
+    await _close(writer)
+    return result
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    """Percentile dengan interpolasi linear (sorted_values tidak boleh kosong)"""
+    if len(sorted_values) == 1:
+        return sorted_values[0]
+    rank = (len(sorted_values) - 1) * percent / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+def latency_stats(rtts: list) -> dict:
+    """
+    Ringkas list RTT (ms, None = loss, urutan sesuai waktu kirim) ke
+    p50, p95, mean absolute jitter dan loss ratio.
+    """
+    received = [rtt for rtt in rtts if rtt is not None]
+    loss = round(1 - len(received) / len(rtts), 2) if rtts else 1.0
+    if not received:
+        return {"p50": -1, "p95": -1, "jitter": -1, "loss": loss}
+    ordered = sorted(received)
+    if len(received) > 1:
+        jitter = sum(abs(received[i] - received[i-1]) for i in range(1, len(received))) / (len(received) - 1)
+    else:
+        jitter = 0
+    return {
+        "p50": round(_percentile(ordered, 50)),
+        "p95": round(_percentile(ordered, 95)),
+        "jitter": round(jitter),
+        "loss": loss,
+    }
+
+async def sample_latency(host, port=443, samples=5, spacing=0.1, timeout=5) -> dict:
+    """
+    Ambil N sample TCP connect latency secara concurrent, start tiap sample
+    di-stagger `spacing` detik. Return latency_stats(...).
+    """
+    async def one_sample(i):
+        if i:
+            await asyncio.sleep(i * spacing)
+        start_time = time.perf_counter()
+        is_conn, _ = await tcp_probe(host, port, timeout=timeout)
+        return (time.perf_counter() - start_time) * 1000 if is_conn else None
+
+    rtts = await asyncio.gather(*(one_sample(i) for i in range(max(1, samples))))
+    return latency_stats(list(rtts))
@@ -10,13 +10,42 @@ import time
 import tempfile
 import os
 import re
-from utils import geoip_lookup
+import signal
+import threading
+from utils import geoip_lookup, run_sync, free_local_port
+from probe import sample_latency
+from dns_resolver import resolve_all_sync
+from geoip import default_geo_client
+
+# Proses xray yang sedang jalan, supaya bisa di-kill saat test run dibatalkan
+_xray_processes = set()
+_xray_lock = threading.Lock()
+
+def _kill_process_group(process):
+    """xray jalan di session / process group sendiri: kill seluruh group-nya"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    except AttributeError:
+        process.kill()  # Windows: tidak ada process group
+
+def kill_xray_processes() -> int:
+    """Kill semua proses xray yang masih jalan (stop_testing / Ctrl-C), return jumlahnya"""
+    with _xray_lock:
+        processes = list(_xray_processes)
+    for process in processes:
+        if process.poll() is None:
+            _kill_process_group(process)
+    return len(processes)
 
 class RealGeolocationTester:
     """Test VPN dengan actual connection untuk mendapatkan ISP asli"""
     
-    def __init__(self):
-        self.local_http_port = 10809
+    def __init__(self, local_http_port=None):
+        # Port inbound xray lokal; tiap proses xray yang jalan bersamaan (juga dari shard /
+        # worker lain di host yang sama) butuh port sendiri, jadi default-nya dipilih OS
+        self.local_http_port = local_http_port or free_local_port()
         self.test_url = 'https://www.google.com'
         self.geo_api_url = 'http://ip-api.com/json'
         self.timeout_seconds = 15
@@ -328,33 +357,8 @@ class RealGeolocationTester:
     def _resolve_domain_to_best_ip(self, domain):
         """TES8 METHOD: Resolve domain ke IP dan pilih yang terbaik (avoid CDN)"""
         try:
-            import socket
-            
-            # Get all IPs untuk domain
-            all_ips = []
-            try:
-                # Standard resolution
-                ip = socket.gethostbyname(domain)
-                all_ips.append(ip)
-            except:
-                pass
-            
-            # Try with different DNS (if dig available) - TES8 enhancement
-            try:
-                result = subprocess.run(
-                    ['dig', '+short', domain], 
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n'):
-                        line = line.strip()
-                        if line and self._is_valid_ip(line):
-                            all_ips.append(line)
-            except:
-                pass
-            
-            # Remove duplicates
-            unique_ips = list(set(all_ips))
+            # Get all IPs untuk domain (shared cached resolver)
+            unique_ips = resolve_all_sync(domain)
             
             if not unique_ips:
                 return None
@@ -404,17 +408,11 @@ class RealGeolocationTester:
             return False
     
     def _get_geo_data_direct(self, ip):
-        """Get geolocation data untuk specific IP"""
-        try:
-            result = subprocess.run(
-                ['curl', '-s', f"{self.geo_api_url}/{ip}"],
-                capture_output=True, text=True, timeout=10
-            )
-            if result.returncode == 0:
-                return json.loads(result.stdout)
-        except Exception:
-            pass
-        return None
+        """
+        Get geolocation data untuk specific IP. Lewat shared GeoClient (cache, singleflight,
+        rate limit ip-api) supaya scoring banyak kandidat IP tidak fork curl per IP.
+        """
+        return default_geo_client.lookup_raw(ip)
     
     def _get_geo_data(self, target):
         """Enhanced geolocation dengan IP resolution untuk domain"""
@@ -463,59 +461,15 @@ class RealGeolocationTester:
             return None
     
     def _get_all_domain_ips(self, domain):
-        """TES8: Get all possible IPs untuk domain dengan multiple methods"""
-        all_ips = []
-        
+        """TES8: Get all possible IPs untuk domain (system resolver + multiple DNS servers, cached)"""
         try:
-            import socket
-            
-            # Method 1: Standard resolution
-            try:
-                ip = socket.gethostbyname(domain)
-                all_ips.append(ip)
-                print(f"🔍 TES8: Standard DNS → {ip}")
-            except:
-                pass
-            
-            # Method 2: dig command (if available)
-            try:
-                result = subprocess.run(
-                    ['dig', '+short', domain], 
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    for line in result.stdout.strip().split('\n'):
-                        line = line.strip()
-                        if line and self._is_valid_ip(line):
-                            all_ips.append(line)
-                            print(f"🔍 TES8: dig DNS → {line}")
-            except:
-                pass
-            
-            # Method 3: Try different DNS servers (TES8 enhancement)
-            for dns_server in ['8.8.8.8', '1.1.1.1']:
-                try:
-                    result = subprocess.run(
-                        ['nslookup', domain, dns_server],
-                        capture_output=True, text=True, timeout=5
-                    )
-                    if result.returncode == 0:
-                        # Parse nslookup output untuk IP
-                        import re
-                        ips = re.findall(r'\b(?:\d{1,3}\.){3}\d{1,3}\b', result.stdout)
-                        for ip in ips:
-                            if ip not in ['127.0.0.1', '8.8.8.8', '1.1.1.1'] and self._is_valid_ip(ip):
-                                all_ips.append(ip)
-                                print(f"🔍 TES8: nslookup @{dns_server} → {ip}")
-                except:
-                    pass
-            
+            all_ips = resolve_all_sync(domain)
+            for ip in all_ips:
+                print(f"🔍 TES8: DNS → {ip}")
+            return all_ips
         except Exception as e:
             print(f"❌ TES8: DNS resolution error: {e}")
-        
-        # Remove duplicates and return
-        unique_ips = list(set(all_ips))
-        return unique_ips
+            return []
     
     def _select_best_ip_with_geo(self, ip_list, original_domain):
         """TES8: Select best IP berdasarkan geolocation scoring"""
@@ -622,35 +576,10 @@ class RealGeolocationTester:
     def _measure_latency_and_jitter(self, ip, port=443, timeout=5, samples=3):
         """
         USER REQUEST: Measure actual latency and jitter to detected IP instead of hardcoding 0
+        Sample diambil concurrent (probe.sample_latency), bukan satu per satu
         """
-        import socket
-        import time
-        import statistics
-        
-        latencies = []
-        
-        for _ in range(samples):
-            try:
-                start_time = time.time()
-                with socket.create_connection((ip, port), timeout=timeout):
-                    latency = (time.time() - start_time) * 1000
-                    latencies.append(latency)
-            except (socket.timeout, ConnectionRefusedError, OSError, TypeError):
-                continue
-        
-        if latencies:
-            avg_latency = int(statistics.mean(latencies))
-            
-            # Calculate jitter if multiple samples
-            if len(latencies) > 1:
-                jitters = [abs(latencies[i] - latencies[i-1]) for i in range(1, len(latencies))]
-                avg_jitter = int(statistics.mean(jitters))
-            else:
-                avg_jitter = 0
-                
-            return avg_latency, avg_jitter
-        else:
-            return -1, -1  # All connections failed
+        stats = run_sync(sample_latency(ip, port, samples=samples, timeout=timeout))
+        return stats["p50"], stats["jitter"]  # (-1, -1) kalau semua koneksi gagal
 
     def _get_real_vpn_ip_from_infrastructure(self, account, cleaned_target):
         """
@@ -745,8 +674,6 @@ class RealGeolocationTester:
         Bypass CDN avoidance when user specifically needs domain testing
         """
         try:
-            import socket
-            
             # Direct domain resolution (no CDN avoidance)
             if self._is_valid_ip(target):
                 print(f"🔍 Direct IP lookup (bypass CDN check): {target}")
@@ -754,7 +681,10 @@ class RealGeolocationTester:
             else:
                 print(f"🔍 Force domain resolution (bypass CDN check): {target}")
                 # Get first available IP (no scoring)
-                ip = socket.gethostbyname(target)
+                ips = resolve_all_sync(target)
+                if not ips:
+                    raise ValueError(f"cannot resolve {target}")
+                ip = ips[0]
                 print(f"🔍 Force resolved {target} → {ip}")
                 return self._get_geo_data_direct(ip)
                 
@@ -784,9 +714,16 @@ class RealGeolocationTester:
                 xray_process = subprocess.Popen(
                     [self.xray_path, '-c', temp_config],
                     stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
+                    stderr=subprocess.DEVNULL,
+                    start_new_session=True
                 )
+                with _xray_lock:
+                    _xray_processes.add(xray_process)
                 time.sleep(2)  # Wait for startup
+                if xray_process.poll() is not None:
+                    # Xray gagal start (mis. port dipakai proses lain): jangan curl lewat port
+                    # itu, bisa jadi yang menjawab xray milik akun lain
+                    return {'success': False, 'error': 'Xray exited on startup', 'method': 'proxy'}
                 
                 # Test connection
                 proxy_arg = f"http://127.0.0.1:{self.local_http_port}"
@@ -823,7 +760,11 @@ class RealGeolocationTester:
             finally:
                 # Cleanup
                 if 'xray_process' in locals():
-                    xray_process.kill()
+                    if xray_process.poll() is None:
+                        _kill_process_group(xray_process)
+                    xray_process.wait()
+                    with _xray_lock:
+                        _xray_processes.discard(xray_process)
                 os.unlink(temp_config)
                 
         except Exception as e:
@@ -832,12 +773,12 @@ class RealGeolocationTester:
         return {'success': False, 'error': 'Connection failed', 'method': 'proxy'}
 
 # Integration function untuk existing tester
-def get_real_geolocation(account):
+def get_real_geolocation(account, local_http_port=None):
     """
     Integration function yang bisa dipanggil dari tester.py
     Implements user's proven method untuk real ISP detection
     """
-    tester = RealGeolocationTester()
+    tester = RealGeolocationTester(local_http_port)
     result = tester.test_real_location(account)
     
     if result.get('success'):
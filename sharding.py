@@ -0,0 +1,195 @@
+"""
+Multi-process sharded runner untuk test_all_accounts
+Untuk subscription puluhan ribu akun satu event loop mentok di satu core
+(JSON, regex parsing, geo scoring). Akun dibagi ke beberapa proses worker,
+masing-masing dengan event loop dan AdaptiveLimiter sendiri; hasil dikirim
+balik ke parent lewat multiprocessing.Queue begitu akun selesai dites.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+
+from concurrency import AdaptiveLimiter, CircuitBreaker
+
+# Di bawah jumlah ini overhead spawn proses lebih besar dari manfaatnya
+SHARD_MIN_ACCOUNTS = 2000
+SHARD_POLL_INTERVAL = 0.5  # detik, interval cek worker yang mati
+SHARD_PROGRESS_INTERVAL = 1.0  # detik, interval kirim progress per stage ke parent
+
+def default_worker_count(account_count: int) -> int:
+    """1 (tanpa sharding) untuk list kecil, selain itu satu worker per core"""
+    if account_count < SHARD_MIN_ACCOUNTS:
+        return 1
+    return max(1, min(os.cpu_count() or 1, account_count // (SHARD_MIN_ACCOUNTS // 2)))
+
+def shard_accounts(accounts: list, workers: int) -> list:
+    """
+    Bagi akun ke `workers` shard, return list of [(global_index, account), ...].
+    Akun dengan kandidat target identik masuk shard yang sama supaya
+    grouping per endpoint di test_all_accounts tetap berlaku di dalam shard.
+    """
+    from tester import get_target_candidates
+
+    shards = [[] for _ in range(workers)]
+    assigned = {}
+    for i, account in enumerate(accounts):
+        key = tuple(get_target_candidates(account))
+        if key not in assigned:
+            # Round-robin per endpoint unik supaya beban shard seimbang
+            assigned[key] = len(assigned) % workers
+        shards[assigned[key]].append((i, account))
+    return [shard for shard in shards if shard]
+
+def limiter_config(semaphore) -> dict:
+    """Ambil konfigurasi limit dari semaphore parent untuk limiter tiap worker"""
+    if isinstance(semaphore, AdaptiveLimiter):
+        return {"initial": semaphore.limit, "min_limit": semaphore.min_limit,
+                "max_limit": semaphore.max_limit}
+    value = getattr(semaphore, "_value", 5)
+    return {"initial": value, "min_limit": value, "max_limit": value}
+
+def _on_terminate(signum, frame):
+    """SIGTERM dari parent (run dibatalkan): xray anak worker ini jangan ditinggal jalan"""
+    from tester import kill_verification_processes
+    kill_verification_processes()
+    os._exit(1)
+
+def _shard_worker(worker_id: int, shard: list, results_queue, config: dict, deadline=None,
+                  history=None, verify=True, circuit_config=None):
+    """Entry point proses worker (harus top-level supaya bisa di-pickle oleh spawn)"""
+    signal.signal(signal.SIGTERM, _on_terminate)
+    try:
+        asyncio.run(_run_shard(worker_id, shard, results_queue, config, deadline, history,
+                               verify, circuit_config))
+        results_queue.put(("done", worker_id, None))
+    except Exception as e:
+        results_queue.put(("error", worker_id, str(e)))
+
+async def _run_shard(worker_id: int, shard: list, results_queue, config: dict, deadline=None,
+                     history=None, verify=True, circuit_config=None):
+    from core import test_all_accounts, progress_snapshot
+
+    accounts = [account for _, account in shard]
+    global_indices = [index for index, _ in shard]
+    live_results = [
+        {"index": i, "OriginalAccount": account, "VpnType": account.get("type", "N/A"),
+         "OriginalTag": account.get("tag", "proxy"), "Status": "WAIT"}
+        for i, account in enumerate(accounts)
+    ]
+
+    def forward(result):
+        # OriginalAccount tidak dikirim balik: parent sudah punya, hemat pickle
+        payload = {k: v for k, v in result.items() if k != "OriginalAccount"}
+        payload["index"] = global_indices[result["index"]]
+        if "Shared Probe" in payload:
+            payload["Shared Probe"] = global_indices[payload["Shared Probe"]]
+        payload["Worker"] = f"shard-{worker_id}"
+        results_queue.put(("result", worker_id, payload))
+
+    progress = {}
+
+    async def report_progress():
+        last = None
+        while True:
+            await asyncio.sleep(SHARD_PROGRESS_INTERVAL)
+            snapshot = progress_snapshot(progress)
+            if snapshot != last:
+                results_queue.put(("progress", worker_id, snapshot))
+                last = snapshot
+
+    reporter = asyncio.ensure_future(report_progress())
+    try:
+        await test_all_accounts(accounts, AdaptiveLimiter(**config), live_results,
+                                workers=1, on_result=forward, deadline=deadline, history=history,
+                                circuit=CircuitBreaker(**(circuit_config or {})),
+                                verify=verify, progress=progress)
+    finally:
+        reporter.cancel()
+    results_queue.put(("progress", worker_id, progress_snapshot(progress)))
+
+async def test_all_accounts_sharded(accounts: list, semaphore, live_results, workers: int,
+                                    on_result=None, deadline=None, history=None, verify=True,
+                                    progress=None, circuit=None) -> list:
+    """
+    Jalankan test_all_accounts di `workers` proses dan merge hasilnya ke live_results
+    (di parent) begitu tiap akun selesai. Akun milik worker yang crash ditandai ❌.
+    deadline (detik), verify, konfigurasi circuit dan history (hanya entry milik shard tsb)
+    diteruskan ke tiap worker; progress per stage dari semua worker dijumlahkan ke dict `progress`.
+    """
+    from core import account_fingerprint, merge_progress
+
+    shards = shard_accounts(accounts, workers)
+    config = limiter_config(semaphore)
+    circuit_config = circuit.config() if circuit is not None else None
+    # spawn, bukan fork: parent (Flask-SocketIO) multi-thread
+    context = multiprocessing.get_context("spawn")
+    results_queue = context.Queue()
+    processes = {}
+    for worker_id, shard in enumerate(shards):
+        shard_history = None
+        if history:
+            fingerprints = (account_fingerprint(account) for _, account in shard)
+            shard_history = {fp: history[fp] for fp in fingerprints if fp in history}
+        process = context.Process(target=_shard_worker,
+                                  args=(worker_id, shard, results_queue, config, deadline,
+                                        shard_history, verify, circuit_config),
+                                  daemon=True)
+        process.start()
+        processes[worker_id] = process
+    print(f"🧩 Sharded {len(accounts)} accounts across {len(shards)} worker processes")
+
+    pending = {worker_id: {index for index, _ in shard} for worker_id, shard in enumerate(shards)}
+    running = set(processes)
+    results = []
+    shard_progress = {}
+    loop = asyncio.get_running_loop()
+
+    def merge(result):
+        index = result["index"]
+        result["OriginalAccount"] = accounts[index]
+        live_results[index].update(result)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+
+    try:
+        while running:
+            try:
+                kind, worker_id, payload = await loop.run_in_executor(
+                    None, results_queue.get, True, SHARD_POLL_INTERVAL
+                )
+            except queue_module.Empty:
+                # Worker mati tanpa pesan done/error (OOM, SIGKILL)
+                for worker_id in list(running):
+                    if not processes[worker_id].is_alive():
+                        print(f"💥 Shard worker {worker_id} exited with code "
+                              f"{processes[worker_id].exitcode}")
+                        running.discard(worker_id)
+                continue
+
+            if kind == "result":
+                pending[worker_id].discard(payload["index"])
+                merge(payload)
+            elif kind == "progress":
+                shard_progress[worker_id] = payload
+                if progress is not None:
+                    merge_progress(progress, shard_progress.values())
+            else:
+                if kind == "error":
+                    print(f"💥 Shard worker {worker_id} failed: {payload}")
+                running.discard(worker_id)
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+            process.join(timeout=1)
+
+    # Akun yang tidak pernah dilaporkan (worker crash) tetap harus punya status final
+    for worker_id, indices in pending.items():
+        for index in sorted(indices):
+            merge({"index": index, "Status": "❌", "Error": "worker crashed",
+                   "Worker": f"shard-{worker_id}"})
+    return results
@@ -206,6 +206,11 @@ function initializeSocket() {
         showToast('Testing Error', data.message, 'error');
         hideTestingProgress();
     });
+    
+    socket.on('testing_stopping', function(data) {
+        updateStatus('Stopping tests...', 'info');
+        showToast('Stopping', data.message, 'warning');
+    });
 }
 
 // USER REQUEST: Navigation functions removed - single page layout only
@@ -240,6 +245,9 @@ function setupFormHandlers() {
     // Add links and test
     document.getElementById('add-and-test-btn').addEventListener('click', addLinksAndTest);
     
+    // Stop testing (partial results tetap disimpan)
+    document.getElementById('stop-testing-btn').addEventListener('click', stopTesting);
+    
     // Smart detection preview
     document.getElementById('vpn-links').addEventListener('input', function() {
         updateSmartDetectionPreview(this.value);
@@ -742,14 +750,38 @@ function startTesting() {
     
     showTestingProgress();
     
-    // Start testing via Socket.IO
-    console.log('📡 DEBUG: Emitting start_testing to backend...');
-    socket.emit('start_testing');
+    // Start testing via Socket.IO, opsi run (deadline/top-K/cache) ikut dikirim
+    const options = getTestOptions();
+    console.log('📡 DEBUG: Emitting start_testing to backend...', options);
+    socket.emit('start_testing', options);
     console.log('📡 DEBUG: start_testing emitted successfully');
 }
 
+// Opsi run dari form Test Options; field kosong = default backend (env / tanpa limit)
+function getTestOptions() {
+    const options = {
+        use_cache: document.getElementById('test-use-cache').checked
+    };
+    const deadline = parseInt(document.getElementById('test-deadline').value, 10);
+    if (deadline > 0) {
+        options.deadline = deadline;
+    }
+    const topK = parseInt(document.getElementById('test-top-k').value, 10);
+    if (topK > 0) {
+        options.top_k = topK;
+    }
+    return options;
+}
+
+function stopTesting() {
+    console.log('📡 DEBUG: Emitting stop_testing to backend...');
+    document.getElementById('stop-testing-btn').disabled = true;
+    socket.emit('stop_testing');
+}
+
 // Show testing progress UI
 function showTestingProgress() {
+    document.getElementById('stop-testing-btn').disabled = false;
     document.getElementById('testing-progress').style.display = 'block';
     document.getElementById('live-results').style.display = 'block';
     
@@ -803,7 +835,14 @@ function updateTestingProgress(data) {
     updateProgressBar(percentage);
     
     // Update progress text
-    document.getElementById('progress-text').textContent = `${completed} / ${total} accounts tested`;
+    const concurrencyInfo = data.concurrency ? ` (${data.concurrency.limit} parallel)` : '';
+    const cachedInfo = data.cached ? `, ${data.cached} cached` : '';
+    // Progress per stage pipeline: reachability semua akun, verification hanya yang lolos
+    const stages = data.stages || {};
+    const stageInfo = stages.reachability
+        ? ` · reach ${stages.reachability.done}/${stages.reachability.total}, verify ${stages.verification.done}/${stages.verification.total}`
+        : '';
+    document.getElementById('progress-text').textContent = `${completed} / ${total} accounts tested${cachedInfo}${stageInfo}${concurrencyInfo}`;
     document.getElementById('progress-percent').textContent = `${percentage}%`;
     
     // Count stats - use emoji status
@@ -823,9 +862,15 @@ function updateTestingProgress(data) {
 function handleTestingComplete(data) {
     console.log('🎯 DEBUG: handleTestingComplete called with:', data);
     
-    updateStatus(`Testing complete: ${data.successful}/${data.total} successful`, 'success');
+    document.getElementById('stop-testing-btn').disabled = true;
     
-    showToast('Testing Complete', `${data.successful} out of ${data.total} accounts passed`, 'success');
+    if (data.cancelled) {
+        updateStatus(`Testing stopped: ${data.successful}/${data.total} successful`, 'warning');
+        showToast('Testing Stopped', `${data.successful} accounts passed before the run was stopped`, 'warning');
+    } else {
+        updateStatus(`Testing complete: ${data.successful}/${data.total} successful`, 'success');
+        showToast('Testing Complete', `${data.successful} out of ${data.total} accounts passed`, 'success');
+    }
     
     testResults = data.results;
     
@@ -1069,6 +1114,12 @@ function createAnimatedStatus(status, isActive) {
         return `<span class="status-dot success-dot" title="Success"></span>`;
     } else if (status.includes('Timeout') || status.includes('timeout')) {
         return `<span class="status-dot timeout-dot" title="Timeout"></span>`;
+    } else if (status === 'Skipped-TopK') {
+        return `<span class="status-dot waiting-dot" title="Skipped: enough working accounts for this country"></span>`;
+    } else if (status === 'Cancelled') {
+        return `<span class="status-dot waiting-dot" title="Cancelled"></span>`;
+    } else if (status.includes('Circuit')) {
+        return `<span class="status-dot dead-dot" title="Skipped: endpoint failing (circuit open)"></span>`;
     } else if (status.includes('Dead') || status.includes('dead') || status.includes('unreachable')) {
         return `<span class="status-dot dead-dot" title="Dead"></span>`;
     } else if (status.startsWith('✖') || status.includes('Failed') || status.includes('Error') || status.includes('failed')) {
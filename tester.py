@@ -1,11 +1,35 @@
 import asyncio
-import socket
+import random
 import re
-from utils import is_alive, geoip_lookup, get_network_stats
+from utils import geoip_lookup_async
+from probe import (
+    tcp_probe, tcp_probe_detailed, tls_probe, ws_probe, sample_latency,
+    ERROR_TIMEOUT, ERROR_RESET, ERROR_OTHER
+)
+from dns_resolver import is_ip, resolve_host
+from pinger import ping_host
+from concurrency import AdaptiveLimiter
 from converter import extract_ip_port_from_path
 
 MAX_RETRIES = 3
-RETRY_DELAY = 1.5  # detik
+RETRY_BACKOFF_BASE = 0.5  # detik, delay retry pertama (sebelum jitter)
+RETRY_BACKOFF_MAX = 4.0  # detik
+# Hanya error sementara yang layak di-retry; refused/unreachable/dns/tls/http langsung Dead
+RETRYABLE_ERRORS = (ERROR_TIMEOUT, ERROR_RESET, ERROR_OTHER)
+RACE_STAGGER = 0.25  # detik, jeda start antar kandidat (host → sni → server)
+RACE_TIMEOUT = 3  # detik, connect timeout per kandidat saat race
+LATENCY_SAMPLES = 5  # jumlah sample latency per akun yang reachable
+ICMP_PING_COUNT = 3  # echo ICMP per akun ✅ (hanya untuk field ICMP)
+ICMP_PING_TIMEOUT = 1.0  # detik per echo; ICMP yang di-filter tidak menahan hasil lama
+SAMPLE_SPACING = 0.1  # detik, jeda start antar sample
+PROBE_TIMEOUT = 5  # detik per tahap probe (TCP / TLS / upgrade)
+# Real geolocation (xray + curl) butuh ~15s; dilewati kalau sisa deadline run kurang dari ini
+REAL_GEO_MIN_BUDGET = 20  # detik
+# Stage 2 (verifikasi real geolocation) punya limit sendiri: satu proses xray per slot
+VERIFY_CONCURRENCY = 4
+BUDGET_STATUS = "Timeout-Budget"
+# Akun yang dilewati karena endpoint-nya sudah terbukti mati (lihat concurrency.CircuitBreaker)
+CIRCUIT_STATUS = "Circuit-Open"
 
 def get_first_nonempty(*args):
     for x in args:
@@ -13,12 +37,92 @@ def get_first_nonempty(*args):
             return x
     return None
 
-def get_test_target(account):
+def get_tls_server_name(account):
+    """Return SNI untuk TLS probe, atau None kalau akun tidak pakai TLS"""
+    tls = account.get("tls")
+    if isinstance(tls, dict) and tls.get("enabled"):
+        return tls.get("server_name") or tls.get("sni") or account.get("server")
+    # Shadowsocks v2ray-plugin: "tls" dan "sni=..." ada di plugin_opts
+    plugin_opts = account.get("plugin_opts") or ""
+    opts = plugin_opts.split(";") if isinstance(plugin_opts, str) else []
+    if "tls" in opts:
+        for prefix in ("sni=", "host="):
+            for opt in opts:
+                if opt.startswith(prefix) and opt[len(prefix):]:
+                    return opt[len(prefix):]
+        return account.get("server")
+    return None
+
+def get_ws_params(account):
+    """Return (path, Host header) untuk WebSocket upgrade probe, atau None kalau bukan ws"""
+    transport = account.get("transport")
+    if isinstance(transport, dict) and transport.get("type") == "ws":
+        headers = transport.get("headers") or {}
+        return transport.get("path") or "/", headers.get("Host") or account.get("server")
+    # Shadowsocks v2ray-plugin (mode websocket): path=/host= di plugin_opts
+    plugin_opts = account.get("plugin_opts") or ""
+    opts = dict(
+        opt.split("=", 1) for opt in plugin_opts.split(";") if "=" in opt
+    ) if isinstance(plugin_opts, str) else {}
+    if "path" in opts:
+        return opts["path"] or "/", opts.get("host") or account.get("server")
+    return None
+
+async def probe_target(test_ip, test_port, tls_sni=None, ws_params=None, timeout=5):
+    """
+    Pilih probe termurah yang masih bermakna untuk akun:
+    - ws transport  -> ws_probe (TLS kalau aktif + HTTP Upgrade, cek 101)
+    - TLS saja      -> tls_probe (handshake dengan SNI akun)
+    - selain itu    -> tcp_probe
+    Return (is_conn, latency, probe_fields, probe_kind, error)
+    error = (error_kind, pesan) kalau gagal, None kalau sukses
+    """
+    if ws_params:
+        path, host_header = ws_params
+        ws_result = await ws_probe(test_ip, test_port, path=path, host_header=host_header,
+                                   server_name=tls_sni, timeout=timeout)
+        probe_fields = {
+            "TCP Latency": ws_result["tcp_ms"],
+            "WS Upgrade": ws_result["upgrade_ms"],
+            "WS Status": ws_result["status_code"],
+        }
+        if tls_sni:
+            probe_fields["TLS Handshake"] = ws_result["tls_ms"]
+            probe_fields["Cert Valid"] = ws_result["cert_valid"]
+        return ws_result["ok"], ws_result["tcp_ms"], probe_fields, "WS", _probe_error(ws_result)
+
+    if tls_sni:
+        tls_result = await tls_probe(test_ip, test_port, server_name=tls_sni, timeout=timeout)
+        probe_fields = {
+            "TCP Latency": tls_result["tcp_ms"],
+            "TLS Handshake": tls_result["tls_ms"],
+            "Cert Valid": tls_result["cert_valid"],
+        }
+        return tls_result["ok"], tls_result["tcp_ms"], probe_fields, "TLS", _probe_error(tls_result)
+
+    tcp_result = await tcp_probe_detailed(test_ip, test_port, timeout=timeout)
+    return tcp_result["ok"], tcp_result["tcp_ms"], {}, "TCP", _probe_error(tcp_result)
+
+def _probe_error(probe_result):
+    if probe_result["ok"]:
+        return None
+    return probe_result["error_kind"] or ERROR_OTHER, probe_result["error"]
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff dengan jitter (equal jitter): 0.5s, 1s, 2s, ... maks RETRY_BACKOFF_MAX"""
+    delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def get_target_candidates(account):
+    """
+    Return list kandidat target (label, host, port) sesuai prioritas:
+    IP dari path, lalu host, sni, server.
+    """
     # 1. Coba IP dari path (support SS dan WS path untuk semua protokol)
     path_str = account.get("_ss_path") or account.get("_ws_path") or ""
     target_ip, target_port = extract_ip_port_from_path(path_str)
     if target_ip:
-        return target_ip, target_port or 443, "path"
+        return [("path", target_ip, target_port or 443)]
 
     # 2. Fallback ke host/sni/server_name/server
     # Ambil host dari WebSocket headers
@@ -33,33 +137,193 @@ def get_test_target(account):
         sni = account["tls"].get("sni") or account["tls"].get("server_name")
 
     server = account.get("server")
+    port = account.get("server_port", 443)
     # Jika host/sni/server_name == server, tetap test (tidak hapus)
     candidates = []
     # Jangan ulangi value
     if host and host != server:
-        candidates.append(("host", host))
+        candidates.append(("host", host, port))
     if sni and sni != server and sni != host:
-        candidates.append(("sni", sni))
+        candidates.append(("sni", sni, port))
     if server:
-        candidates.append(("server", server))
+        candidates.append(("server", server, port))
+    return candidates
 
-    for label, cand in candidates:
-        # Cek apakah cand adalah IP, kalau ya langsung
-        try:
-            socket.inet_aton(cand)
-            return cand, account.get("server_port", 443), label
-        except Exception:
-            pass
-        # Kalau bukan IP, resolve ke IP
+async def _try_candidate(priority, label, cand, port, delay):
+    if delay:
+        await asyncio.sleep(delay)
+    # Kalau bukan IP, resolve ke IP (async + cached, tidak block event loop)
+    ip = cand if is_ip(cand) else await resolve_host(cand)
+    if not ip:
+        return None
+    is_conn, _ = await tcp_probe(ip, port, timeout=RACE_TIMEOUT)
+    return priority, ip, port, label, is_conn
+
+async def race_target_candidates(candidates, stagger: float = RACE_STAGGER):
+    """
+    Happy-eyeballs: resolve + connect semua kandidat concurrent, start di-stagger
+    sesuai prioritas. Kandidat pertama yang connect menang, sisanya di-cancel.
+    Kalau tidak ada yang connect, pakai kandidat prioritas tertinggi yang bisa di-resolve
+    (test_account yang akan menandai Dead/❌).
+    """
+    ip, port, label, _ = await race_target(candidates, stagger)
+    return ip, port, label
+
+async def race_target(candidates, stagger: float = RACE_STAGGER):
+    """
+    Seperti race_target_candidates, tapi return (ip, port, label, reachable).
+    reachable: True kalau ada kandidat yang connect, False kalau semua gagal,
+    None kalau tidak dites (hanya satu kandidat, cukup di-resolve).
+    """
+    if not candidates:
+        return None, None, None, None
+
+    if len(candidates) == 1:
+        label, cand, port = candidates[0]
+        ip = cand if is_ip(cand) else await resolve_host(cand)
+        return (ip, port, label, None) if ip else (None, None, None, None)
+
+    tasks = [
+        asyncio.ensure_future(_try_candidate(priority, label, cand, port, priority * stagger))
+        for priority, (label, cand, port) in enumerate(candidates)
+    ]
+    resolved = []
+    try:
+        for future in asyncio.as_completed(tasks):
+            attempt = await future
+            if attempt is None:
+                continue
+            priority, ip, port, label, is_conn = attempt
+            if is_conn:
+                print(f"🏁 Target race won by {label} ({ip}:{port})")
+                return ip, port, label, True
+            resolved.append(attempt)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    if resolved:
+        _, ip, port, label, _ = min(resolved)
+        return ip, port, label, False
+    # Jika tidak ada yang bisa, return None
+    return None, None, None, None
+
+async def get_test_target(account):
+    return await race_target_candidates(get_target_candidates(account))
+
+def fetch_real_geolocation(account, local_http_port=None):
+    """Real geolocation (xray/infrastructure), blocking; return field untuk result atau None"""
+    try:
+        from real_geolocation_tester import get_real_geolocation
+    except ImportError:
+        print("⚠️  Real geolocation tester not available, using basic lookup")
+        return None
+    real_geo = get_real_geolocation(account, local_http_port=local_http_port)
+    if not real_geo:
+        print("⚠️  Real geolocation failed, using basic lookup")
+        return None
+    # Latency/Jitter dari real geo diukur dengan cara lain (lewat proxy / 0 untuk
+    # domain lookup); simpan terpisah supaya ranking tetap pakai sample latency
+    proxy_latency = real_geo.pop("Latency", None)
+    real_geo.pop("Jitter", None)
+    if proxy_latency:
+        real_geo["Proxy Latency"] = int(proxy_latency)
+    print(f"✅ Real geolocation: {real_geo['Country']} - {real_geo['Provider']}")
+    return real_geo
+
+def apply_real_geolocation(account, result):
+    """Update result dengan real geolocation (xray/infrastructure) kalau tersedia"""
+    real_geo = fetch_real_geolocation(account)
+    if real_geo:
+        result.update(real_geo)
+
+def verify_slots(concurrency: int = VERIFY_CONCURRENCY) -> asyncio.Semaphore:
+    """Limit stage 2: jumlah proses xray yang boleh jalan bersamaan"""
+    return asyncio.Semaphore(max(1, concurrency))
+
+def kill_verification_processes() -> int:
+    """Kill proses xray stage 2 yang masih jalan di proses ini (run / verifikasi dibatalkan)"""
+    try:
+        from real_geolocation_tester import kill_xray_processes
+    except ImportError:
+        return 0
+    return kill_xray_processes()
+
+async def verify_account(account: dict, result: dict, slots: asyncio.Semaphore, deadline=None) -> dict:
+    """
+    Stage 2 pipeline: real geolocation (xray proxy test + curl + DNS) untuk akun yang
+    sudah lolos reachability (stage 1). Jalan di executor di bawah `slots`, jadi tidak
+    menahan slot semaphore stage 1 maupun event loop. Port inbound xray dipilih OS
+    (bind port 0) per verifikasi, sehingga shard / worker lain di host yang sama tidak bentrok.
+    """
+    loop = asyncio.get_running_loop()
+    async with slots:
+        if deadline is not None and deadline - loop.time() < REAL_GEO_MIN_BUDGET:
+            print(f"⏱️ Account {result['index']+1}: skipping real geolocation, run deadline too close")
+            return result
+        future = loop.run_in_executor(None, fetch_real_geolocation, account)
         try:
-            resolved_ip = socket.gethostbyname(cand)
-            return resolved_ip, account.get("server_port", 443), label
-        except Exception:
+            real_geo = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Thread executor tetap jalan sampai curl selesai: kill xray supaya cepat selesai.
+            # Owner loop menunggu thread-nya (shutdown_default_executor) sebelum loop ditutup
+            kill_verification_processes()
+            raise
+    if real_geo:
+        result.update(real_geo)
+    return result
+
+def circuit_keys(account, test_ip, test_port, test_source=None) -> list:
+    """
+    Key circuit breaker: ip:port yang dites dan hostname:port kandidat yang dites
+    (label test_source dari get_target_candidates, kalau hostname dan bukan IP).
+    Port ikut di key karena refused di satu port tidak berarti host-nya mati.
+    """
+    keys = [("ip", f"{test_ip}:{test_port}")]
+    for label, host, _ in get_target_candidates(account):
+        if label != test_source:
             continue
-    # Jika tidak ada yang bisa, return None
-    return None, None, None
+        host = str(host or "").lower()
+        if host and not is_ip(host):
+            keys.append(("host", f"{host}:{test_port}"))
+        break
+    return keys
+
+def mark_circuit_open(result: dict) -> dict:
+    """Tandai akun yang tidak diprobe karena circuit endpoint-nya open"""
+    result.update({
+        "Status": CIRCUIT_STATUS,
+        "TestType": "Circuit open (endpoint failing)",
+        "Error": "circuit-open",
+    })
+    return result
+
+def mark_budget_timeout(result: dict) -> dict:
+    """Tandai akun yang belum selesai saat deadline run habis"""
+    result.update({
+        "Status": BUDGET_STATUS,
+        "Latency": "Timeout",
+        "TestType": "Run deadline reached",
+    })
+    return result
+
+async def test_account(account: dict, semaphore: asyncio.Semaphore, index: int, live_results=None,
+                       target=None, retry_budget=None, deadline=None, circuit=None,
+                       verify=True) -> dict:
+    """
+    deadline: waktu event loop (loop.time()) batas run; probe timeout dan retry
+    dipotong supaya tidak melewatinya, real geolocation dilewati kalau waktunya tidak cukup.
+    circuit (CircuitBreaker) dibagi semua akun di run: TCP connect yang gagal dihitung
+    per IP/hostname, akun ke endpoint yang circuit-nya open langsung Circuit-Open.
+    verify=False: hanya stage 1 (reachability + latency + geoip); real geolocation
+    dijalankan terpisah lewat verify_account (lihat pipeline di core.iter_test_results).
+    """
+    loop = asyncio.get_running_loop()
+
+    def remaining():
+        return float("inf") if deadline is None else deadline - loop.time()
 
-async def test_account(account: dict, semaphore: asyncio.Semaphore, index: int, live_results=None) -> dict:
     tag = account.get('tag', 'proxy')
     vpn_type = account.get('type', 'N/A')
     print(f"🔍 DEBUG: test_account called for account {index}: {vpn_type} - {tag}")
@@ -70,20 +334,45 @@ async def test_account(account: dict, semaphore: asyncio.Semaphore, index: int,
         "OriginalAccount": account, "TestType": "N/A", "Retry": 0, "TimeoutCount": 0
     }
 
+    def circuit_open(test_ip, test_port):
+        mark_circuit_open(result)
+        print(f"⚡ Account {index+1} skipped: circuit open for {test_ip}:{test_port}")
+        if live_results is not None:
+            live_results[index].update(result)
+        return result
+
+    # Target sudah diketahui: akun di endpoint yang circuit-nya open gagal tanpa menunggu slot
+    if circuit is not None and target and target[0]:
+        if not circuit.would_allow(circuit_keys(account, *target)):
+            return circuit_open(target[0], target[1])
+
+    succeeded = False
     async with semaphore:
         # === LOGIKA BARU ===
-        test_ip, test_port, test_source = get_test_target(account)
+        # target bisa sudah di-resolve oleh test_all_accounts (grouping per endpoint)
+        test_ip, test_port, test_source = target if target else await get_test_target(account)
         if not test_ip:
+            # DNS gagal untuk semua kandidat: tidak ada gunanya retry
             result['Status'] = '❌'
+            result['Error'] = 'dns'
+            if live_results is not None:
+                live_results[index].update(result)
             return result
 
-        # USER REQUEST: Retry timeout 3x, then mark as dead
-        timeout_retries = 3
+        tls_sni = get_tls_server_name(account)
+        ws_params = get_ws_params(account)
+        keys = circuit_keys(account, test_ip, test_port, test_source)
+
         for attempt in range(MAX_RETRIES):
+            if remaining() <= 0:
+                break
+            # Izin attempt pertama bisa jadi trial half-open; retry berhenti kalau circuit terbuka
+            if circuit is not None and (circuit.is_open(keys) if attempt else not circuit.allow(keys)):
+                return circuit_open(test_ip, test_port)
             # Update status based on retry type
             if result['TimeoutCount'] > 0:
-                result['Status'] = f'Timeout Retry {result["TimeoutCount"]}/3'
-                print(f"🔄 DEBUG: Account {index} retrying timeout {result['TimeoutCount']}/3")
+                result['Status'] = f'Timeout Retry {result["TimeoutCount"]}/{MAX_RETRIES}'
+                print(f"🔄 DEBUG: Account {index} retrying timeout {result['TimeoutCount']}/{MAX_RETRIES}")
             else:
                 result['Status'] = '🔄'
                 print(f"🔄 DEBUG: Account {index} testing (attempt {attempt + 1})")
@@ -95,113 +384,110 @@ async def test_account(account: dict, semaphore: asyncio.Semaphore, index: int,
                 print(f"📊 DEBUG: Updated live_results for account {index} with status: {result['Status']}")
                 await asyncio.sleep(0.1)  # Small delay to allow emission
 
-            is_conn, latency = is_alive(test_ip, test_port, timeout=5)  # 5s timeout for better detection
+            # TCP connect saja hampir selalu sukses di belakang CDN, jadi akun TLS/ws
+            # dites sampai TLS handshake / WebSocket upgrade (5s timeout per tahap)
+            is_conn, latency, probe_fields, probe_kind, error = await probe_target(
+                test_ip, test_port, tls_sni=tls_sni, ws_params=ws_params,
+                timeout=max(0.5, min(PROBE_TIMEOUT, remaining()))
+            )
+            if isinstance(semaphore, AdaptiveLimiter):
+                # Refused/HTTP error bukan tanda overload, hanya timeout yang menurunkan limit
+                semaphore.record(timed_out=error is not None and error[0] == ERROR_TIMEOUT)
+            if circuit is not None:
+                # Hanya TCP connect yang menentukan hidup/mati endpoint; error TLS/HTTP
+                # bisa spesifik SNI atau path akun
+                if latency is not None and latency >= 0:
+                    circuit.record_success(keys)
+                else:
+                    circuit.record_failure(keys, index)
             
             if is_conn:
-                geo_info = geoip_lookup(test_ip)
+                # Multi-sample latency (concurrent) supaya ranking pakai angka yang stabil
+                stats = await sample_latency(test_ip, test_port, samples=LATENCY_SAMPLES,
+                                             spacing=SAMPLE_SPACING,
+                                             timeout=max(0.5, min(PROBE_TIMEOUT, remaining())))
+                geo_info = await geoip_lookup_async(test_ip)
                 result.update({
                     "Status": "✅",
-                    "TestType": f"{test_source.upper()} TCP",
+                    "TestType": f"{test_source.upper()} {probe_kind}",
                     "Tested IP": test_ip,
-                    "Latency": latency,
-                    "Jitter": 0,
-                    "ICMP": "✔",
+                    "Latency": stats["p50"] if stats["p50"] != -1 else latency,
+                    "Jitter": max(stats["jitter"], 0),
+                    "Latency P50": stats["p50"],
+                    "Latency P95": stats["p95"],
+                    "Loss": stats["loss"],
+                    **probe_fields,
                     **geo_info
                 })
+                result.pop("Error", None)
                 
                 # Enhance dengan real geolocation tester (user's proven method)
-                try:
-                    from real_geolocation_tester import get_real_geolocation
-                    real_geo = get_real_geolocation(account)
-                    if real_geo:
-                        # Update dengan real location data
-                        result.update(real_geo)
-                        print(f"✅ Real geolocation: {real_geo['Country']} - {real_geo['Provider']}")
-                    else:
-                        print("⚠️  Real geolocation failed, using basic lookup")
-                except ImportError:
-                    print("⚠️  Real geolocation tester not available, using basic lookup")
+                if verify and remaining() >= REAL_GEO_MIN_BUDGET:
+                    apply_real_geolocation(account, result)
+                elif verify:
+                    print(f"⏱️ Account {index+1}: skipping real geolocation, run deadline too close")
                 
-                # USER REQUEST: Progressive updates - update live_results with success status
-                if live_results is not None:
-                    live_results[index].update(result)
-                    print(f"✅ DEBUG: Account {index} completed successfully with status: {result['Status']}")
-                return result
-            else:
-                # Connection failed - could be timeout or other error
+                succeeded = True
+                break
+
+            error_kind, error_message = error
+            result['Error'] = error_kind
+            result.update(probe_fields)
+            if error_kind == ERROR_TIMEOUT:
                 result['TimeoutCount'] += 1
-                print(f"⚠️ Account {index+1} timeout {result['TimeoutCount']}/3 (attempt {attempt+1})")
+            print(f"⚠️ Account {index+1} {error_kind}: {error_message} (attempt {attempt+1}/{MAX_RETRIES})")
+
+            # Refused/unreachable/TLS/HTTP error deterministik: retry tidak akan mengubah hasil.
+            # Budget retry per run mencegah subscription yang mayoritas mati menahan slot lama.
+            if error_kind not in RETRYABLE_ERRORS:
+                reason = error_kind
+            elif attempt == MAX_RETRIES - 1:
+                reason = f"{MAX_RETRIES} attempts"
+            elif retry_budget is not None and not retry_budget.try_spend():
+                reason = "retry budget exhausted"
+            else:
+                reason = None
 
-            # USER REQUEST: After 3 timeouts, mark as dead and stop retrying
-            if result['TimeoutCount'] >= timeout_retries:
+            if reason:
                 result.update({
                     "Status": "Dead",
                     "Latency": "Dead", 
-                    "TestType": "Dead Connection",
+                    "TestType": f"Dead Connection ({error_kind})",
                     "ICMP": "Dead"
                 })
-                print(f"💀 Account {index+1} marked as DEAD after {timeout_retries} timeouts")
+                print(f"💀 Account {index+1} marked as DEAD ({reason})")
                 if live_results is not None:
                     live_results[index].update(result)
                     print(f"💀 DEBUG: Account {index} marked as DEAD with status: {result['Status']}")
                 return result
 
-            if attempt < MAX_RETRIES - 1:
-                result['Status'] = '🔁'
-                if live_results is not None:
-                    live_results[index].update(result)
-                    await asyncio.sleep(0)
-                await asyncio.sleep(RETRY_DELAY)
-
-        # Fallback ping jika TCP gagal semua
-        for attempt in range(MAX_RETRIES):
-            result['Status'] = '🔄'
-            result['Retry'] = attempt
+            delay = retry_delay(attempt)
+            if delay >= remaining():
+                break
+            result['Status'] = '🔁'
             if live_results is not None:
                 live_results[index].update(result)
-                await asyncio.sleep(0)  # yield to event loop
+                await asyncio.sleep(0)
+            await asyncio.sleep(delay)
 
-            stats = get_network_stats(test_ip)
-            if stats.get("Latency") != -1:
-                geo_info = geoip_lookup(test_ip)
-                result.update({
-                    "Status": "✅",
-                    "TestType": f"{test_source.upper()} Ping",
-                    "Tested IP": test_ip,
-                    **stats,
-                    **geo_info
-                })
-                
-                # Enhance dengan real geolocation tester (user's proven method)
-                try:
-                    from real_geolocation_tester import get_real_geolocation
-                    real_geo = get_real_geolocation(account)
-                    if real_geo:
-                        # Update dengan real location data
-                        result.update(real_geo)
-                        print(f"✅ Real geolocation: {real_geo['Country']} - {real_geo['Provider']}")
-                    else:
-                        print("⚠️  Real geolocation failed, using basic lookup")
-                except ImportError:
-                    print("⚠️  Real geolocation tester not available, using basic lookup")
-                
-                # Update live_results
-                if live_results is not None:
-                    live_results[index].update(result)
-                return result
+        if not succeeded:
+            # Keluar dari loop tanpa hasil final = deadline run habis
+            mark_budget_timeout(result)
+            print(f"⏱️ Account {index+1} stopped: run deadline reached")
 
-            if attempt < MAX_RETRIES - 1:
-                result['Status'] = '🔁'
-                result['Retry'] = attempt+1
-                if live_results is not None:
-                    live_results[index].update(result)
-                    await asyncio.sleep(0)
-                await asyncio.sleep(RETRY_DELAY)
+    if succeeded:
+        # ICMP ping di luar slot semaphore (timeout pendek): ICMP yang di-filter tidak
+        # menahan slot probe berikutnya. Jitter/Loss tetap dari TCP sample.
+        ping = await ping_host(test_ip, count=ICMP_PING_COUNT, port=test_port,
+                               tcp_fallback=False, timeout=ICMP_PING_TIMEOUT)
+        result["ICMP"] = ping["ICMP"] if ping is not None else "N/A"
+        # USER REQUEST: Progressive updates - update live_results with success status
+        if live_results is not None:
+            live_results[index].update(result)
+            print(f"✅ DEBUG: Account {index} completed successfully with status: {result['Status']}")
+        return result
 
-        # Semua cara sudah dicoba, masih gagal
-        result['Status'] = '❌'
-        result['Retry'] = MAX_RETRIES
     # Update live_results for failed case
     if live_results is not None:
         live_results[index].update(result)
-    return result
\ No newline at end of file
+    return result
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modul proyek ada di root repo (layout flat), dan database.py membuat tabel saat di-import:
+# arahkan ke database sementara sebelum modul apa pun di-import
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["VORTEXVPN_DB"] = os.path.join(tempfile.mkdtemp(prefix="vortexvpn-test-"), "test.db")
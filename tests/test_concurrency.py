@@ -0,0 +1,45 @@
+from concurrency import CircuitBreaker
+from core import parse_circuit
+
+KEYS = [("ip", "203.0.113.1:443")]
+
+def test_retries_of_one_account_do_not_open_the_circuit():
+    circuit = CircuitBreaker(threshold=3)
+    for _ in range(5):
+        circuit.record_failure(KEYS, 0)
+    assert not circuit.is_open(KEYS)
+
+    circuit.record_failure(KEYS, 1)
+    circuit.record_failure(KEYS, 2)
+    assert circuit.is_open(KEYS)
+
+def test_circuit_config_from_env_values():
+    circuit = parse_circuit("5", "0.5")
+    assert circuit.config() == {"threshold": 5, "half_open_after": 0.5}
+    assert parse_circuit("x", None).config() == CircuitBreaker().config()
+
+def test_half_open_trial_closes_or_keeps_the_circuit_open():
+    import time
+
+    circuit = CircuitBreaker(threshold=2, half_open_after=0.05)
+    circuit.record_failure(KEYS, 0)
+    circuit.record_failure(KEYS, 1)
+    assert circuit.is_open(KEYS) and not circuit.allow(KEYS)
+
+    # Half-open: satu trial boleh lewat, request lain ditolak selama trial berjalan
+    time.sleep(0.06)
+    assert circuit.would_allow(KEYS)
+    assert circuit.allow(KEYS)
+    assert not circuit.allow(KEYS)
+    circuit.record_success(KEYS)
+    assert not circuit.is_open(KEYS) and circuit.allow(KEYS)
+
+    # Trial yang gagal: circuit tetap open, tidak ada trial kedua
+    circuit.record_failure(KEYS, 2)
+    circuit.record_failure(KEYS, 3)
+    time.sleep(0.06)
+    assert circuit.allow(KEYS)
+    circuit.record_failure(KEYS, 2)
+    time.sleep(0.06)
+    assert not circuit.allow(KEYS)
+    assert circuit.snapshot()["open"] == 1
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from distributed import Coordinator
+from utils import free_local_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wait_until_listening(port, process, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"probe worker exited with code {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"probe worker on port {port} did not start")
+
+@pytest.fixture
+def workers():
+    """Dua probe worker lokal (proses terpisah, sama seperti `python distributed.py`)"""
+    started = {}
+    for name in ("survivor", "victim"):
+        port = free_local_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "distributed.py"),
+             "--listen", f"127.0.0.1:{port}", "--name", name],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        started[name] = (f"127.0.0.1:{port}", process)
+    try:
+        for address, process in started.values():
+            wait_until_listening(int(address.rsplit(":", 1)[1]), process)
+        yield started
+    finally:
+        for _, process in started.values():
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+def test_killed_worker_batches_are_reassigned(workers):
+    closed_port = free_local_port()  # tidak ada yang listen: probe langsung refused
+    accounts = [{"type": "vless", "tag": f"acc-{i}", "uuid": "x",
+                 "server": f"127.0.{i // 250}.{i % 250 + 1}", "server_port": closed_port}
+                for i in range(200)]
+    live_results = [{"index": i, "Status": "WAIT"} for i in range(len(accounts))]
+    victim_address, victim = workers["victim"]
+    coordinator = Coordinator([workers["survivor"][0], victim_address], batch_size=5)
+    seen = []
+
+    def on_result(result):
+        seen.append(result)
+        if result.get("Worker") == "victim" and victim.poll() is None:
+            victim.kill()  # worker mati di tengah run
+
+    results = asyncio.run(asyncio.wait_for(
+        coordinator.run(accounts, live_results, on_result=on_result, verify=False), timeout=60))
+
+    assert victim.poll() is not None
+    assert coordinator.worker_status[victim_address] == "dead"
+    # Tiap akun tepat satu hasil final, sisa batch worker yang mati dikerjakan survivor
+    assert sorted(result["index"] for result in results) == list(range(len(accounts)))
+    assert all(result["Status"] == "Dead" for result in results)
+    assert all(row["Status"] == "Dead" for row in live_results)
+    assert sum(result.get("Worker") == "survivor" for result in seen) > len(accounts) // 2
+
+def test_batches_follow_history_order(monkeypatch):
+    import core
+    from core import account_fingerprint
+    from distributed import ProbeWorker
+
+    accounts = [{"type": "vless", "tag": f"acc-{i}", "uuid": "x", "server": f"10.0.0.{i}",
+                 "server_port": 443} for i in range(6)]
+    good = {"tests": 5, "successes": 5, "last_status": "✅", "last_latency": 50, "last_country": "🇸🇬"}
+    bad = {"tests": 5, "successes": 0, "last_status": "Dead", "last_latency": -1, "last_country": None}
+    history = {account_fingerprint(accounts[4]): good, account_fingerprint(accounts[0]): bad}
+    batches = []
+
+    async def fake_test_all_accounts(batch, semaphore, live_results, on_result=None, history=None,
+                                     **kwargs):
+        batches.append(([account["tag"] for account in batch], history))
+        for i in range(len(batch)):
+            on_result({"index": i, "Status": "Dead"})
+        return []
+
+    monkeypatch.setattr(core, "test_all_accounts", fake_test_all_accounts)
+    port = free_local_port()
+
+    async def main():
+        server = asyncio.ensure_future(ProbeWorker(name="local").serve(f"127.0.0.1:{port}"))
+        await asyncio.sleep(0.2)
+        try:
+            coordinator = Coordinator([f"127.0.0.1:{port}"], batch_size=2)
+            return await coordinator.run(accounts, [{} for _ in accounts], verify=False,
+                                         history=history)
+        finally:
+            server.cancel()
+
+    results = asyncio.run(asyncio.wait_for(main(), timeout=20))
+
+    assert sorted(result["index"] for result in results) == list(range(len(accounts)))
+    # Akun dengan history sukses dikirim di batch pertama, akun yang selalu Dead terakhir
+    assert batches[0][0][0] == "acc-4"
+    assert batches[0][1] == {account_fingerprint(accounts[4]): good}
+    assert batches[-1][0][-1] == "acc-0"
+    assert batches[1][1] is None
+
+@pytest.mark.parametrize("how", ["cancel", "eof"])
+def test_worker_stops_batch_when_coordinator_goes_away(monkeypatch, how):
+    import core
+    from distributed import ProbeWorker, open_address, read_message, send_message
+
+    events = []
+
+    async def fake_test_all_accounts(batch, semaphore, live_results, **kwargs):
+        events.append("started")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+        return []
+
+    monkeypatch.setattr(core, "test_all_accounts", fake_test_all_accounts)
+    port = free_local_port()
+
+    async def main():
+        server = asyncio.ensure_future(ProbeWorker(name="local").serve(f"127.0.0.1:{port}"))
+        await asyncio.sleep(0.2)
+        try:
+            reader, writer = await open_address(f"127.0.0.1:{port}")
+            await read_message(reader)  # hello
+            await send_message(writer, {"type": "batch", "batch_id": 1, "indices": [0],
+                                        "accounts": [{"type": "vless", "server": "10.0.0.1"}]})
+            await asyncio.sleep(0.2)
+            if how == "cancel":
+                await send_message(writer, {"type": "cancel", "batch_id": 1})
+            else:
+                writer.close()
+            for _ in range(50):
+                if "cancelled" in events:
+                    break
+                await asyncio.sleep(0.05)
+            writer.close()
+        finally:
+            server.cancel()
+
+    asyncio.run(main())
+    assert events == ["started", "cancelled"]
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from geoip import GeoBatcher, GeoCache, GeoClient, OfflineGeo, GEO_ERROR_KEY
+
+class FakeIpApi:
+    """Stand-in ip-api lokal: /json/<ip> dan POST /batch, dengan header X-Rl / X-Ttl"""
+
+    def __init__(self):
+        self.requests = []  # (method, jumlah IP)
+        self.status = 200
+        self.remaining = 45
+        self.delay = 0.0
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, method, ips, payload):
+                with fake._lock:
+                    fake.requests.append((method, len(ips)))
+                    status = fake.status
+                if fake.delay:
+                    time.sleep(fake.delay)
+                body = json.dumps(payload if status == 200 else {}).encode()
+                self.send_response(status)
+                self.send_header("X-Rl", str(fake.remaining))
+                self.send_header("X-Ttl", "60")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                ip = self.path.split("/json/")[1].split("?")[0]
+                self._reply("GET", [ip], fake.answer(ip))
+
+            def do_POST(self):
+                ips = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                self._reply("POST", ips, [fake.answer(ip) for ip in ips])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def answer(ip):
+        if ip.startswith("10."):
+            return {"status": "fail", "message": "private range", "query": ip}
+        return {"status": "success", "countryCode": "SG", "country": "Singapore",
+                "org": f"Org {ip}", "query": ip}
+
+    def count(self, method):
+        return [size for kind, size in self.requests if kind == method]
+
+@pytest.fixture
+def fake_api():
+    api = FakeIpApi()
+    yield api
+    api.server.shutdown()
+    api.server.server_close()
+
+@pytest.fixture
+def client(fake_api):
+    return GeoClient(cache=GeoCache(persist=False), offline=OfflineGeo(""),
+                     base_url=fake_api.url, max_wait=2)
+
+def run_lookups(batcher, ips, spacing=0.0):
+    async def one(i, ip):
+        if spacing:
+            await asyncio.sleep(i * spacing)
+        return await batcher.lookup(ip)
+
+    async def main():
+        return await asyncio.gather(*(one(i, ip) for i, ip in enumerate(ips)))
+
+    return asyncio.run(main())
+
+def test_concurrent_lookups_share_one_batch(fake_api, client):
+    batcher = GeoBatcher(client=client, window=0.05)
+    ips = [f"1.1.1.{i}" for i in range(30)] * 2 + ["10.0.0.1"]
+    results = run_lookups(batcher, ips)
+
+    assert fake_api.count("POST") == [31]
+    assert fake_api.count("GET") == []
+    assert results[0] == {"Country": "🇸🇬", "Provider": "Org 1.1.1.0"}
+    # "fail" dari ip-api = negara memang tidak dikenal, bukan kegagalan lookup
+    assert results[-1] == {"Country": "❓", "Provider": "-"}
+
+def test_batches_split_at_100_ips(fake_api, client):
+    batcher = GeoBatcher(client=client, window=0.05)
+    run_lookups(batcher, [f"2.2.{i // 256}.{i % 256}" for i in range(250)])
+    assert sorted(fake_api.count("POST")) == [50, 100, 100]
+
+def test_spread_out_lookups_use_json_endpoint(fake_api, client):
+    batcher = GeoBatcher(client=client, window=0.02)
+    results = run_lookups(batcher, [f"3.3.3.{i}" for i in range(8)], spacing=0.06)
+
+    assert fake_api.count("POST") == []
+    assert len(fake_api.count("GET")) == 8
+    assert all(GEO_ERROR_KEY not in result for result in results)
+
+def test_lookups_collect_while_batch_bucket_is_empty(fake_api, client):
+    client.batch_bucket.tokens = 0.0
+    client.batch_bucket.rate = 2.0  # token /batch berikutnya ~0.5 detik lagi
+    client.json_bucket.tokens = 0.0
+    client.json_bucket.rate = 0.01
+    batcher = GeoBatcher(client=client, window=0.02)
+    results = run_lookups(batcher, [f"4.4.4.{i}" for i in range(10)], spacing=0.03)
+
+    # Semua lookup menunggu token yang sama lalu dikirim sebagai satu batch
+    assert fake_api.count("POST") == [10]
+    assert all(result["Country"] == "🇸🇬" for result in results)
+
+def test_inflight_ip_is_not_requested_again(fake_api, client):
+    fake_api.delay = 0.3
+    batcher = GeoBatcher(client=client, window=0.02)
+
+    async def main():
+        first = asyncio.ensure_future(batcher.lookup("5.5.5.5"))
+        await asyncio.sleep(0.1)  # request pertama sedang jalan
+        second = await batcher.lookup("5.5.5.5")
+        return await first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert len(fake_api.requests) == 1
+
+def test_http_429_is_reported_as_failure_and_not_cached(fake_api, client):
+    fake_api.status = 429
+    fake_api.remaining = 0
+    batcher = GeoBatcher(client=client, window=0.02)
+    results = run_lookups(batcher, [f"6.6.6.{i}" for i in range(5)])
+
+    assert all(result[GEO_ERROR_KEY] == "rate-limited" for result in results)
+    assert all(result["Country"] == "❓" for result in results)
+    assert client.cache.get("6.6.6.0") is None
+    assert client.batch_bucket.snapshot()["blocked"]
+    # Bucket diblokir X-Ttl (60s) > max_wait: lookup berikutnya langsung gagal tanpa request
+    requests_before = len(fake_api.requests)
+    results = run_lookups(batcher, [f"7.7.7.{i}" for i in range(5)])
+    assert all(result[GEO_ERROR_KEY] == "rate-limited" for result in results)
+    assert len(fake_api.requests) == requests_before
+
+def test_sqlite_cache_and_offline_load_stay_off_the_event_loop(fake_api, tmp_path, monkeypatch):
+    threads = {}
+
+    class RecordingCache(GeoCache):
+        def get(self, ip):
+            threads["cache"] = threading.current_thread()
+            return super().get(ip)
+
+    class RecordingOffline(OfflineGeo):
+        def _load(self):
+            threads["offline"] = threading.current_thread()
+            return super()._load()
+
+    dataset = tmp_path / "ranges.csv"
+    dataset.write_text("1.0.0.0,1.0.0.255,AU,13335,Cloudflare\n")
+    monkeypatch.setattr("database.get_cached_geo", lambda ip: None)
+    client = GeoClient(cache=RecordingCache(), offline=RecordingOffline(str(dataset)),
+                       base_url=fake_api.url, max_wait=2)
+    results = run_lookups(GeoBatcher(client=client, window=0.02), ["1.0.0.1", "5.5.5.5"])
+
+    assert results[0] == {"Country": "🇦🇺", "Provider": "Cloudflare"}
+    assert results[1]["Country"] == "🇸🇬"
+    assert threads["offline"] is not threading.main_thread()
+    assert threads["cache"] is not threading.main_thread()
+
+def test_sync_lookups_are_coalesced_and_cached(fake_api, client):
+    fake_api.delay = 0.2
+    threads = [threading.Thread(target=client.lookup, args=("8.8.8.8",)) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake_api.count("GET") == [1]
+    assert client.lookup("8.8.8.8") == {"Country": "🇸🇬", "Provider": "Org 8.8.8.8"}
+    assert fake_api.count("GET") == [1]
+
+def test_raw_lookups_are_coalesced_and_fill_the_cache(fake_api, client):
+    fake_api.delay = 0.2
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(client.lookup_raw("9.9.9.9")))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake_api.count("GET") == [1]
+    assert all(answer["countryCode"] == "SG" and answer["org"] == "Org 9.9.9.9" for answer in answers)
+    # Jawaban mentah dan hasil lookup biasa tidak request ulang
+    assert client.lookup_raw("9.9.9.9")["query"] == "9.9.9.9"
+    assert client.lookup("9.9.9.9") == {"Country": "🇸🇬", "Provider": "Org 9.9.9.9"}
+    assert fake_api.count("GET") == [1]
+
+    fake_api.status = 500
+    assert client.lookup_raw("9.9.9.10") is None
+
+def test_offline_dataset_accepts_integer_ip_ranges(tmp_path):
+    # Layout IP2Location LITE: DB1 (country) dan ASN, start/end sebagai angka
+    country = tmp_path / "IP2LOCATION-LITE-DB1.CSV"
+    country.write_text('"0","16777215","-","-"\n'
+                       '"16777216","16777471","AU","Australia"\n'
+                       '"281470698524672","281470698524927","JP","Japan"\n')
+    asn = tmp_path / "IP2LOCATION-LITE-ASN.CSV"
+    asn.write_text('"16777216","16777471","1.0.0.0/24","13335","CloudFlare Inc."\n')
+    offline = OfflineGeo(f"{country},{asn}")
+
+    assert offline.lookup("1.0.0.1") == {"Country": "🇦🇺", "Provider": "CloudFlare Inc."}
+    # IPv4-mapped IPv6 (::ffff:1.0.16.0) di dataset IPv6 dicari sebagai IPv4
+    assert offline.lookup("1.0.16.5") == {"Country": "🇯🇵", "Provider": "-"}
+    assert offline.lookup("0.0.0.1") is None
+    assert offline.lookup("8.8.8.8") is None
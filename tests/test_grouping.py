@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import core
+from core import NO_TARGET, group_accounts_by_target, iter_test_results
+from tester import BUDGET_STATUS
+
+def vless(server, port=443, **extra):
+    return {"type": "vless", "server": server, "server_port": port, "uuid": "x", **extra}
+
+def fake_dns(table, delay=0.0):
+    async def resolve_host(name):
+        if delay:
+            await asyncio.sleep(delay)
+        return table.get(name)
+    return resolve_host
+
+def test_grouping_resolves_without_connecting(monkeypatch):
+    monkeypatch.setattr(core, "resolve_host", fake_dns({
+        "a.example": "203.0.113.1", "b.example": "203.0.113.1", "c.example": "203.0.113.2",
+    }))
+    accounts = [
+        vless("a.example"),
+        vless("b.example"),  # resolve ke ip:port yang sama dengan akun 0
+        vless("203.0.113.9", host="c.example"),  # host dan server beda IP: race di slot
+        vless("nx.example"),
+    ]
+    groups = asyncio.run(group_accounts_by_target(accounts))
+
+    assert (("203.0.113.1", 443, "server"), [0, 1], True) in groups
+    assert (NO_TARGET, [2], None) in groups
+    assert (NO_TARGET, [3], False) in groups
+
+def test_slow_dns_does_not_use_up_the_deadline(monkeypatch):
+    monkeypatch.setattr(core, "resolve_host", fake_dns({}, delay=30))
+    probed = []
+
+    async def fake_test_account(account, semaphore, index, live_results=None, target=None, **kwargs):
+        probed.append((index, target))
+        return {"index": index, "Status": "Dead"}
+
+    monkeypatch.setattr(core, "test_account", fake_test_account)
+    accounts = [vless(f"slow{i}.example") for i in range(20)]
+
+    async def main():
+        return [result async for result in iter_test_results(
+            accounts, asyncio.Semaphore(5), workers=1, deadline=2, verify=False)]
+
+    started = time.monotonic()
+    results = asyncio.run(main())
+
+    assert time.monotonic() - started < 1.5
+    # DNS yang belum selesai di-resolve test_account sendiri, bukan Timeout-Budget
+    assert sorted(index for index, _ in probed) == list(range(len(accounts)))
+    assert all(target is None for _, target in probed)
+    assert not any(result["Status"] == BUDGET_STATUS for result in results)
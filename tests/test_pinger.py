@@ -0,0 +1,18 @@
+import asyncio
+
+from pinger import get_pinger
+from utils import run_sync
+
+def test_each_event_loop_gets_its_own_pinger():
+    async def current():
+        return get_pinger()
+
+    async def main():
+        mine = get_pinger()
+        # run_sync dari dalam loop jalan di thread + loop lain (seperti get_network_stats)
+        other = await asyncio.get_running_loop().run_in_executor(None, run_sync, current())
+        return mine, other, get_pinger()
+
+    mine, other, again = asyncio.run(main())
+    assert mine is again
+    assert other is not mine
@@ -0,0 +1,53 @@
+import asyncio
+import socket
+
+import pytest
+
+import geoip
+import core
+from utils import free_local_port
+
+FIELDS = ("Status", "Country", "Provider", "Tested IP", "Error")
+
+@pytest.fixture
+def endpoints(tmp_path, monkeypatch):
+    """Listener lokal yang menerima koneksi, port tertutup, dan dataset offline untuk loopback"""
+    dataset = tmp_path / "loopback.csv"
+    dataset.write_text("127.0.0.0/8,SG,64500,Loopback Net\n")
+    # Shard worker (spawn) membaca GEOIP_DB sendiri; proses ini memakai default_offline_geo
+    monkeypatch.setenv("GEOIP_DB", str(dataset))
+    monkeypatch.setattr(geoip.default_offline_geo, "paths", [str(dataset)])
+    monkeypatch.setattr(geoip.default_offline_geo, "_indexes", None)
+    listeners = []
+    for _ in range(3):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(512)  # connect selesai di kernel, tidak perlu accept
+        listeners.append(listener)
+    try:
+        yield [listener.getsockname()[1] for listener in listeners]
+    finally:
+        for listener in listeners:
+            listener.close()
+
+def run(accounts, workers):
+    live_results = [{"index": i, "Status": "WAIT"} for i in range(len(accounts))]
+    results = asyncio.run(asyncio.wait_for(core.test_all_accounts(
+        accounts, asyncio.Semaphore(10), live_results, workers=workers, verify=False), timeout=120))
+    return {result["index"]: tuple(result.get(field) for field in FIELDS) for result in results}
+
+def test_sharded_results_match_single_process(endpoints):
+    accounts = []
+    for i in range(24):
+        # Tiap akun mati punya port sendiri supaya circuit breaker tidak tergantung urutan
+        port = endpoints[i % len(endpoints)] if i % 2 == 0 else free_local_port()
+        accounts.append({"type": "vless", "tag": f"acc-{i}", "uuid": "x",
+                         "server": "127.0.0.1", "server_port": port})
+
+    single = run(accounts, workers=1)
+    sharded = run(accounts, workers=2)
+
+    assert sorted(single) == list(range(len(accounts)))
+    assert sharded == single
+    assert sum(status == "✅" for status, *_ in single.values()) == 12
+    assert all(country == "🇸🇬" for status, country, *_ in single.values() if status == "✅")
@@ -0,0 +1,80 @@
+import asyncio
+
+import core
+from core import ResultStream, iter_test_results
+
+async def slow_source(count, delay=0.01):
+    for i in range(count):
+        await asyncio.sleep(delay)
+        yield {"index": i, "Status": "✅"}
+
+async def collect(iterator, delay=0.0):
+    items = []
+    async for item in iterator:
+        items.append(item)
+        if delay:
+            await asyncio.sleep(delay)
+    return items
+
+def test_cancel_does_not_block_on_abandoned_subscriber():
+    async def main():
+        stream = ResultStream(slow_source(100), queue_size=2)
+        live = asyncio.ensure_future(collect(stream.subscribe()))
+        stream.subscribe()  # subscriber yang tidak pernah membaca: antriannya penuh
+        task = asyncio.ensure_future(stream.run())
+        await asyncio.sleep(0.1)  # producer sekarang tertahan backpressure
+        task.cancel()
+        await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), timeout=1)
+        return task, await asyncio.wait_for(live, timeout=1)
+
+    task, received = asyncio.run(main())
+    assert task.cancelled()
+    assert [item["index"] for item in received] == list(range(len(received)))
+
+def test_full_subscriber_drains_queue_after_close():
+    async def main():
+        stream = ResultStream(slow_source(5, delay=0), queue_size=2)
+        slow = stream.subscribe()
+        task = asyncio.ensure_future(stream.run())
+        received = await asyncio.wait_for(collect(slow, delay=0.01), timeout=1)
+        await task
+        return received
+
+    assert [item["index"] for item in asyncio.run(main())] == list(range(5))
+
+def test_cancelled_run_cancels_inflight_probes(monkeypatch):
+    started = []
+    cancelled = []
+
+    async def fake_group_accounts(accounts, timeout=None):
+        return [((f"10.0.0.{i}", 443, "server"), [i], True) for i in range(len(accounts))]
+
+    async def fake_test_account(account, semaphore, index, live_results=None, target=None, **kwargs):
+        started.append(index)
+        try:
+            await asyncio.sleep(0 if index < 3 else 30)
+        except asyncio.CancelledError:
+            cancelled.append(index)
+            raise
+        return {"index": index, "Status": "Dead"}
+
+    monkeypatch.setattr(core, "group_accounts_by_target", fake_group_accounts)
+    monkeypatch.setattr(core, "test_account", fake_test_account)
+    accounts = [{"server": f"10.0.0.{i}", "server_port": 443} for i in range(10)]
+
+    async def main():
+        stream = ResultStream(iter_test_results(accounts, asyncio.Semaphore(10), workers=1,
+                                                verify=False))
+        finished = asyncio.ensure_future(collect(stream.subscribe()))
+        task = asyncio.ensure_future(stream.run())
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), timeout=2)
+        return stream, await asyncio.wait_for(finished, timeout=1)
+
+    stream, finished = asyncio.run(main())
+    # Hasil yang sudah final tetap diterima subscriber, probe yang masih jalan di-cancel
+    assert sorted(result["index"] for result in finished) == [0, 1, 2]
+    assert stream.finished == {0, 1, 2}
+    assert sorted(cancelled) == [i for i in started if i >= 3]
+    assert cancelled
@@ -0,0 +1,43 @@
+import asyncio
+
+import core
+from core import TOPK_STATUS, TopKTracker, account_fingerprint, iter_test_results
+
+def test_top_k_stops_probing_a_country_once_it_is_full(monkeypatch):
+    countries = {"sg": "🇸🇬", "jp": "🇯🇵"}
+    accounts = [{"type": "vless", "tag": f"{code}-{i}", "uuid": "x", "server": f"10.0.0.{i}",
+                 "server_port": 443}
+                for i, code in enumerate(["sg", "sg", "sg", "sg", "jp", "jp"])]
+    history = {account_fingerprint(account): {
+        "tests": 3, "successes": 3, "last_status": "✅", "last_latency": 50 + i,
+        "last_country": countries[account["tag"][:2]]} for i, account in enumerate(accounts)}
+    probed = []
+
+    async def fake_group_accounts(accounts, timeout=None):
+        return [((account["server"], 443, "server"), [i], True) for i, account in enumerate(accounts)]
+
+    async def fake_test_account(account, semaphore, index, live_results=None, target=None, **kwargs):
+        async with semaphore:
+            await asyncio.sleep(0.05)
+            probed.append(account["tag"])
+            return {"index": index, "Status": "✅", "Country": countries[account["tag"][:2]],
+                    "Latency": 50}
+
+    monkeypatch.setattr(core, "group_accounts_by_target", fake_group_accounts)
+    monkeypatch.setattr(core, "test_account", fake_test_account)
+    tracker = TopKTracker(1, countries=tuple(countries.values()))
+
+    async def main():
+        return [result async for result in iter_test_results(
+            accounts, asyncio.Semaphore(1), workers=1, history=history, top_k=tracker,
+            verify=False)]
+
+    results = asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+    assert sorted(result["index"] for result in results) == list(range(len(accounts)))
+    working = [result for result in results if result["Status"] == "✅"]
+    assert sorted(result["Country"] for result in working) == ["🇯🇵", "🇸🇬"]
+    assert all(result["Status"] == TOPK_STATUS for result in results if result not in working)
+    # Grup negara yang sudah penuh tidak dites sampai selesai
+    assert len(probed) == 2
+    assert tracker.done
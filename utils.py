@@ -1,43 +1,46 @@
 import socket
-import re
 import time
-import subprocess
-import statistics
+import asyncio
+import concurrent.futures
 
-try:
-    import requests
-except ImportError:
-    requests = None
+from pinger import ping_host
+from geoip import default_geo_cache, default_geo_batcher, default_geo_client, default_offline_geo
 
 def get_flag_emoji(country_code: str) -> str:
     if not isinstance(country_code, str) or len(country_code) != 2:
         return '❓'
     return "".join(chr(ord(char.upper()) - ord('A') + 0x1F1E6) for char in country_code)
 
-def get_network_stats(host: str, count: int = 4) -> dict:
-    command = ["ping", "-c", str(count), "-i", "0.2", host]
-    result = {"Latency": -1, "Jitter": -1, "ICMP": "Failed"}
+def run_sync(coro):
+    """
+    Jalankan coroutine dari kode sync. Kalau thread ini sudah punya event loop yang
+    jalan (mis. kode sync yang dipanggil dari test_account), coroutine dijalankan
+    di thread terpisah dengan event loop sendiri.
+    """
     try:
-        output = subprocess.check_output(command, stderr=subprocess.STDOUT, universal_newlines=True, timeout=5)
-        latencies = [float(x) for x in re.findall(r"time=([\d.]+)", output)]
-        if not latencies:
-            return result
-        result["Latency"] = round(statistics.mean(latencies))
-        if len(latencies) > 1:
-            jitters = [abs(latencies[i] - latencies[i-1]) for i in range(1, len(latencies))]
-            result["Jitter"] = round(statistics.mean(jitters))
-        else:
-            result["Jitter"] = 0
-        loss_match = re.search(r"(\d+)% packet loss", output)
-        if loss_match and int(loss_match.group(1)) == 0:
-            result["ICMP"] = "✔"
-        else:
-            received_match = re.search(r"(\d+) packets received", output) or re.search(r"(\d+) received", output)
-            received = int(received_match.group(1)) if received_match else 0
-            result["ICMP"] = f"{received}/{count}"
-    except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-        pass
-    return result
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+def geo_cache_stats() -> dict:
+    """Hit/miss counter geo cache + jumlah batch (untuk log dan progress payload)"""
+    return {**default_geo_cache.stats(), **default_geo_batcher.stats(),
+            **default_geo_client.stats(), "offline_hits": default_offline_geo.hits}
+
+def get_network_stats(host: str, count: int = 4) -> dict:
+    """
+    Sync wrapper untuk pinger.ping_host (ICMP datagram socket, fallback TCP RTT).
+    Dari dalam coroutine pakai `await ping_host(...)` langsung.
+    """
+    return run_sync(ping_host(host, count=count))
+
+def free_local_port() -> int:
+    """Port TCP lokal yang sedang bebas (bind ke port 0, OS yang memilih)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
 
 def is_alive(host, port=443, timeout=3) -> tuple[bool, int]:
     start_time = time.time()
@@ -49,23 +52,21 @@ def is_alive(host, port=443, timeout=3) -> tuple[bool, int]:
         return False, -1
 
 def geoip_lookup(ip: str) -> dict:
-    default_result = {"Country": "❓", "Provider": "-"}
-    if not ip or not isinstance(ip, str): return default_result
-    
-    if not requests:
-        return default_result
-        
-    try:
-        url = f"http://ip-api.com/json/{ip}?fields=status,country,countryCode,isp,org"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("status") == "success":
-                provider = data.get('org') or data.get('isp') or "-"
-                return {
-                    "Country": get_flag_emoji(data.get('countryCode', '')),
-                    "Provider": provider
-                }
-        return default_result
-    except (requests.RequestException, AttributeError):
-        return default_result
\ No newline at end of file
+    """
+    Country (flag emoji) + Provider untuk IP. Dataset offline (GEOIP_DB) dulu, lalu
+    geo cache (memory + tabel geo_cache), terakhir ip-api.com lewat default_geo_client.
+    Kalau lookup gagal (timeout, rate limit) result berisi key "Geo Error" dan tidak di-cache;
+    "❓" tanpa "Geo Error" berarti IP memang tidak dikenal.
+    """
+    return default_geo_client.lookup(ip)
+
+def known_geo(ip: str):
+    """Geo dari dataset offline / geo cache saja (tanpa request ke ip-api), None kalau belum diketahui"""
+    return default_offline_geo.lookup(ip) or default_geo_cache.get(ip)
+
+async def geoip_lookup_async(ip: str) -> dict:
+    """
+    Versi async geoip_lookup untuk coroutine (test_account): lookup yang jalan
+    bersamaan dikirim sebagai satu batch ke ip-api lewat default_geo_batcher.
+    """
+    return await default_geo_batcher.lookup(ip)
\ No newline at end of file